@@ -1,19 +1,30 @@
-from flask import Flask, jsonify
-import yfinance as yf
-import pandas as pd
-from collections import defaultdict
-import requests
-from io import StringIO
+from flask import Flask, g, has_app_context, has_request_context, jsonify, request, url_for
+from werkzeug.exceptions import RequestEntityTooLarge
 from database import DatabaseHandler
-from bs4 import BeautifulSoup
-from datetime import datetime
-from data_helper import *
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.interval import IntervalTrigger
-from datetime import date, timedelta
-import random
+from datetime import datetime, date, timedelta
+import json
 import logging
+import math
+import time
+import uuid
 from functools import wraps
+from cache import TTLCache
+from change_feed import ensure_listening, notify_change, subscribe
+from http_cache import init_http_cache
+from json_provider import FastJSONProvider
+from profiling import init_profiling
+from retry import breaker_states, deadline_scope
+from tracing import current_span, init_tracing, server_timing, span, span_or_trace
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, init_metrics, registry, update_last_rows, update_rows_written, update_runs
+from upstream import UpstreamThrottledError, fetch_ticker_data, ticker_cache, ticker_flight, yahoo_limiter
+from update_jobs import JobWorker, enqueue_job, get_job
+from update_scheduler import advisory_lock, init_scheduler, plan_updates, run_due_updates
+from update_ledger import DEFAULT_BASELINE_WINDOW, DEFAULT_REGRESSION_RATIO, DEFAULT_RUN_LIMIT, MAX_RUN_LIMIT, find_regressions, list_update_runs, phase_durations, record_update_run
+from valuation_store import DEFAULT_PAGE_SIZE, get_valuation, insert_valuations, list_valuations, validate_valuation
+
+# Heavy modules (yfinance, pandas, numpy, the data_helper scraping stack and the
+# valuation engine) are imported inside the routes that need them, so a cold start
+# only pays for what the first request uses. See benchmarks/startup_budget.py.
 
 # Configure logging
 # Note: Vercel has a read-only file system, so we can't write to files
@@ -28,6 +39,103 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
+
+MAX_SIMULATION_PATHS = 1000000
+MAX_FORECAST_YEARS = 100
+MAX_GRID_STEPS = 101
+MAX_BULK_VALUATIONS = 1000
+MAX_BULK_BYTES = 16 * 1024 * 1024  # request body limit of /valuations/bulk, enforced while reading
+# Company inputs of /valuation/monte_carlo that must be finite numbers when given
+MONTE_CARLO_NUMBER_FIELDS = (
+    'revenue',
+    'shares_outstanding',
+    'tax_rate',
+    'terminal_growth',
+    'debt',
+    'cash',
+    'current_margin',
+    'risk_free_rate',
+    'equity_risk_premium'
+)
+# Time budgets (seconds) propagated to every upstream fetch of an update, so retries
+# and backoff stop before run_all_scraping_updates.py (300 s per request) gives up
+UPDATE_DEADLINE = 240
+UPDATE_ALL_DEADLINE = 280
+
+# Sensitivity grids keyed by (valuation id, x axis, y axis); saved valuations do not change
+sensitivity_cache = TTLCache(maxsize=512, ttl=3600)
+
+# Reference rows keyed by (dataset, key). Updates NOTIFY every instance, which drops
+# that dataset's entries, so the TTL can be long while the change feed is listening
+reference_cache = TTLCache(maxsize=1024)
+REFERENCE_TTL = 86400
+REFERENCE_FALLBACK_TTL = 300  # while no change notifications are being received
+REFERENCE_DATASETS = ('input_stats',)
+# Bumped on every change of a dataset, so a read that raced a change is not cached
+reference_versions = {dataset: 0 for dataset in REFERENCE_DATASETS}
+
+def invalidate_dataset(payload):
+    dataset = payload['dataset']
+    reference_versions[dataset] += 1
+    removed = reference_cache.invalidate_where(lambda key: key[0] == dataset)
+    logger.info(f"{dataset} changed (last_update {payload.get('last_update')}), dropped {removed} cached entries")
+
+for dataset in REFERENCE_DATASETS:
+    subscribe(dataset, invalidate_dataset)
+
+# Cache-Control per endpoint, following how often each dataset changes upstream
+QUOTE_CACHE = 'public, max-age=60, s-maxage=300, stale-while-revalidate=600'
+ANNUAL_STATEMENT_CACHE = 'public, max-age=3600, s-maxage=86400, stale-while-revalidate=86400'
+QUARTERLY_STATEMENT_CACHE = 'public, max-age=3600, s-maxage=21600, stale-while-revalidate=86400'
+PRIVATE_REVALIDATE = 'private, no-cache'
+
+def currency_conversion_cache(source_currency, target_currency, start_date, end_date):
+    """Ranges that ended before today no longer change"""
+    if end_date < date.today().isoformat():
+        return 'public, max-age=86400, s-maxage=604800'
+    return 'public, max-age=300, s-maxage=900'
+
+CACHE_POLICIES = {
+    'get_stock_info': QUOTE_CACHE,
+    'get_stock_info_tnx': QUOTE_CACHE,
+    'get_annual_income_statement': ANNUAL_STATEMENT_CACHE,
+    'get_annual_balance_sheet': ANNUAL_STATEMENT_CACHE,
+    'get_annual_cash_flow': ANNUAL_STATEMENT_CACHE,
+    'get_quarterly_income_statement': QUARTERLY_STATEMENT_CACHE,
+    'get_quarterly_balance_sheet': QUARTERLY_STATEMENT_CACHE,
+    'get_quarterly_cash_flow': QUARTERLY_STATEMENT_CACHE,
+    'get_ttm_income_statement': QUARTERLY_STATEMENT_CACHE,
+    'get_cash_flow': QUARTERLY_STATEMENT_CACHE,
+    'get_currency_conversion': currency_conversion_cache,
+    'get_valuation_sensitivity': 'private, max-age=3600',
+    'get_valuation_by_id': PRIVATE_REVALIDATE,
+    'get_user_valuations': PRIVATE_REVALIDATE,
+    'get_symbol_valuations': PRIVATE_REVALIDATE,
+    'get_upstream_stats': 'no-store',
+    'get_metrics': 'no-store',
+    'get_update_runs': 'no-store',
+    'get_update_run_regressions': 'no-store',
+    'get_job_status': 'no-store',
+    'get_update_schedule': 'no-store',
+    'update_country_risk_premium': 'no-store',
+    'update_effective_tax_rate': 'no-store',
+    'update_sales_to_cap_us': 'no-store',
+    'update_beta_us': 'no-store',
+    'update_pe_ratio_us': 'no-store',
+    'update_rev_growth_rate': 'no-store',
+    'update_ebit_growth': 'no-store',
+    'update_default_spread': 'no-store',
+    'update_roic': 'no-store',
+    'update_all': 'no-store',
+    'initialize_last_update': 'no-store'
+}
+# Registered first so request latency includes the http_cache hook
+init_metrics(app)
+init_tracing(app)
+init_http_cache(app, CACHE_POLICIES)
+# ?__profile=1 on any route when ENABLE_PROFILING and PROFILING_TOKEN are set
+init_profiling(app)
 
 # Error handling decorator
 def handle_errors(f):
@@ -35,6 +143,12 @@ def handle_errors(f):
     def decorated_function(*args, **kwargs):
         try:
             return f(*args, **kwargs)
+        except UpstreamThrottledError as e:
+            logger.warning(f"Upstream throttled in {f.__name__}: {str(e)}")
+            response = jsonify({"error": str(e)})
+            if e.retry_after:
+                response.headers['Retry-After'] = str(e.retry_after)
+            return response, 503
         except Exception as e:
             logger.error(f"Error in {f.__name__}: {str(e)}", exc_info=True)
             return jsonify({"error": f"An error occurred: {str(e)}"}), 500
@@ -64,6 +178,150 @@ def validate_currency_code(currency):
         raise ValueError(f"Invalid currency code: {currency}. Expected 3-letter code (e.g., USD)")
     return currency.upper()
 
+def validate_email(email):
+    """Validate email address format"""
+    import re
+    if not email or len(email) > 50 or not re.match(r'^[^@\s]+@[^@\s]+\.[^@\s]+$', email):
+        raise ValueError(f"Invalid email: {email}")
+    return email
+
+def validate_grid_axis(axis):
+    """Validate a sensitivity axis in driver:start:stop:steps format"""
+    parts = (axis or '').split(':')
+    if len(parts) != 4:
+        raise ValueError(f"Invalid grid axis: {axis}. Expected driver:start:stop:steps")
+    driver, start, stop, steps = parts
+    try:
+        start, stop, steps = float(start), float(stop), int(steps)
+        # float() accepts nan and inf, which would build (and cache) a grid of nulls
+        if not (math.isfinite(start) and math.isfinite(stop)):
+            raise ValueError
+    except ValueError:
+        raise ValueError(f"Invalid grid axis: {axis}. start and stop must be numbers and steps an integer")
+    if not 2 <= steps <= MAX_GRID_STEPS:
+        raise ValueError(f"Invalid grid axis: {axis}. steps must be between 2 and {MAX_GRID_STEPS}")
+    return driver, start, stop, steps
+
+def update_run_id():
+    """Groups the sources updated in one batch: the caller's X-Update-Run-Id header or the job's run id, else the trace id"""
+    if has_request_context() and request.headers.get('X-Update-Run-Id'):
+        return request.headers['X-Update-Run-Id'][:64]
+    if has_app_context() and g.get('update_run_id'):
+        return g.update_run_id
+    current = current_span()
+    return current.trace_id if current else None
+
+def record_run_in_ledger(source, run_span, response, status_code):
+    """Store a finished update run in update_run; a ledger failure never fails the update"""
+    payload = response.get_json(silent=True) or {}
+    if status_code == 200:
+        outcome = 'updated' if 'inserted' in payload.get('status', '') else 'unchanged'
+    else:
+        outcome = 'failed'
+
+    db_handler = None
+    try:
+        db_handler = DatabaseHandler()
+        db_handler.connect()
+        if db_handler.conn is None:
+            return
+        record_update_run(
+            db_handler,
+            update_run_id() or run_span.trace_id,
+            source,
+            run_span,
+            outcome,
+            status_code=status_code,
+            error=payload.get('error')
+        )
+    except Exception as e:
+        logger.warning(f"Could not record update run for {source}: {str(e)}")
+    finally:
+        if db_handler:
+            db_handler.close()
+
+def wants_sync():
+    return request.args.get('sync', '').lower() in ('1', 'true', 'yes')
+
+def enqueue_update(sources):
+    """Queue a background job updating sources and answer 202 with its id and status URL"""
+    db_handler = DatabaseHandler()
+    db_handler.connect()
+    if db_handler.conn is None:
+        return jsonify({"error": "Job queue unavailable, retry with ?sync=1"}), 503
+    try:
+        run_id = update_run_id() or uuid.uuid4().hex
+        job_id = enqueue_job(db_handler, sources, run_id)
+    finally:
+        db_handler.close()
+    if job_id is None:
+        return jsonify({"error": "Could not queue the update, retry with ?sync=1"}), 503
+
+    job_worker.wake()
+    status_url = url_for('get_job_status', job_id=job_id)
+    response = jsonify({
+        'job_id': job_id,
+        'run_id': run_id,
+        'status': 'queued',
+        'sources': sources,
+        'status_url': status_url
+    })
+    response.headers['Location'] = status_url
+    return response, 202
+
+def queued_update(source=None):
+    """
+    Requests to the decorated update route queue a background job for source (all
+    of UPDATE_SOURCES when None) and return its id instead of scraping in the
+    request; ?sync=1 keeps the old inline behaviour. Direct calls, from update_all
+    or the job worker, always run inline.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if has_request_context() and request.endpoint == f.__name__ and not wants_sync():
+                return enqueue_update([source] if source else list(UPDATE_SOURCES))
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+def source_result(response):
+    """Summary of an update view's response: status_code, success and status (plus error on failure)"""
+    if isinstance(response, tuple):
+        result_data, status_code = response
+    else:
+        result_data, status_code = response, 200
+    payload = result_data.get_json(silent=True) or {}
+    result = {
+        'status_code': status_code,
+        'success': status_code == 200,
+        'status': payload.get('status', 'Unknown')
+    }
+    if payload.get('error'):
+        result['error'] = payload['error']
+    return result
+
+def run_update_source(source, run_id=None):
+    """
+    Update one source outside a request, as the job worker does, and summarize the result
+
+    The run is traced (as a child span when a trace is already active), and the
+    summary carries its trace_id, duration_ms, per-phase timings and a
+    Server-Timing value, so /jobs/<id> reports where the job's time went rather
+    than the enqueue's.
+    """
+    with app.app_context(), span_or_trace('job', source=source) as job_span:
+        g.update_run_id = run_id
+        result = source_result(UPDATE_SOURCES[source]())
+    run_span = next((child for child in job_span.children if child.name == source), job_span)
+    result.update(
+        trace_id=job_span.trace_id,
+        duration_ms=round(job_span.duration * 1000, 3),
+        phases=phase_durations(run_span),
+        server_timing=server_timing(job_span)
+    )
+    return result
+
 # Reusable database update function
 def update_database_table(
     table_name,
@@ -75,6 +333,46 @@ def update_database_table(
     insert_query,
     use_time_delta=False,
     delta_days=30
+):
+    """
+    Update a table from its scraped source and record the run, with per-phase
+    timings, bytes downloaded and rows written, in the update_run ledger
+
+    Fetches share an UPDATE_DEADLINE budget, shortened by any enclosing deadline
+    (e.g. update_all's). A Postgres advisory lock per source keeps instances,
+    job workers and the scheduler from updating the same source at once; a
+    concurrent call gets 409. Takes the same arguments as apply_table_update.
+    """
+    with advisory_lock(f"update:{data_name}") as acquired:
+        if not acquired:
+            logger.info(f"Skipping {data_name}: an update is already running")
+            return jsonify({"error": f"An update of {data_name} is already running"}), 409
+
+        with span_or_trace(data_name) as run_span, deadline_scope(UPDATE_DEADLINE):
+            response, status_code = apply_table_update(
+                table_name,
+                data_name,
+                clean_function,
+                last_update_function,
+                last_update_url,
+                last_update_text,
+                insert_query,
+                use_time_delta,
+                delta_days
+            )
+        record_run_in_ledger(data_name, run_span, response, status_code)
+    return response, status_code
+
+def apply_table_update(
+    table_name,
+    data_name,
+    clean_function,
+    last_update_function,
+    last_update_url,
+    last_update_text,
+    insert_query,
+    use_time_delta=False,
+    delta_days=30
 ):
     """
     Generic function to update database tables with scraped data
@@ -93,49 +391,60 @@ def update_database_table(
     logger.info(f"Starting update for {table_name}")
 
     # Clean and fetch data
-    result = clean_function()
+    with span('clean', function=getattr(clean_function, '__name__', 'clean')) as clean_span:
+        result = clean_function()
 
     # Handle functions that return multiple data sets (like default_spread)
     if isinstance(result, tuple) and len(result) == 3:
         data_tuple_1, data_tuple_2, error = result
         if error:
             logger.error(f"Error cleaning data for {table_name}: {error}")
+            update_runs.inc(table=table_name, outcome='clean_error')
             return jsonify({"error": error}), 400
         # Process the data (first 4 elements only for default_spread)
         data_tuple_1 = [(row[0], row[1], row[2], row[3]) for row in data_tuple_1]
         data_tuple_2 = [(row[0], row[1], row[2], row[3]) for row in data_tuple_2]
+        clean_span.set(rows=len(data_tuple_1) + len(data_tuple_2))
     else:
         data_tuples, error = result
         if error:
             logger.error(f"Error cleaning data for {table_name}: {error}")
+            update_runs.inc(table=table_name, outcome='clean_error')
             return jsonify({"error": error}), 400
+        clean_span.set(rows=len(data_tuples))
 
     # Get last update date
     if use_time_delta:
         last_update = date.today()
     else:
         try:
-            last_update = last_update_function(last_update_url, last_update_text)
+            with span('last_update'):
+                last_update = last_update_function(last_update_url, last_update_text)
             if not last_update:
                 logger.warning(f"Could not get last update for {table_name}")
+                update_runs.inc(table=table_name, outcome='last_update_error')
                 return jsonify({"error": "Could not retrieve last update date"}), 400
         except Exception as e:
             logger.error(f"Error getting last update for {table_name}: {str(e)}")
+            update_runs.inc(table=table_name, outcome='last_update_error')
             return jsonify({"error": f"Error getting last update: {str(e)}"}), 500
 
     # Database operations
     db_handler = None
     try:
-        db_handler = DatabaseHandler()
-        db_handler.connect()
+        with span('db_connect'):
+            db_handler = DatabaseHandler()
+            db_handler.connect()
 
         # Get database last update
-        db_last_update = db_handler.fetch_query(
-            f"SELECT last_update FROM data_last_update WHERE data_name = '{data_name}'"
-        )
+        with span('db_last_update'):
+            db_last_update = db_handler.fetch_query(
+                f"SELECT last_update FROM data_last_update WHERE data_name = '{data_name}'"
+            )
 
         if not db_last_update:
             logger.error(f"Error getting last_update from table data_last_update for {data_name}")
+            update_runs.inc(table=table_name, outcome='db_error')
             return jsonify({"status": f"Error getting last_update from table data_last_update"}), 500
 
         db_last_update = db_last_update[0][0]
@@ -150,22 +459,29 @@ def update_database_table(
         if should_update:
             logger.info(f"Updating {table_name} - new data available")
 
-            # Handle single or multiple tables
+            # Truncate, insert and mark_updated form one transaction; any failure raises and
+            # rolls it back below, so subscribers are only notified of committed data
             if isinstance(result, tuple) and len(result) == 3:
                 # Multiple tables (like default_spread)
                 truncate_query_1 = f"TRUNCATE TABLE {table_name}_large_firm"
                 truncate_query_2 = f"TRUNCATE TABLE {table_name}_small_firm"
-                db_handler.execute_query(truncate_query_1)
-                db_handler.execute_query(truncate_query_2)
+                with span('truncate'):
+                    db_handler.cur.execute(truncate_query_1)
+                    db_handler.cur.execute(truncate_query_2)
 
                 # Insert data
-                db_handler.execute_query_many(insert_query[0], data_tuple_1)
-                db_handler.execute_query_many(insert_query[1], data_tuple_2)
+                rows_written = len(data_tuple_1) + len(data_tuple_2)
+                with span('insert', rows=rows_written):
+                    db_handler.cur.executemany(insert_query[0], data_tuple_1)
+                    db_handler.cur.executemany(insert_query[1], data_tuple_2)
             else:
                 # Single table
                 truncate_query = f"TRUNCATE TABLE {table_name}"
-                db_handler.execute_query(truncate_query)
-                db_handler.execute_query_many(insert_query, data_tuples)
+                with span('truncate'):
+                    db_handler.cur.execute(truncate_query)
+                rows_written = len(data_tuples)
+                with span('insert', rows=rows_written):
+                    db_handler.cur.executemany(insert_query, data_tuples)
 
             # Update last_update timestamp
             update_query = f"""
@@ -173,16 +489,25 @@ def update_database_table(
                 SET last_update = '{last_update}'
                 WHERE data_name = '{data_name}'
             """
-            db_handler.execute_query(update_query)
+            with span('mark_updated'):
+                db_handler.cur.execute(update_query)
+                db_handler.commit()
+            with span('notify'):
+                notify_change(db_handler, data_name, last_update)
 
             logger.info(f"Successfully updated {table_name}")
+            update_rows_written.inc(rows_written, table=table_name)
+            update_last_rows.set(rows_written, table=table_name)
+            update_runs.inc(table=table_name, outcome='updated')
             return jsonify({"status": "Data inserted successfully"}), 200
         else:
             logger.info(f"No update needed for {table_name} - data is current")
+            update_runs.inc(table=table_name, outcome='unchanged')
             return jsonify({"status": "Data is the same"}), 200
 
     except Exception as e:
         logger.error(f"Database error for {table_name}: {str(e)}", exc_info=True)
+        update_runs.inc(table=table_name, outcome='db_error')
         if db_handler:
             db_handler.rollback()
         return jsonify({"error": f"Database error: {str(e)}"}), 500
@@ -191,36 +516,64 @@ def update_database_table(
             db_handler.close()
             logger.debug(f"Database connection closed for {table_name}")
 
+def scraping():
+    """The data_helper scraping stack (requests, BeautifulSoup, pandas.read_html), imported on first use"""
+    import data_helper
+    return data_helper
+
 def restructure_data(df):
-    restructured_data = []
-    
-    for column in df.columns:
-        date_str = column.strftime('%Y-%m-%d')
-        period_data = {"date": date_str, "values": {}}
-        for index, value in df[column].items():
-            if pd.notna(value):  # Only include non-NaN values
-                period_data["values"][index] = float(value)
-        restructured_data.append(period_data)
-    
+    import numpy as np
+    import pandas as pd
+
+    # Work on the raw arrays; NumPy values are serialized by the JSON provider
+    index = np.array(df.index, dtype=object)
+    values = df.to_numpy()
+    present = pd.notna(values).T  # Only include non-NaN values
+
+    restructured_data = [
+        {"date": column.strftime('%Y-%m-%d'), "values": dict(zip(index[mask], column_values[mask]))}
+        for column, column_values, mask in zip(df.columns, values.T, present)
+    ]
+
     # Sort the array by date, most recent first
     restructured_data.sort(key=lambda x: x["date"], reverse=True)
-    
+
     return restructured_data
 
+def restructure_history(historical_data):
+    """Daily history rows in the restructure_data format, most recent first"""
+    import numpy as np
+
+    historical_data = historical_data.sort_index(ascending=False)
+    dates = historical_data.index.strftime('%Y-%m-%d')
+    columns = np.array(historical_data.columns, dtype=object)
+    values = historical_data.to_numpy(dtype=float)
+    present = ~np.isnan(values)  # Only include non-NaN values
+
+    return [
+        {"date": date_str, "values": dict(zip(columns[mask], row[mask]))}
+        for date_str, row, mask in zip(dates, values, present)
+    ]
+
+def frame_to_columns_dict(df):
+    """Same shape as DataFrame.to_json(): {epoch ms of column: {index: value or null}}"""
+    return {
+        str(column.value // 10**6): dict(zip(df.index, df[column].to_numpy()))
+        for column in df.columns
+    }
+
 @app.route('/stock_info/<ticker_symbol>')
 @handle_errors
 def get_stock_info(ticker_symbol):
     ticker_symbol = validate_ticker_symbol(ticker_symbol)
     logger.info(f"Fetching stock info for {ticker_symbol}")
-    ticker = yf.Ticker(ticker_symbol)
-    return jsonify(ticker.info)
+    return jsonify(fetch_ticker_data(ticker_symbol, 'info'))
 
 @app.route('/stock_info/tnx')
 @handle_errors
 def get_stock_info_tnx():
     logger.info("Fetching stock info for ^TNX")
-    ticker = yf.Ticker("^TNX")
-    return jsonify(ticker.info)
+    return jsonify(fetch_ticker_data("^TNX", 'info'))
 
 # deprecated
 # @app.route('/calender/<ticker_symbol>')
@@ -232,8 +585,7 @@ def get_stock_info_tnx():
 @handle_errors
 def get_annual_income_statement(ticker_symbol):
     ticker_symbol = validate_ticker_symbol(ticker_symbol)
-    ticker = yf.Ticker(ticker_symbol)
-    income_statement = ticker.income_stmt
+    income_statement = fetch_ticker_data(ticker_symbol, 'income_stmt')
     restructured_data = restructure_data(income_statement)
     return jsonify(restructured_data)
 
@@ -241,8 +593,7 @@ def get_annual_income_statement(ticker_symbol):
 @handle_errors
 def get_annual_balance_sheet(ticker_symbol):
     ticker_symbol = validate_ticker_symbol(ticker_symbol)
-    ticker = yf.Ticker(ticker_symbol)
-    balance_sheet = ticker.balance_sheet
+    balance_sheet = fetch_ticker_data(ticker_symbol, 'balance_sheet')
     restructured_data = restructure_data(balance_sheet)
     return jsonify(restructured_data)
 
@@ -250,8 +601,7 @@ def get_annual_balance_sheet(ticker_symbol):
 @handle_errors
 def get_annual_cash_flow(ticker_symbol):
     ticker_symbol = validate_ticker_symbol(ticker_symbol)
-    ticker = yf.Ticker(ticker_symbol)
-    cash_flow = ticker.cash_flow
+    cash_flow = fetch_ticker_data(ticker_symbol, 'cash_flow')
     restructured_data = restructure_data(cash_flow)
     return jsonify(restructured_data)
 
@@ -259,8 +609,7 @@ def get_annual_cash_flow(ticker_symbol):
 @handle_errors
 def get_quarterly_income_statement(ticker_symbol):
     ticker_symbol = validate_ticker_symbol(ticker_symbol)
-    ticker = yf.Ticker(ticker_symbol)
-    income_statement = ticker.quarterly_income_stmt
+    income_statement = fetch_ticker_data(ticker_symbol, 'quarterly_income_stmt')
     restructured_data = restructure_data(income_statement)
     return jsonify(restructured_data)
 
@@ -268,8 +617,7 @@ def get_quarterly_income_statement(ticker_symbol):
 @handle_errors
 def get_quarterly_balance_sheet(ticker_symbol):
     ticker_symbol = validate_ticker_symbol(ticker_symbol)
-    ticker = yf.Ticker(ticker_symbol)
-    balance_sheet = ticker.quarterly_balance_sheet
+    balance_sheet = fetch_ticker_data(ticker_symbol, 'quarterly_balance_sheet')
     restructured_data = restructure_data(balance_sheet)
     return jsonify(restructured_data)
 
@@ -277,8 +625,7 @@ def get_quarterly_balance_sheet(ticker_symbol):
 @handle_errors
 def get_quarterly_cash_flow(ticker_symbol):
     ticker_symbol = validate_ticker_symbol(ticker_symbol)
-    ticker = yf.Ticker(ticker_symbol)
-    cash_flow = ticker.quarterly_cash_flow
+    cash_flow = fetch_ticker_data(ticker_symbol, 'quarterly_cash_flow')
     restructured_data = restructure_data(cash_flow)
     return jsonify(restructured_data)
 
@@ -288,19 +635,15 @@ def get_quarterly_cash_flow(ticker_symbol):
 @handle_errors
 def get_ttm_income_statement(ticker_symbol):
     ticker_symbol = validate_ticker_symbol(ticker_symbol)
-    ticker = yf.Ticker(ticker_symbol)
-    income_statement = ticker.ttm_income_stmt
-    print(income_statement)
-    return income_statement.to_json()  
+    income_statement = fetch_ticker_data(ticker_symbol, 'ttm_income_stmt')
+    return jsonify(frame_to_columns_dict(income_statement))
 
 @app.route('/ttm_cash_flow/<ticker_symbol>')
 @handle_errors
 def get_cash_flow(ticker_symbol):
     ticker_symbol = validate_ticker_symbol(ticker_symbol)
-    ticker = yf.Ticker(ticker_symbol)
-    cash_flow = ticker.ttm_cashflow
-    print(cash_flow)
-    return cash_flow.to_json()  
+    cash_flow = fetch_ticker_data(ticker_symbol, 'ttm_cashflow')
+    return jsonify(frame_to_columns_dict(cash_flow))
 
 @app.route('/currency_conversion/<source_currency>/<target_currency>/<start_date>/<end_date>')
 @handle_errors
@@ -316,46 +659,395 @@ def get_currency_conversion(source_currency, target_currency, start_date, end_da
     logger.info(f"Fetching currency conversion for {currency_pair} from {start_date} to {end_date}")
 
     try:
-        # Get ticker for the currency pair
-        ticker = yf.Ticker(currency_pair)
-        
-        # Fetch historical data
-        historical_data = ticker.history(start=start_date, end=end_date)
+        # Fetch historical data for the currency pair
+        historical_data = fetch_ticker_data(currency_pair, 'history', start=start_date, end=end_date)
         
         if historical_data.empty:
             return jsonify({"error": "No data found for this currency pair or date range"}), 404
         
         # Process the data into the same format as other endpoints
-        restructured_data = []
-        
-        for date, row in historical_data.iterrows():
-            date_str = date.strftime('%Y-%m-%d')
-            
-            # Create an object with date and values
-            period_data = {"date": date_str, "values": {}}
-            
-            # Add non-NaN values to the values object
-            for column, value in row.items():
-                if pd.notna(value):  # Only include non-NaN values
-                    period_data["values"][column] = float(value)
-            
-            restructured_data.append(period_data)
-        
-        # Sort the array by date, most recent first
-        restructured_data.sort(key=lambda x: x["date"], reverse=True)
-        
-        return jsonify(restructured_data)
+        return jsonify(restructure_history(historical_data))
+    except UpstreamThrottledError:
+        raise
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def get_input_stats(industry):
+    """Fetch the input_stats row for an industry as a dict, None if the industry is unknown"""
+    cache_key = ('input_stats', industry)
+    ttl = REFERENCE_TTL if ensure_listening() else REFERENCE_FALLBACK_TTL
+    cached = reference_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    version = reference_versions['input_stats']
+
+    db_handler = DatabaseHandler()
+    db_handler.connect()
+    try:
+        rows = db_handler.fetch_query("SELECT * FROM input_stats WHERE industry = %s", (industry,))
+        if not rows:
+            return None
+        columns = [column[0] for column in db_handler.cur.description]
+        stats = dict(zip(columns, rows[0]))
+    finally:
+        db_handler.close()
+    if reference_versions['input_stats'] == version:
+        reference_cache.set(cache_key, stats, ttl=ttl)
+    return stats
+
+@app.route('/valuation/monte_carlo', methods=['POST'])
+@handle_errors
+def run_monte_carlo_valuation():
+    """
+    Monte Carlo DCF using the industry quartiles in input_stats
+
+    Expects a JSON body with industry, revenue and shares_outstanding, plus optional
+    tax_rate, terminal_growth, debt, cash, current_margin, years, high_growth_years,
+    risk_free_rate and equity_risk_premium (rates as decimals), and simulation settings
+    paths, distribution ('triangular' or 'split_normal'), correlation, chunk_size and seed.
+    Malformed fields are answered with 400 before any simulation runs.
+    """
+    payload = request.get_json(silent=True) or {}
+    industry = payload.get('industry')
+    if not industry:
+        return jsonify({"error": "industry is required"}), 400
+    for field in ('revenue', 'shares_outstanding'):
+        if payload.get(field) is None:
+            return jsonify({"error": f"{field} is required"}), 400
+    for field in MONTE_CARLO_NUMBER_FIELDS:
+        value = payload.get(field)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value)):
+            return jsonify({"error": f"{field} must be a finite number"}), 400
+    if payload['shares_outstanding'] <= 0:
+        return jsonify({"error": "shares_outstanding must be greater than 0"}), 400
+    for field in ('years', 'high_growth_years'):
+        value = payload.get(field)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, int) or not 0 <= value <= MAX_FORECAST_YEARS):
+            return jsonify({"error": f"{field} must be an integer between 0 and {MAX_FORECAST_YEARS}"}), 400
+
+    try:
+        paths = int(payload.get('paths', 100000))
+        chunk_size = int(payload['chunk_size']) if payload.get('chunk_size') is not None else None
+    except (TypeError, ValueError):
+        return jsonify({"error": "paths and chunk_size must be integers"}), 400
+    if not 1 <= paths <= MAX_SIMULATION_PATHS:
+        return jsonify({"error": f"paths must be between 1 and {MAX_SIMULATION_PATHS}"}), 400
+    seed = payload.get('seed')
+    if seed is not None and (isinstance(seed, bool) or not isinstance(seed, int) or seed < 0):
+        return jsonify({"error": "seed must be a non-negative integer"}), 400
+    if payload.get('correlation') is not None and not isinstance(payload['correlation'], dict):
+        return jsonify({"error": "correlation must be an object mapping 'driver_a:driver_b' to a coefficient"}), 400
+
+    stats = get_input_stats(industry)
+    if stats is None:
+        return jsonify({"error": f"No input_stats found for industry: {industry}"}), 404
+
+    from valuation_engine import DEFAULT_CHUNK_SIZE, quartiles_from_input_stats, simulate_share_prices
+
+    logger.info(f"Running {paths} Monte Carlo paths for {industry}")
+    started = time.perf_counter()
+    try:
+        result = simulate_share_prices(
+            quartiles=quartiles_from_input_stats(stats),
+            company=payload,
+            paths=paths,
+            distribution=payload.get('distribution', 'triangular'),
+            correlation=payload.get('correlation'),
+            chunk_size=DEFAULT_CHUNK_SIZE if chunk_size is None else chunk_size,
+            seed=seed
+        )
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    result['industry'] = industry
+    result['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    return jsonify(result)
+
+@app.route('/valuation/<int:valuation_id>/sensitivity')
+@handle_errors
+def get_valuation_sensitivity(valuation_id):
+    """
+    Implied share price grid for a saved valuation
+
+    Query parameters x and y are axes in driver:start:stop:steps format, for example
+    ?x=revenue_growth:0.02:0.12:6&y=cost_of_capital:0.07:0.11:5
+    """
+    try:
+        x_axis = validate_grid_axis(request.args.get('x'))
+        y_axis = validate_grid_axis(request.args.get('y'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    cache_key = (valuation_id, x_axis, y_axis)
+    cached = sensitivity_cache.get(cache_key)
+    if cached is not None:
+        return jsonify(cached)
+
+    db_handler = DatabaseHandler()
+    db_handler.connect()
+    try:
+        rows = db_handler.fetch_query("SELECT inputs FROM valuation WHERE id = %s", (valuation_id,))
+    finally:
+        db_handler.close()
+    if not rows:
+        return jsonify({"error": f"Valuation {valuation_id} not found"}), 404
+
+    import numpy as np
+    from valuation_engine import base_inputs_from_valuation, sensitivity_grid
+
+    x_values = np.linspace(x_axis[1], x_axis[2], x_axis[3])
+    y_values = np.linspace(y_axis[1], y_axis[2], y_axis[3])
+    try:
+        prices = sensitivity_grid(base_inputs_from_valuation(rows[0][0]), x_axis[0], x_values, y_axis[0], y_values)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    grid = {
+        'valuation_id': valuation_id,
+        'x': {'driver': x_axis[0], 'values': x_values.tolist()},
+        'y': {'driver': y_axis[0], 'values': y_values.tolist()},
+        'implied_share_price': np.round(prices, 4).tolist()
+    }
+    sensitivity_cache.set(cache_key, grid)
+    return jsonify(grid)
+
+@app.route('/valuation', methods=['POST'])
+@handle_errors
+def create_valuation():
+    """Save a valuation document; large documents are deduplicated into valuation_blob"""
+    try:
+        document = validate_valuation(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    db_handler = DatabaseHandler()
+    db_handler.connect()
+    try:
+        valuation_id = insert_valuations(db_handler, [document])[0]
+        db_handler.commit()
+    except Exception:
+        db_handler.rollback()
+        raise
+    finally:
+        db_handler.close()
+    logger.info(f"Saved valuation {valuation_id} for {document['symbol']}")
+    return jsonify({"id": valuation_id}), 201
+
+def read_bulk_documents(max_items=MAX_BULK_VALUATIONS, max_bytes=MAX_BULK_BYTES):
+    """
+    Parse a bulk request body as a JSON array or as NDJSON (one document per line)
+
+    NDJSON is parsed line by line as it is read, and reading stops as soon as the
+    body passes max_bytes or max_items, so an oversized upload is never buffered.
+
+    Returns:
+        List of (document, error) tuples in request order
+
+    Raises:
+        RequestEntityTooLarge: The body has more than max_bytes or max_items
+    """
+    if request.content_length is not None and request.content_length > max_bytes:
+        raise RequestEntityTooLarge(f"Request body is larger than {max_bytes} bytes")
+
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        items = []
+        read = 0
+        while True:
+            # One byte over the remaining budget is enough to know the body is too large
+            line = request.stream.readline(max_bytes - read + 1)
+            if not line:
+                return items
+            read += len(line)
+            if read > max_bytes:
+                raise RequestEntityTooLarge(f"Request body is larger than {max_bytes} bytes")
+            line = line.strip()
+            if not line:
+                continue
+            if len(items) == max_items:
+                raise RequestEntityTooLarge(f"At most {max_items} valuations per request")
+            try:
+                items.append((json.loads(line), None))
+            except ValueError as e:
+                items.append((None, f"Invalid JSON: {str(e)}"))
+
+    body = request.stream.read(max_bytes + 1)
+    if len(body) > max_bytes:
+        raise RequestEntityTooLarge(f"Request body is larger than {max_bytes} bytes")
+    try:
+        payload = json.loads(body) if request.is_json else None
+    except ValueError:
+        payload = None
+    if not isinstance(payload, list):
+        raise ValueError("Expected a JSON array of valuations or an application/x-ndjson body")
+    if len(payload) > max_items:
+        raise RequestEntityTooLarge(f"At most {max_items} valuations per request")
+    return [(document, None) for document in payload]
+
+@app.route('/valuations/bulk', methods=['POST'])
+@handle_errors
+def create_valuations_bulk():
+    """
+    Save many valuations in one transaction
+
+    Invalid documents are reported and skipped; the valid ones are written with
+    multi-row inserts and committed together. Returns one result per document.
+    """
+    try:
+        items = read_bulk_documents()
+    except RequestEntityTooLarge as e:
+        return jsonify({"error": e.description}), 413
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    results = []
+    valid = []
+    for index, (document, error) in enumerate(items):
+        if error is None:
+            try:
+                valid.append((index, validate_valuation(document)))
+                results.append(None)
+                continue
+            except ValueError as e:
+                error = str(e)
+        results.append({'index': index, 'status': 'invalid', 'error': error})
+
+    if valid:
+        db_handler = DatabaseHandler()
+        db_handler.connect()
+        try:
+            ids = insert_valuations(db_handler, [document for _, document in valid])
+            db_handler.commit()
+        except Exception as e:
+            logger.error(f"Bulk valuation insert failed: {str(e)}", exc_info=True)
+            db_handler.rollback()
+            for index, _ in valid:
+                results[index] = {'index': index, 'status': 'failed', 'error': f"Database error: {str(e)}"}
+            return jsonify({'created': 0, 'invalid': len(items) - len(valid), 'results': results}), 500
+        finally:
+            db_handler.close()
+        for (index, _), valuation_id in zip(valid, ids):
+            results[index] = {'index': index, 'status': 'created', 'id': valuation_id}
+
+    logger.info(f"Bulk saved {len(valid)} of {len(items)} valuations")
+    summary = {'created': len(valid), 'invalid': len(items) - len(valid), 'results': results}
+    return jsonify(summary), 201 if len(valid) == len(items) else 207  # 207 = Multi-Status
+
+@app.route('/valuation/<int:valuation_id>')
+@handle_errors
+def get_valuation_by_id(valuation_id):
+    db_handler = DatabaseHandler()
+    db_handler.connect()
+    try:
+        valuation = get_valuation(db_handler, valuation_id)
+    finally:
+        db_handler.close()
+    if valuation is None:
+        return jsonify({"error": f"Valuation {valuation_id} not found"}), 404
+    return jsonify(valuation)
+
+def list_valuations_response(filter_column, value):
+    """Shared handler for the valuation listing routes"""
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    full = request.args.get('full', '').lower() in ('1', 'true')
+
+    db_handler = DatabaseHandler()
+    db_handler.connect()
+    try:
+        page = list_valuations(
+            db_handler,
+            filter_column,
+            value,
+            limit=limit,
+            cursor=request.args.get('cursor'),
+            full=full
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    finally:
+        db_handler.close()
+    return jsonify(page)
+
+@app.route('/valuations/user/<email>')
+@handle_errors
+def get_user_valuations(email):
+    """List a user's valuations, newest first. Supports ?limit=, ?cursor= and ?full=1"""
+    try:
+        email = validate_email(email)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return list_valuations_response('email', email)
+
+@app.route('/valuations/symbol/<ticker_symbol>')
+@handle_errors
+def get_symbol_valuations(ticker_symbol):
+    """List a ticker's valuations, newest first. Supports ?limit=, ?cursor= and ?full=1"""
+    ticker_symbol = validate_ticker_symbol(ticker_symbol)
+    return list_valuations_response('symbol', ticker_symbol)
+
+@app.route('/stats/upstream')
+def get_upstream_stats():
+    """Yahoo fetches executed and coalesced, cache use, and rate limiter queue depth and wait times"""
+    return jsonify({
+        'yfinance': ticker_flight.stats(),
+        'cache': ticker_cache.stats(),
+        'limiter': yahoo_limiter.stats()
+    })
+
+# Counters kept by the caches, single-flight layer and rate limiter, read at scrape time
+registry.callback(
+    'cache_requests_total', 'Cache lookups by cache and result', 'counter', ('cache', 'result'),
+    lambda: [({'cache': 'yfinance', 'result': result}, ticker_cache.stats()[result]) for result in ('fresh', 'stale', 'negative', 'miss')]
+    + [({'cache': 'sensitivity', 'result': result}, sensitivity_cache.stats()[result]) for result in ('hit', 'miss')]
+    + [({'cache': 'reference', 'result': result}, reference_cache.stats()[result]) for result in ('hit', 'miss')]
+)
+registry.callback(
+    'cache_entries', 'Entries currently held by each cache', 'gauge', ('cache',),
+    lambda: [
+        ({'cache': 'yfinance'}, ticker_cache.stats()['size']),
+        ({'cache': 'sensitivity'}, len(sensitivity_cache)),
+        ({'cache': 'reference'}, len(reference_cache))
+    ]
+)
+registry.callback(
+    'yfinance_background_refreshes_total', 'Stale-while-revalidate refreshes by outcome', 'counter', ('outcome',),
+    lambda: [({'outcome': 'ok'}, ticker_cache.stats()['refreshed']), ({'outcome': 'error'}, ticker_cache.stats()['refresh_errors'])]
+)
+registry.callback(
+    'yfinance_fetches_total', 'yfinance fetches executed, or coalesced onto an in-flight fetch', 'counter', ('result',),
+    lambda: [({'result': result}, ticker_flight.stats()[result]) for result in ('executed', 'coalesced')]
+)
+registry.callback(
+    'yahoo_rate_limiter', 'Yahoo rate limiter state: rate per second, queue depth and wait seconds', 'gauge', ('field',),
+    lambda: [
+        ({'field': field}, value) for field, value in yahoo_limiter.stats().items()
+        if field in ('rate_per_second', 'tokens', 'queue_depth', 'queued_interactive', 'avg_wait_seconds', 'max_wait_seconds')
+    ]
+)
+registry.callback(
+    'yahoo_rate_limiter_events_total', 'Yahoo rate limiter grants, queue timeouts and throttle responses', 'counter', ('event',),
+    lambda: [({'event': event}, yahoo_limiter.stats()[event]) for event in ('granted', 'timeouts', 'throttled')]
+)
+registry.callback(
+    'upstream_circuit_open', 'Whether the circuit breaker of each scraped host is open (1) or closed/probing (0)', 'gauge', ('host',),
+    lambda: [({'host': host}, int(state == 'open')) for host, state in breaker_states().items()]
+)
+
+@app.route('/metrics')
+def get_metrics():
+    """Prometheus text exposition of this instance's metrics"""
+    return app.response_class(registry.render(), content_type=METRICS_CONTENT_TYPE)
+
 @app.route('/update_country_risk_premium')
 @handle_errors
+@queued_update('country_risk_premium')
 def update_country_risk_premium():
     return update_database_table(
         table_name='country_risk_premium',
         data_name='country_risk_premium',
-        clean_function=clean_crp_table,
-        last_update_function=getLastUpdate_crp,
+        clean_function=scraping().clean_crp_table,
+        last_update_function=scraping().getLastUpdate_crp,
         last_update_url="https://pages.stern.nyu.edu/~adamodar/New_Home_Page/datafile/ctryprem.html",
         last_update_text="Last updated:",
         insert_query="INSERT INTO country_risk_premium VALUES (%s, %s, %s, %s, %s, %s, %s, %s)"
@@ -363,12 +1055,13 @@ def update_country_risk_premium():
 
 @app.route('/update_effective_tax_rate')
 @handle_errors
+@queued_update('effective_tax_rate')
 def update_effective_tax_rate():
     return update_database_table(
         table_name='effective_tax_rate',
         data_name='effective_tax_rate',
-        clean_function=clean_taxRate_table,
-        last_update_function=getLastUpdate,
+        clean_function=scraping().clean_taxRate_table,
+        last_update_function=scraping().getLastUpdate,
         last_update_url="https://pages.stern.nyu.edu/~adamodar/New_Home_Page/datafile/taxrate.html",
         last_update_text="Updated",
         insert_query="INSERT INTO effective_tax_rate VALUES (%s, %s, %s, %s, %s, %s, %s,%s,%s,%s,%s)"
@@ -376,12 +1069,13 @@ def update_effective_tax_rate():
 
 @app.route('/update_sales_to_cap_us')
 @handle_errors
+@queued_update('sales_to_cap_us')
 def update_sales_to_cap_us():
     return update_database_table(
         table_name='sales_to_cap_us',
         data_name='sales_to_cap_us',
-        clean_function=clean_sales_to_cap_us,
-        last_update_function=getLastUpdate,
+        clean_function=scraping().clean_sales_to_cap_us,
+        last_update_function=scraping().getLastUpdate,
         last_update_url="https://pages.stern.nyu.edu/~adamodar/New_Home_Page/datafile/capex.html",
         last_update_text="Last updated",
         insert_query="INSERT INTO sales_to_cap_us VALUES (%s, %s, %s, %s, %s, %s, %s,%s,%s,%s)"
@@ -389,12 +1083,13 @@ def update_sales_to_cap_us():
 
 @app.route('/update_beta_us')
 @handle_errors
+@queued_update('beta_us')
 def update_beta_us():
     return update_database_table(
         table_name='beta_us',
         data_name='beta_us',
-        clean_function=clean_beta_us,
-        last_update_function=getLastUpdate,
+        clean_function=scraping().clean_beta_us,
+        last_update_function=scraping().getLastUpdate,
         last_update_url="https://pages.stern.nyu.edu/~adamodar/New_Home_Page/datafile/totalbeta.html",
         last_update_text="Last Updated in",
         insert_query="INSERT INTO beta_us VALUES (%s, %s, %s, %s, %s, %s, %s)"
@@ -402,12 +1097,13 @@ def update_beta_us():
 
 @app.route('/update_pe_ratio_us')
 @handle_errors
+@queued_update('pe_ratio_us')
 def update_pe_ratio_us():
     return update_database_table(
         table_name='pe_ratio_us',
         data_name='pe_ratio_us',
-        clean_function=clean_pe_ratio_us,
-        last_update_function=getLastUpdate,
+        clean_function=scraping().clean_pe_ratio_us,
+        last_update_function=scraping().getLastUpdate,
         last_update_url="https://pages.stern.nyu.edu/~adamodar/New_Home_Page/datafile/pedata.html",
         last_update_text="Last Updated in",
         insert_query="INSERT INTO pe_ratio_us VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"
@@ -416,12 +1112,13 @@ def update_pe_ratio_us():
 
 @app.route('/update_rev_growth_rate')
 @handle_errors
+@queued_update('rev_growth_rate')
 def update_rev_growth_rate():
     return update_database_table(
         table_name='rev_growth_rate',
         data_name='rev_growth_rate',
-        clean_function=clean_rev_growth_rate,
-        last_update_function=getLastUpdate,
+        clean_function=scraping().clean_rev_growth_rate,
+        last_update_function=scraping().getLastUpdate,
         last_update_url="https://pages.stern.nyu.edu/~adamodar/New_Home_Page/datafile/histgr.html",
         last_update_text="Last updated in",
         insert_query="INSERT INTO rev_growth_rate VALUES (%s, %s, %s, %s, %s, %s, %s)"
@@ -429,12 +1126,13 @@ def update_rev_growth_rate():
 
 @app.route('/update_ebit_growth')
 @handle_errors
+@queued_update('ebit_growth')
 def update_ebit_growth():
     return update_database_table(
         table_name='ebit_growth',
         data_name='ebit_growth',
-        clean_function=clean_ebit_growth,
-        last_update_function=getLastUpdate,
+        clean_function=scraping().clean_ebit_growth,
+        last_update_function=scraping().getLastUpdate,
         last_update_url="https://pages.stern.nyu.edu/~adamodar/New_Home_Page/datafile/fundgrEB.html",
         last_update_text="Last updated in",
         insert_query="INSERT INTO ebit_growth VALUES (%s, %s, %s, %s, %s)"
@@ -443,11 +1141,12 @@ def update_ebit_growth():
 
 @app.route('/update_default_spread')
 @handle_errors
+@queued_update('default_spread')
 def update_default_spread():
     return update_database_table(
         table_name='default_spread',
         data_name='default_spread',
-        clean_function=clean_default_spread,
+        clean_function=scraping().clean_default_spread,
         last_update_function=None,
         last_update_url=None,
         last_update_text=None,
@@ -461,74 +1160,78 @@ def update_default_spread():
 
 @app.route('/update_roic')
 @handle_errors
+@queued_update('roic')
 def update_roic():
     return update_database_table(
         table_name='roic',
         data_name='roic',
-        clean_function=clean_roic_table,
-        last_update_function=getLastUpdate,
+        clean_function=scraping().clean_roic_table,
+        last_update_function=scraping().getLastUpdate,
         last_update_url="https://pages.stern.nyu.edu/~adamodar/New_Home_Page/datafile/fundgrEB.html",
         last_update_text="Last updated in",
         insert_query="INSERT INTO roic VALUES (%s, %s, %s, %s, %s)"
     )
 
+# Update routes by data_last_update name, in the order update_all and the job worker run them
+UPDATE_SOURCES = {
+    'country_risk_premium': update_country_risk_premium,
+    'effective_tax_rate': update_effective_tax_rate,
+    'sales_to_cap_us': update_sales_to_cap_us,
+    'beta_us': update_beta_us,
+    'pe_ratio_us': update_pe_ratio_us,
+    'rev_growth_rate': update_rev_growth_rate,
+    'ebit_growth': update_ebit_growth,
+    'default_spread': update_default_spread,
+    'roic': update_roic
+}
+
+# Background workers for queued update jobs (python update_jobs.py runs a dedicated one)
+job_worker = JobWorker(run_update_source)
+
+# Polls each source at an interval learned from its update history (SCHEDULER_ENABLED=1)
+init_scheduler(app, UPDATE_SOURCES, run_update_source)
+
 @app.route('/update_all')
 @handle_errors
+@queued_update()
 def update_all():
     """
     Run all update functions and return a summary of results
+
+    Over HTTP this queues one job for every source unless ?sync=1 is given.
     """
     logger.info("Starting batch update for all data sources")
 
-    update_functions = [
-        ('country_risk_premium', update_country_risk_premium),
-        ('effective_tax_rate', update_effective_tax_rate),
-        ('sales_to_cap_us', update_sales_to_cap_us),
-        ('beta_us', update_beta_us),
-        ('pe_ratio_us', update_pe_ratio_us),
-        ('rev_growth_rate', update_rev_growth_rate),
-        ('ebit_growth', update_ebit_growth),
-        ('default_spread', update_default_spread),
-        ('roic', update_roic)
-    ]
-
     results = {}
     successful = 0
     failed = 0
 
-    for name, func in update_functions:
-        try:
-            logger.info(f"Updating {name}...")
-            response = func()
-
-            # Handle tuple response (response, status_code)
-            if isinstance(response, tuple):
-                result_data, status_code = response
-                result_json = result_data.get_json()
-            else:
-                result_json = response.get_json()
-                status_code = 200
-
-            results[name] = {
-                'status': result_json.get('status', 'Unknown'),
-                'success': status_code == 200
-            }
-
-            if status_code == 200:
-                successful += 1
-            else:
+    with deadline_scope(UPDATE_ALL_DEADLINE):
+        for name, func in UPDATE_SOURCES.items():
+            try:
+                logger.info(f"Updating {name}...")
+                result = source_result(func())
+                results[name] = {
+                    'status': result['status'],
+                    'success': result['success']
+                }
+
+                if result['success']:
+                    successful += 1
+                else:
+                    failed += 1
+
+            except Exception as e:
+                logger.error(f"Error updating {name}: {str(e)}", exc_info=True)
+                results[name] = {
+                    'status': f'Error: {str(e)}',
+                    'success': False
+                }
                 failed += 1
 
-        except Exception as e:
-            logger.error(f"Error updating {name}: {str(e)}", exc_info=True)
-            results[name] = {
-                'status': f'Error: {str(e)}',
-                'success': False
-            }
-            failed += 1
-
     summary = {
-        'total': len(update_functions),
+        'run_id': update_run_id(),
+        'total': len(UPDATE_SOURCES),
         'successful': successful,
         'failed': failed,
         'results': results
@@ -538,6 +1241,85 @@ def update_all():
 
     return jsonify(summary), 200 if failed == 0 else 207  # 207 = Multi-Status
 
+@app.route('/update_due')
+@handle_errors
+def update_due():
+    """
+    Update only the sources whose poll time has come, by the cadence observed in
+    the update_run ledger. The Vercel cron calls this daily.
+    """
+    with deadline_scope(UPDATE_ALL_DEADLINE):
+        summary = run_due_updates(list(UPDATE_SOURCES), run_update_source, update_run_id())
+    failed = sum(1 for result in summary['results'].values() if not result.get('success'))
+    return jsonify(summary), 200 if failed == 0 else 207
+
+@app.route('/update_schedule')
+@handle_errors
+def get_update_schedule():
+    """When each source will next be polled, and why"""
+    db_handler = DatabaseHandler()
+    db_handler.connect()
+    try:
+        return jsonify({'plan': plan_updates(db_handler, list(UPDATE_SOURCES))})
+    finally:
+        db_handler.close()
+
+@app.route('/jobs/<int:job_id>')
+@handle_errors
+def get_job_status(job_id):
+    """Status, progress and per-source results, with their phase timings, of a queued update job"""
+    db_handler = DatabaseHandler()
+    db_handler.connect()
+    try:
+        job = get_job(db_handler, job_id)
+    finally:
+        db_handler.close()
+    if job is None:
+        return jsonify({"error": f"Job {job_id} not found"}), 404
+    return jsonify(job)
+
+@app.route('/update_runs')
+@handle_errors
+def get_update_runs():
+    """Recent update runs from the ledger, newest first. Supports ?source= and ?limit="""
+    source = request.args.get('source')
+    try:
+        limit = int(request.args.get('limit', DEFAULT_RUN_LIMIT))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    limit = max(1, min(limit, MAX_RUN_LIMIT))
+
+    db_handler = DatabaseHandler()
+    db_handler.connect()
+    try:
+        return jsonify({'runs': list_update_runs(db_handler, source, limit)})
+    finally:
+        db_handler.close()
+
+@app.route('/update_runs/regressions')
+@handle_errors
+def get_update_run_regressions():
+    """
+    Sources whose latest successful run was slower in some phase (clean.fetch,
+    clean.read_html, insert, ...) than the median of their previous runs.
+    Supports ?window= (baseline runs) and ?ratio= (slowdown factor)
+    """
+    try:
+        window = int(request.args.get('window', DEFAULT_BASELINE_WINDOW))
+        ratio = float(request.args.get('ratio', DEFAULT_REGRESSION_RATIO))
+    except ValueError:
+        return jsonify({"error": "window must be an integer and ratio a number"}), 400
+    if window < 1 or ratio <= 1:
+        return jsonify({"error": "window must be at least 1 and ratio greater than 1"}), 400
+
+    db_handler = DatabaseHandler()
+    db_handler.connect()
+    try:
+        regressions = find_regressions(db_handler, window=window, ratio=ratio)
+    finally:
+        db_handler.close()
+    return jsonify({'window': window, 'ratio': ratio, 'regressions': regressions})
+
 @app.route('/init/last-update')
 @handle_errors
 def initialize_last_update():
@@ -612,76 +1394,6 @@ def initialize_last_update():
             'status': 'error',
             'message': str(e)
         }), 500
-# # Scheduler setup
-# scheduler = BackgroundScheduler()
-
-# # Add each update function as a separate job
-# scheduler.add_job(
-#     func=update_country_risk_premium,
-#     trigger=IntervalTrigger(seconds=60),
-#     id='update_country_risk_premium',
-#     name='Update country risk premium every day',
-#     replace_existing=True
-# )
-
-# scheduler.add_job(
-#     func=update_effective_tax_rate,
-#     trigger=IntervalTrigger(seconds=60),
-#     id='update_tax_rates_sector',
-#     name='Update tax rates sector every day',
-#     replace_existing=True
-# )
-
-# scheduler.add_job(
-#     func=update_sales_to_cap_us,
-#     trigger=IntervalTrigger(seconds=60),
-#     id='update_sales_to_cap_us',
-#     name='Update sales to cap US every day',
-#     replace_existing=True
-# )
-
-# scheduler.add_job(
-#     func=update_beta_us,
-#     trigger=IntervalTrigger(seconds=60),
-#     id='update_beta_us',
-#     name='Update beta US every day',
-#     replace_existing=True
-# )
-
-# scheduler.add_job(
-#     func=update_pe_ratio_us,
-#     trigger=IntervalTrigger(seconds=60),
-#     id='update_pe_ratio_us',
-#     name='Update PE ratio US every day',
-#     replace_existing=True
-# )
-
-# scheduler.add_job(
-#     func=update_rev_growth_rate,
-#     trigger=IntervalTrigger(seconds=60),
-#     id='update_rev_growth_rate',
-#     name='Update revenue growth rate every day',
-#     replace_existing=True
-# )
-
-# scheduler.add_job(
-#     func=update_ebit_growth,
-#     trigger=IntervalTrigger(seconds=60),
-#     id='update_ebit_growth',
-#     name='Update EBIT growth every day',
-#     replace_existing=True
-# )
-
-# scheduler.add_job(
-#     func=update_default_spread,
-#     trigger=IntervalTrigger(seconds=60),
-#     id='update_default_spread',
-#     name='Update default spread every day',
-#     replace_existing=True
-# )
-
-# # Start the scheduler
-# scheduler.start()
 
 # Ensure Flask app runs
 if __name__ == '__main__':
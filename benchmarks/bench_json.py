@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Benchmark JSON serialization of the endpoint payloads.
+
+Compares the previous path (float() on every cell, Flask's default JSON provider,
+DataFrame.to_json() for TTM routes) against restructure_data with FastJSONProvider.
+
+Usage: python benchmarks/bench_json.py [--repeat N]
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+import pandas as pd
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import frame_to_columns_dict, restructure_data, restructure_history
+from json_provider import FastJSONProvider
+from sample_data import (
+    ANNUAL_PERIODS,
+    QUARTERLY_PERIODS,
+    STATEMENT_ROWS,
+    history_frame,
+    info_dict,
+    statement_frame
+)
+
+def legacy_restructure_data(df):
+    """restructure_data before the JSON provider change"""
+    restructured_data = []
+    for column in df.columns:
+        period_data = {"date": column.strftime('%Y-%m-%d'), "values": {}}
+        for index, value in df[column].items():
+            if pd.notna(value):
+                period_data["values"][index] = float(value)
+        restructured_data.append(period_data)
+    restructured_data.sort(key=lambda x: x["date"], reverse=True)
+    return restructured_data
+
+def legacy_currency(historical_data):
+    restructured_data = []
+    for day, row in historical_data.iterrows():
+        period_data = {"date": day.strftime('%Y-%m-%d'), "values": {}}
+        for column, value in row.items():
+            if pd.notna(value):
+                period_data["values"][column] = float(value)
+        restructured_data.append(period_data)
+    restructured_data.sort(key=lambda x: x["date"], reverse=True)
+    return restructured_data
+
+def build_cases():
+    cases = []
+    for name, rows in STATEMENT_ROWS.items():
+        annual = statement_frame(rows, ANNUAL_PERIODS)
+        quarterly = statement_frame(rows, QUARTERLY_PERIODS, quarterly=True)
+        cases.append((f"annual_{name}", annual, legacy_restructure_data, restructure_data))
+        cases.append((f"quarterly_{name}", quarterly, legacy_restructure_data, restructure_data))
+    ttm = statement_frame(STATEMENT_ROWS['income_stmt'], 1)
+    cases.append(('ttm_income_statement', ttm, None, frame_to_columns_dict))
+    cases.append(('currency_conversion', history_frame(), legacy_currency, restructure_history))
+    cases.append(('stock_info', info_dict(), lambda info: info, lambda info: info))
+    return cases
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=200, help='Iterations per case')
+    args = parser.parse_args()
+
+    default_app = Flask('default')
+    default_app.json = DefaultJSONProvider(default_app)
+    fast_app = Flask('fast')
+    fast_app.json = FastJSONProvider(fast_app)
+
+    print(f"{'endpoint':<32}{'legacy ms':>12}{'new ms':>12}{'speedup':>10}")
+    for name, data, legacy, current in build_cases():
+        if legacy is None:
+            # TTM routes used DataFrame.to_json() directly
+            legacy_call = lambda: data.to_json()
+        else:
+            legacy_call = lambda: default_app.json.dumps(legacy(data))
+        new_call = lambda: fast_app.json.response(current(data)).get_data()
+
+        legacy_ms = min(timeit.repeat(legacy_call, number=args.repeat, repeat=3)) / args.repeat * 1000
+        new_ms = min(timeit.repeat(new_call, number=args.repeat, repeat=3)) / args.repeat * 1000
+        print(f"{name:<32}{legacy_ms:>12.3f}{new_ms:>12.3f}{legacy_ms / new_ms:>9.1f}x")
+
+if __name__ == '__main__':
+    main()
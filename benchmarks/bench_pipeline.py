@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+"""
+Benchmark the scraping, cleaning and loading pipeline.
+
+Stern pages are served by the upstream replay server (upstream_replay.py) from
+recorded fixtures when available, otherwise from synthetic pages with the same
+layout (sample_data.STERN_PAGES). Stages:
+
+    clean_*                      fetch and parse one Stern table
+    getLastUpdate[_crp]          fetch a page and parse its "last updated" line
+    restructure_data             statement frames shaped like Yahoo's
+    update_database_table:*      clean, compare and load one table end to end   (needs Postgres)
+    insert_input_stats           load input_stats.csv                           (needs Postgres)
+
+Database stages truncate and reload tables, so they only run when DATABASE_URL or
+PGHOST points at a scratch database (see database.py). Each stage reports the
+lower-quartile wall time over --repeat runs and the tracemalloc peak of one extra run.
+
+Times are compared with benchmarks/baselines.json relative to a calibration
+stage (parsing the synthetic Stern pages in process) measured in the same run, so
+a slower or busier machine shifts both alike. Stages whose baseline is under
+MIN_COMPARABLE_SECONDS are compared on memory only, and a regression only counts
+when it reproduces on a second measurement of the stage. Exit status:
+
+    0  no regressions
+    1  a stage is slower or uses more memory than its baseline by more than --threshold
+    2  incomplete: requested stages were skipped (no database) or have no baseline;
+       pass --allow-incomplete to accept that, e.g. on machines without Postgres
+
+Regenerate baselines with --update-baselines on a machine with a scratch database.
+
+Usage:
+    python benchmarks/bench_pipeline.py [--repeat 10] [--threshold 0.5] [--only clean_]
+    python benchmarks/bench_pipeline.py --update-baselines
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import runpy
+import socket
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import warnings
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import upstream_replay
+from sample_data import (
+    ANNUAL_PERIODS,
+    QUARTERLY_PERIODS,
+    STATEMENT_ROWS,
+    STERN_BASE_URL,
+    STERN_PAGES,
+    statement_frame,
+    stern_page
+)
+
+BASELINES_PATH = os.path.join(REPO_ROOT, 'benchmarks', 'baselines.json')
+DEFAULT_THRESHOLD = 0.5
+# Stages whose baseline is faster than this are compared on memory only; run-to-run
+# noise of a few milliseconds dominates below it
+MIN_COMPARABLE_SECONDS = 0.03
+CALIBRATION_STAGE = 'calibration'
+DATABASE_STAGES = [
+    ('update_country_risk_premium', 'country_risk_premium'),
+    ('update_effective_tax_rate', 'effective_tax_rate'),
+    ('update_beta_us', 'beta_us'),
+    ('update_default_spread', 'default_spread'),
+    ('update_roic', 'roic')
+]
+DATABASE_STAGE_NAMES = [f"update_database_table:{data_name}" for _, data_name in DATABASE_STAGES] + ['insert_input_stats']
+
+def prepare_fixtures(recorded_dir):
+    """
+    Fixture directory with every Stern page: recorded fixtures where present,
+    synthetic pages for the rest
+
+    Returns:
+        Path of a temporary fixture directory
+    """
+    target = tempfile.mkdtemp(prefix='bench_fixtures_')
+
+    class Page:
+        status_code = 200
+        headers = {'content-type': 'text/html'}
+
+    for name in STERN_PAGES:
+        url = STERN_BASE_URL + name
+        host, key = upstream_replay.fixture_key('GET', url)
+        recorded = upstream_replay.fixture_path(host, key, recorded_dir)
+        destination = upstream_replay.fixture_path(host, key, target)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        if os.path.exists(recorded):
+            with open(recorded) as src, open(destination, 'w') as dst:
+                dst.write(src.read())
+            continue
+        page = Page()
+        page.content = stern_page(name).encode('utf-8')
+        upstream_replay.save_fixture('GET', url, None, page, base_dir=target)
+    return target
+
+def start_replay_server(fixtures):
+    """Serve fixtures on a free local port with no added latency and route data_helper to it"""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    thread = threading.Thread(target=upstream_replay.serve, kwargs={'port': port, 'fixtures': fixtures}, daemon=True)
+    thread.start()
+    for _ in range(50):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+    os.environ['UPSTREAM_MODE'] = 'replay'
+    os.environ['UPSTREAM_REPLAY_URL'] = f"http://127.0.0.1:{port}"
+
+def database_available():
+    """Only an explicitly configured database is used, never the production default"""
+    if not (os.environ.get('DATABASE_URL') or os.environ.get('PGHOST')):
+        return False
+    from database import DatabaseHandler
+    db_handler = DatabaseHandler()
+    with contextlib.redirect_stdout(io.StringIO()):
+        db_handler.connect()
+    available = db_handler.conn is not None
+    if available:
+        db_handler.close()
+    return available
+
+def reset_last_update(data_name):
+    """Make the stored last_update old enough that update_database_table reloads the table"""
+    from database import DatabaseHandler
+    db_handler = DatabaseHandler()
+    db_handler.connect()
+    db_handler.execute_query(
+        """INSERT INTO data_last_update (data_name, last_update) VALUES (%s, '1900-01-01')
+        ON CONFLICT (data_name) DO UPDATE SET last_update = '1900-01-01'""",
+        (data_name,)
+    )
+    db_handler.close()
+
+def build_stages(with_database):
+    """Ordered (name, setup, run) triples; setup runs before every measured call"""
+    # Per-table progress logging would dominate the output
+    logging.disable(logging.INFO)
+    warnings.simplefilter('ignore', FutureWarning)
+
+    import app
+    import data_helper
+
+    def checked(clean_function):
+        """clean_* functions report errors in their last return value instead of raising"""
+        def run():
+            result = clean_function()
+            if result[-1] is not None:
+                raise RuntimeError(f"{clean_function.__name__} failed: {result[-1]}")
+        return run
+
+    import pandas as pd
+    calibration_pages = [stern_page(name) for name in STERN_PAGES]
+
+    def calibrate():
+        """The clean_* parsing work without HTTP, as a yardstick for this machine's speed"""
+        for page in calibration_pages:
+            pd.read_html(io.StringIO(page))
+
+    stages = [(CALIBRATION_STAGE, None, calibrate)]
+    for name in [
+        'clean_crp_table',
+        'clean_taxRate_table',
+        'clean_sales_to_cap_us',
+        'clean_beta_us',
+        'clean_pe_ratio_us',
+        'clean_rev_growth_rate',
+        'clean_ebit_growth',
+        'clean_default_spread',
+        'clean_roic_table'
+    ]:
+        stages.append((name, None, checked(getattr(data_helper, name))))
+
+    stages.append(('getLastUpdate', None, lambda: data_helper.getLastUpdate(STERN_BASE_URL + 'histgr.html', 'Last updated in')))
+    stages.append(('getLastUpdate_crp', None, lambda: data_helper.getLastUpdate_crp(STERN_BASE_URL + 'ctryprem.html', 'Last updated:')))
+
+    statements = [
+        statement_frame(rows, periods, quarterly=periods == QUARTERLY_PERIODS, seed=i)
+        for i, rows in enumerate(STATEMENT_ROWS.values())
+        for periods in (ANNUAL_PERIODS, QUARTERLY_PERIODS)
+    ]
+    stages.append(('restructure_data', None, lambda: [app.restructure_data(df) for df in statements]))
+
+    if not with_database:
+        return stages
+
+    for endpoint, data_name in DATABASE_STAGES:
+        view = app.app.view_functions[endpoint]
+
+        def run(view=view):
+            with app.app.test_request_context():
+                response, status = view()
+            if status != 200:
+                raise RuntimeError(response.get_json())
+
+        stages.append((f"update_database_table:{data_name}", lambda data_name=data_name: reset_last_update(data_name), run))
+
+    def truncate_input_stats():
+        from database import DatabaseHandler
+        db_handler = DatabaseHandler()
+        db_handler.connect()
+        db_handler.execute_query("TRUNCATE TABLE input_stats")
+        db_handler.close()
+
+    def insert_input_stats():
+        cwd = os.getcwd()
+        os.chdir(REPO_ROOT)
+        try:
+            runpy.run_path(os.path.join(REPO_ROOT, 'insert_input_stats.py'), run_name='__main__')
+        finally:
+            os.chdir(cwd)
+
+    stages.append(('insert_input_stats', truncate_input_stats, insert_input_stats))
+    return stages
+
+def measure(setup, run, repeat):
+    """
+    Lower quartile of the seconds over repeat runs, and the tracemalloc peak in MB of one more run
+
+    Stalls on a busy machine only ever add time and hit a third or more of the
+    runs, which moves the median; the lower quartile is still stable, and unlike
+    the minimum it does not depend on a single lucky run.
+    """
+    timings = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat + 1):  # the first run warms imports and connections
+            if setup:
+                setup()
+            started = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - started)
+
+        if setup:
+            setup()
+        tracemalloc.start()
+        try:
+            run()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    timings = sorted(timings[1:])
+    return timings[(len(timings) - 1) // 4], peak / (1024 * 1024)
+
+def compare(name, seconds, peak_mb, baseline, threshold, speed=1.0):
+    """
+    Regression messages for one stage, empty if within the threshold
+
+    speed is this run's calibration time over the baseline's, at least 1; the
+    baseline time is scaled by it so a slower machine does not count as a regression.
+    """
+    if not baseline:
+        return []
+    regressions = []
+    expected = baseline['seconds'] * speed
+    if baseline['seconds'] >= MIN_COMPARABLE_SECONDS and seconds > expected * (1 + threshold):
+        regressions.append(
+            f"{name}: {seconds * 1000:.1f} ms vs baseline {baseline['seconds'] * 1000:.1f} ms "
+            f"({expected * 1000:.1f} ms at this machine's speed)"
+        )
+    if peak_mb > baseline['peak_mb'] * (1 + threshold) and peak_mb - baseline['peak_mb'] > 0.5:
+        regressions.append(f"{name}: peak {peak_mb:.1f} MB vs baseline {baseline['peak_mb']:.1f} MB")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=10, help='Measured runs per stage')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='Allowed relative regression')
+    parser.add_argument('--only', default=None, help='Run only stages whose name contains this string')
+    parser.add_argument('--fixtures', default=upstream_replay.DEFAULT_FIXTURE_DIR, help='Recorded fixture directory')
+    parser.add_argument('--update-baselines', action='store_true', help='Write the measured results as the new baselines')
+    parser.add_argument('--allow-incomplete', action='store_true', help='Exit 0 even when stages were skipped or have no baseline')
+    args = parser.parse_args()
+
+    def requested(name):
+        return name == CALIBRATION_STAGE or not args.only or args.only in name
+
+    start_replay_server(prepare_fixtures(args.fixtures))
+    with_database = database_available()
+    incomplete = []
+    if not with_database:
+        skipped = [name for name in DATABASE_STAGE_NAMES if requested(name)]
+        if skipped:
+            print(f"SKIPPED (DATABASE_URL/PGHOST not set or unreachable): {', '.join(skipped)}")
+            incomplete.extend(f"{name}: skipped, no database" for name in skipped)
+
+    try:
+        with open(BASELINES_PATH) as f:
+            baselines = json.load(f)
+    except (OSError, ValueError):
+        baselines = {}
+
+    results = {}
+    stages = [stage for stage in build_stages(with_database) if requested(stage[0])]
+    print(f"{'stage':42} {'p25 ms':>10} {'peak MB':>9} {'baseline ms':>12}")
+    for name, setup, run in stages:
+        seconds, peak_mb = measure(setup, run, args.repeat)
+        results[name] = {'seconds': round(seconds, 6), 'peak_mb': round(peak_mb, 3)}
+        baseline = baselines.get(name)
+        baseline_ms = f"{baseline['seconds'] * 1000:12.1f}" if baseline else f"{'-':>12}"
+        print(f"{name:42} {seconds * 1000:10.1f} {peak_mb:9.2f} {baseline_ms}")
+
+    # Calibrate again after the stages and keep the slower reading. The factor only
+    # ever relaxes the baselines: a lucky fast calibration must not tighten them.
+    calibration_run = stages[0][2]
+    calibration = max(results[CALIBRATION_STAGE]['seconds'], measure(None, calibration_run, args.repeat)[0])
+    results[CALIBRATION_STAGE]['seconds'] = round(calibration, 6)
+    speed = 1.0
+    if baselines.get(CALIBRATION_STAGE):
+        speed = max(1.0, calibration / baselines[CALIBRATION_STAGE]['seconds'])
+        print(f"machine speed factor {speed:.2f} (baselines are scaled up when this machine is slower)")
+
+    regressions = []
+    for name, setup, run in stages[1:]:
+        result = results[name]
+        baseline = baselines.get(name)
+        if baseline is None:
+            incomplete.append(f"{name}: no baseline")
+        found = compare(name, result['seconds'], result['peak_mb'], baseline, args.threshold, speed)
+        if found and not args.update_baselines:
+            # A stage can stall on its own for a run; a regression must reproduce on a second measurement
+            seconds, peak_mb = measure(setup, run, args.repeat)
+            print(f"{name:42} {seconds * 1000:10.1f} {peak_mb:9.2f}   (re-measured)")
+            found = compare(name, seconds, peak_mb, baseline, args.threshold, speed)
+        regressions.extend(found)
+
+    if args.update_baselines:
+        baselines.update(results)
+        with open(BASELINES_PATH, 'w') as f:
+            json.dump(dict(sorted(baselines.items())), f, indent=2)
+            f.write('\n')
+        print(f"Baselines written to {os.path.relpath(BASELINES_PATH, REPO_ROOT)}")
+        return
+
+    if regressions:
+        print("REGRESSED (threshold {:.0%}):".format(args.threshold))
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    if incomplete:
+        print("INCOMPLETE:")
+        for reason in incomplete:
+            print(f"  {reason}")
+        if not args.allow_incomplete:
+            sys.exit(2)
+    print("OK")
+
+if __name__ == '__main__':
+    main()
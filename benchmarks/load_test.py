@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Load test the yfinance-backed routes against the stub backend.
+
+Starts benchmarks/stub_app.py (the app with a deterministic stub yf.Ticker) in a
+separate process, unless --url points at an already running server, and drives
+/stock_info, the statement routes and /currency_conversion from 1 to 64
+concurrent clients. Reports throughput and p50/p95/p99 latency per concurrency
+level, overall and per route.
+
+Requests rotate over --symbols symbols, so after the first pass they are served
+from the app's yfinance cache and the numbers measure the app's own overhead
+(validation, restructure_data, serialization). Use --delay-ms to add simulated
+upstream latency to cache misses.
+
+Usage:
+    python benchmarks/load_test.py [--concurrency 1,4,16,64] [--duration 10] [--delay-ms 0] [--json out.json]
+    python benchmarks/load_test.py --url http://127.0.0.1:8000   # e.g. gunicorn stub_app:app
+"""
+
+import argparse
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Route templates exercised by the load test
+ROUTES = [
+    '/stock_info/{symbol}',
+    '/annual_income_statement/{symbol}',
+    '/annual_balance_sheet/{symbol}',
+    '/annual_cash_flow/{symbol}',
+    '/quarterly_income_statement/{symbol}',
+    '/quarterly_balance_sheet/{symbol}',
+    '/quarterly_cash_flow/{symbol}',
+    '/ttm_income_statement/{symbol}',
+    '/ttm_cash_flow/{symbol}',
+    '/currency_conversion/USD/{currency}/2024-01-01/2024-12-31'
+]
+CURRENCIES = ['EUR', 'GBP', 'JPY', 'INR', 'CAD', 'AUD', 'CHF', 'SGD']
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+def request_paths(symbols):
+    """Endless rotation over every route and symbol"""
+    paths = [
+        route.format(symbol=f"SYM{i}", currency=CURRENCIES[i % len(CURRENCIES)])
+        for i in range(symbols)
+        for route in ROUTES
+    ]
+    return itertools.cycle(paths)
+
+def start_server(delay_ms):
+    """Run stub_app.py on a free port and wait until it accepts connections"""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(BENCHMARKS_DIR, 'stub_app.py'), '--port', str(port), '--delay-ms', str(delay_ms)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return process, f"http://127.0.0.1:{port}"
+        except OSError:
+            if process.poll() is not None:
+                raise RuntimeError("stub_app.py exited during startup")
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("stub_app.py did not start within 30 seconds")
+
+def run_level(base_url, concurrency, duration, paths):
+    """
+    Drive the server with concurrency clients for duration seconds
+
+    Returns:
+        List of (route template, seconds, status) per completed request
+    """
+    samples = []
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client():
+        session = requests.Session()
+        local = []
+        while time.monotonic() < deadline:
+            with lock:
+                path = next(paths)
+            started = time.perf_counter()
+            try:
+                status = session.get(base_url + path, timeout=60).status_code
+            except requests.RequestException:
+                status = 0
+            local.append((path.split('/')[1], time.perf_counter() - started, status))
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples
+
+def summarize(samples, duration):
+    latencies = sorted(seconds for _, seconds, _ in samples)
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for _, _, status in samples if status != 200),
+        'throughput_rps': len(samples) / duration,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default=None, help='Base URL of a running server; by default stub_app.py is started')
+    parser.add_argument('--concurrency', default='1,4,16,64', help='Comma separated client counts')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds per concurrency level')
+    parser.add_argument('--warmup', type=float, default=2, help='Seconds of single-client warmup, not reported')
+    parser.add_argument('--symbols', type=int, default=20, help='Distinct symbols to rotate through')
+    parser.add_argument('--delay-ms', type=float, default=0, help='Stub upstream latency when starting stub_app.py')
+    parser.add_argument('--per-route', action='store_true', help='Also print a breakdown per route')
+    parser.add_argument('--json', default=None, help='Write the results to this file')
+    args = parser.parse_args()
+
+    process = None
+    base_url = args.url
+    if base_url is None:
+        process, base_url = start_server(args.delay_ms)
+    base_url = base_url.rstrip('/')
+
+    paths = request_paths(args.symbols)
+    results = []
+    try:
+        run_level(base_url, 1, args.warmup, paths)
+        print(f"{'clients':>7} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+        for concurrency in [int(level) for level in args.concurrency.split(',')]:
+            samples = run_level(base_url, concurrency, args.duration, paths)
+            summary = summarize(samples, args.duration)
+            routes = {
+                route: summarize([sample for sample in samples if sample[0] == route], args.duration)
+                for route in sorted({sample[0] for sample in samples})
+            }
+            results.append({'concurrency': concurrency, **summary, 'routes': routes})
+            print(f"{concurrency:7d} {summary['requests']:9d} {summary['errors']:7d} {summary['throughput_rps']:9.1f} "
+                  f"{summary['p50_ms']:9.1f} {summary['p95_ms']:9.1f} {summary['p99_ms']:9.1f}")
+            if args.per_route:
+                for route, stats in routes.items():
+                    print(f"{'':7} {route:>32} {stats['throughput_rps']:9.1f} "
+                          f"{stats['p50_ms']:9.1f} {stats['p95_ms']:9.1f} {stats['p99_ms']:9.1f}")
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'url': base_url, 'duration': args.duration, 'levels': results}, f, indent=2)
+
+if __name__ == '__main__':
+    main()
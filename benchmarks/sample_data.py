@@ -0,0 +1,106 @@
+"""
+Deterministic stand-ins for the data yfinance returns, sized like real responses.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Rough row counts of Yahoo statements for a large company
+STATEMENT_ROWS = {
+    'income_stmt': 45,
+    'balance_sheet': 80,
+    'cash_flow': 60
+}
+ANNUAL_PERIODS = 5
+QUARTERLY_PERIODS = 8
+
+def statement_frame(rows, periods, quarterly=False, seed=0):
+    """Statement frame with line items as the index and period end dates as columns, ~10% NaN"""
+    rng = np.random.default_rng(seed)
+    step = 3 if quarterly else 12
+    columns = pd.DatetimeIndex([pd.Timestamp('2024-12-31') - pd.DateOffset(months=step * i) for i in range(periods)])
+    values = rng.normal(1e9, 5e8, size=(rows, periods))
+    values[rng.random((rows, periods)) < 0.1] = np.nan
+    index = [f"Line Item {i}" for i in range(rows)]
+    return pd.DataFrame(values, index=index, columns=columns)
+
+def history_frame(days=250, seed=0):
+    """Daily OHLCV history like Ticker.history() for a currency pair"""
+    rng = np.random.default_rng(seed)
+    index = pd.date_range(end='2024-12-31', periods=days, freq='D', tz='Europe/London')
+    close = 1.3 + np.cumsum(rng.normal(0, 0.002, days))
+    return pd.DataFrame({
+        'Open': close + rng.normal(0, 0.001, days),
+        'High': close + 0.005,
+        'Low': close - 0.005,
+        'Close': close,
+        'Volume': np.zeros(days),
+        'Dividends': np.zeros(days),
+        'Stock Splits': np.zeros(days)
+    }, index=index)
+
+def info_dict(symbol='TEST', fields=150):
+    """Ticker.info-like dict with a mix of strings, ints, floats and lists"""
+    info = {'symbol': symbol, 'shortName': f"{symbol} Inc.", 'currency': 'USD'}
+    for i in range(fields):
+        if i % 3 == 0:
+            info[f"metric{i}"] = i * 1.5
+        elif i % 3 == 1:
+            info[f"count{i}"] = i * 1000
+        else:
+            info[f"text{i}"] = f"value {i}"
+    info['companyOfficers'] = [{'name': f"Officer {i}", 'totalPay': 1000000 + i} for i in range(10)]
+    return info
+
+STERN_BASE_URL = 'https://pages.stern.nyu.edu/~adamodar/New_Home_Page/datafile/'
+
+# Layout of the Stern pages scraped by data_helper: columns, data rows, header rows,
+# tables preceding the data table, and the "last updated" line
+STERN_PAGES = {
+    'ctryprem.html': {'columns': 8, 'rows': 175, 'header_rows': 1, 'tables_before': 1,
+                      'updated': 'Last updated: January 5, 2025'},
+    'taxrate.html': {'columns': 11, 'rows': 95, 'header_rows': 2, 'tables_before': 0,
+                     'updated': 'Updated January 2025'},
+    'capex.html': {'columns': 10, 'rows': 95, 'header_rows': 1, 'tables_before': 0,
+                   'updated': 'Last updated January 2025'},
+    'totalbeta.html': {'columns': 7, 'rows': 95, 'header_rows': 1, 'tables_before': 0,
+                       'updated': 'Last Updated in January 2025'},
+    'pedata.html': {'columns': 10, 'rows': 95, 'header_rows': 1, 'tables_before': 0,
+                    'updated': 'Last Updated in January 2025'},
+    'histgr.html': {'columns': 7, 'rows': 95, 'header_rows': 1, 'tables_before': 0,
+                    'updated': 'Last updated in January 2025'},
+    'fundgrEB.html': {'columns': 5, 'rows': 95, 'header_rows': 1, 'tables_before': 0,
+                      'updated': 'Last updated in January 2025'},
+    'ratings.html': {'columns': 9, 'rows': 15, 'header_rows': 4, 'tables_before': 0,
+                     'updated': 'Last updated January 2025'}
+}
+
+def _html_table(rows):
+    cells = ''.join(
+        '<tr>' + ''.join(f"<td>{value}</td>" for value in row) + '</tr>\n'
+        for row in rows
+    )
+    return f"<table>\n{cells}</table>\n"
+
+def stern_page(name, seed=0):
+    """Excel-exported HTML like the Stern data pages: header rows in the body, percent strings"""
+    spec = STERN_PAGES[name]
+    rng = np.random.default_rng(seed)
+    columns = spec['columns']
+    rows = [[f"Header {h}.{c}" for c in range(columns)] for h in range(spec['header_rows'])]
+    for r in range(spec['rows']):
+        row = [f"  Industry   {r}  "]
+        for c in range(1, columns):
+            if c % 3 == 0:
+                row.append(f"{rng.normal(10, 5):.2f}%")
+            elif c % 3 == 1:
+                row.append(f"{int(rng.integers(1, 5000)):,}")
+            else:
+                row.append(f"{rng.normal(1, 0.3):.4f}")
+        rows.append(row)
+
+    preamble = ''.join(_html_table([['Note', 'Value'], ['Source', 'Damodaran']]) for _ in range(spec['tables_before']))
+    return (
+        f"<html><head><title>{name}</title></head><body>\n"
+        f"<p>{spec['updated']}</p>\n{preamble}{_html_table(rows)}</body></html>"
+    )
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Cold-start budget check for the Vercel entry point.
+
+Imports app.py in a fresh interpreter, then serves one /stock_info request
+against a stubbed yfinance Ticker (no network). Reports import time, time to the
+first response and RSS, and fails if any budget is exceeded or if modules that
+/stock_info must not need (the data_helper scraping stack, APScheduler, the
+valuation engine) were loaded.
+
+Usage: python benchmarks/startup_budget.py [--import-ms 300] [--first-request-ms 1500] [--rss-mb 250]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules a cold /stock_info request must not load
+FORBIDDEN_MODULES = ['data_helper', 'apscheduler', 'valuation_engine']
+
+# Runs in the child interpreter so imports are measured from a cold start
+PROBE = r'''
+import json, resource, sys, time
+sys.path.insert(0, sys.argv[1])
+sys.path.insert(0, sys.argv[1] + '/benchmarks')
+
+started = time.perf_counter()
+import app
+import_ms = (time.perf_counter() - started) * 1000
+import_modules = set(sys.modules)
+import_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+# yfinance is imported by the first request, so its import counts towards that request
+started = time.perf_counter()
+from sample_data import info_dict
+import yfinance
+
+class StubTicker:
+    def __init__(self, symbol, *args, **kwargs):
+        self.info = info_dict(symbol)
+
+yfinance.Ticker = StubTicker
+response = app.app.test_client().get('/stock_info/AAPL')
+first_request_ms = (time.perf_counter() - started) * 1000
+
+print(json.dumps({
+    'import_ms': import_ms,
+    'import_rss_mb': import_rss_mb,
+    'first_request_ms': first_request_ms,
+    'status': response.status_code,
+    'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'modules_after_import': sorted(import_modules),
+    'modules': sorted(sys.modules)
+}))
+'''
+
+def measure():
+    """Run the probe in a fresh interpreter and return its measurements"""
+    result = subprocess.run(
+        [sys.executable, '-c', PROBE, REPO_ROOT],
+        capture_output=True,
+        text=True,
+        cwd=REPO_ROOT
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Startup probe failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--import-ms', type=float, default=300, help='Budget for importing app.py')
+    parser.add_argument('--first-request-ms', type=float, default=1500, help='Budget for the first /stock_info request')
+    parser.add_argument('--rss-mb', type=float, default=250, help='Budget for peak RSS after the first request')
+    args = parser.parse_args()
+
+    stats = measure()
+    loaded = set(stats['modules'])
+    forbidden = [
+        name for name in FORBIDDEN_MODULES
+        if name in loaded or any(module.startswith(f"{name}.") for module in loaded)
+    ]
+
+    print(f"import app:            {stats['import_ms']:8.1f} ms  (budget {args.import_ms:.0f} ms)")
+    print(f"RSS after import:      {stats['import_rss_mb']:8.1f} MB")
+    print(f"first /stock_info:     {stats['first_request_ms']:8.1f} ms  (budget {args.first_request_ms:.0f} ms)")
+    print(f"peak RSS:              {stats['rss_mb']:8.1f} MB  (budget {args.rss_mb:.0f} MB)")
+    print(f"modules after import:  {len(stats['modules_after_import'])}")
+
+    failures = []
+    if stats['status'] != 200:
+        failures.append(f"/stock_info returned {stats['status']}")
+    if stats['import_ms'] > args.import_ms:
+        failures.append("import time over budget")
+    if stats['first_request_ms'] > args.first_request_ms:
+        failures.append("first request over budget")
+    if stats['rss_mb'] > args.rss_mb:
+        failures.append("RSS over budget")
+    if forbidden:
+        failures.append(f"cold /stock_info loaded {forbidden}")
+
+    if failures:
+        print("FAILED: " + "; ".join(failures))
+        sys.exit(1)
+    print("OK")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,29 @@
+"""
+WSGI entry point serving app.py against the stub yfinance backend.
+
+    cd benchmarks && STUB_YF_DELAY_MS=50 gunicorn -w 4 --threads 8 stub_app:app
+    python benchmarks/stub_app.py --port 8000 --delay-ms 50     # threaded werkzeug server
+    python benchmarks/load_test.py --url http://127.0.0.1:8000
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import stub_yfinance
+from app import app
+
+stub_yfinance.install()
+
+if __name__ == '__main__':
+    import argparse
+    from werkzeug.serving import make_server
+
+    parser = argparse.ArgumentParser(description='Serve the app with the stub yfinance backend')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--delay-ms', type=float, default=None, help='Simulated upstream latency (default STUB_YF_DELAY_MS)')
+    args = parser.parse_args()
+    stub_yfinance.install(args.delay_ms)
+    make_server('127.0.0.1', args.port, app, threaded=True).serve_forever()
@@ -0,0 +1,98 @@
+"""
+Stub yfinance backend for benchmarks: a deterministic Ticker with configurable latency.
+
+install() replaces yfinance.Ticker and lifts the Yahoo rate limiter, so the
+request path measured is the app's own (validation, caching, restructure_data,
+serialization) plus the simulated upstream delay. stub_app.py wraps this for WSGI
+servers such as gunicorn.
+"""
+
+import os
+import time
+import zlib
+
+from sample_data import (
+    ANNUAL_PERIODS,
+    QUARTERLY_PERIODS,
+    STATEMENT_ROWS,
+    history_frame,
+    info_dict,
+    statement_frame
+)
+
+# Simulated upstream latency per Ticker attribute access, in milliseconds
+DEFAULT_DELAY_MS = float(os.environ.get('STUB_YF_DELAY_MS', '0'))
+
+class StubTicker:
+    """Serves sample_data frames; each symbol gets its own deterministic values"""
+
+    delay = DEFAULT_DELAY_MS / 1000
+
+    def __init__(self, ticker, session=None, **kwargs):
+        self.ticker = ticker
+        self._seed = zlib.crc32(ticker.encode('utf-8'))
+
+    def _wait(self):
+        if self.delay > 0:
+            time.sleep(self.delay)
+
+    def _statement(self, name, periods):
+        self._wait()
+        return statement_frame(STATEMENT_ROWS[name], periods, quarterly=periods == QUARTERLY_PERIODS, seed=self._seed)
+
+    @property
+    def info(self):
+        self._wait()
+        return info_dict(self.ticker)
+
+    @property
+    def income_stmt(self):
+        return self._statement('income_stmt', ANNUAL_PERIODS)
+
+    @property
+    def balance_sheet(self):
+        return self._statement('balance_sheet', ANNUAL_PERIODS)
+
+    @property
+    def cash_flow(self):
+        return self._statement('cash_flow', ANNUAL_PERIODS)
+
+    @property
+    def quarterly_income_stmt(self):
+        return self._statement('income_stmt', QUARTERLY_PERIODS)
+
+    @property
+    def quarterly_balance_sheet(self):
+        return self._statement('balance_sheet', QUARTERLY_PERIODS)
+
+    @property
+    def quarterly_cash_flow(self):
+        return self._statement('cash_flow', QUARTERLY_PERIODS)
+
+    @property
+    def ttm_income_stmt(self):
+        return self._statement('income_stmt', 1)
+
+    @property
+    def ttm_cashflow(self):
+        return self._statement('cash_flow', 1)
+
+    def history(self, start=None, end=None, **kwargs):
+        self._wait()
+        return history_frame(seed=self._seed)
+
+def install(delay_ms=None):
+    """
+    Replace yfinance.Ticker with StubTicker and remove the Yahoo rate limit
+
+    Args:
+        delay_ms: Simulated upstream latency, defaults to STUB_YF_DELAY_MS
+    """
+    import yfinance
+    import upstream
+
+    if delay_ms is not None:
+        StubTicker.delay = delay_ms / 1000
+    yfinance.Ticker = StubTicker
+    limiter = upstream.yahoo_limiter
+    limiter.rate = limiter.max_rate = limiter.burst = 1e9
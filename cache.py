@@ -0,0 +1,166 @@
+import threading
+import time
+import logging
+from collections import OrderedDict
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with an optional time to live per entry
+
+    Entries are evicted least recently used first once maxsize is reached.
+    A ttl of None keeps entries until they are evicted or invalidated.
+    """
+
+    def __init__(self, maxsize=256, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default if it is missing or expired."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Store value under key, evicting the least recently used entry if full."""
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        """Remove a single entry."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def invalidate_where(self, predicate):
+        """Remove the entries whose key matches predicate; returns how many were removed."""
+        with self._lock:
+            keys = [key for key in self._data if predicate(key)]
+            for key in keys:
+                del self._data[key]
+            return len(keys)
+
+    def clear(self):
+        """Remove every entry."""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            return {'hit': self.hits, 'miss': self.misses, 'size': len(self._data)}
+
+class StaleWhileRevalidateCache:
+    """
+    Cache with stale-while-revalidate semantics
+
+    Entries younger than soft_ttl are served as is. Between soft_ttl and hard_ttl
+    the stale value is served immediately while a background refresh replaces it.
+    Past hard_ttl (or on a miss) the caller blocks on a fresh fetch. A failed
+    background refresh keeps the stale value until its hard TTL.
+
+    Fetched values rejected by cache_if can be kept for a short negative_ttl, so
+    repeated misses are not refetched. They never replace a good stale value.
+    """
+
+    def __init__(self, maxsize=1024, refresh_workers=4):
+        self._entries = TTLCache(maxsize=maxsize)
+        self._refresh_workers = refresh_workers
+        self._executor = None
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._counts = {'fresh': 0, 'stale': 0, 'negative': 0, 'miss': 0, 'refreshed': 0, 'refresh_errors': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def _submit_refresh(self, key, fetch, hard_ttl, cache_if):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            if self._executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+                self._executor = ThreadPoolExecutor(max_workers=self._refresh_workers, thread_name_prefix='swr-refresh')
+        self._executor.submit(self._refresh, key, fetch, hard_ttl, cache_if)
+
+    def _refresh(self, key, fetch, hard_ttl, cache_if):
+        try:
+            value = fetch()
+            if cache_if is None or cache_if(value):
+                self._entries.set(key, (value, time.monotonic(), False), ttl=hard_ttl)
+            self._count('refreshed')
+        except Exception as e:
+            logger.warning(f"Background refresh failed for {key}: {str(e)}")
+            self._count('refresh_errors')
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def get_or_fetch(self, key, fetch, soft_ttl, hard_ttl, cache_if=None, refresh=None, negative_ttl=None):
+        """
+        Return the cached value for key, fetching or refreshing it as needed
+
+        Args:
+            key: Cache key
+            fetch: Callable returning a fresh value
+            soft_ttl: Seconds after which the value is refreshed in the background
+            hard_ttl: Seconds after which the value is no longer served
+            cache_if: Optional predicate; values for which it is false are not cached for the TTLs
+            refresh: Callable used for background refreshes, defaults to fetch
+            negative_ttl: Seconds to keep a fetched value rejected by cache_if, None to not keep it
+        """
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, fetched_at, negative = entry
+            if negative:
+                self._count('negative')
+                return value
+            age = time.monotonic() - fetched_at
+            if age < soft_ttl:
+                self._count('fresh')
+                return value
+            if age < hard_ttl:
+                self._count('stale')
+                self._submit_refresh(key, refresh or fetch, hard_ttl, cache_if)
+                return value
+
+        self._count('miss')
+        value = fetch()
+        if cache_if is None or cache_if(value):
+            self._entries.set(key, (value, time.monotonic(), False), ttl=hard_ttl)
+        elif negative_ttl:
+            self._entries.set(key, (value, time.monotonic(), True), ttl=negative_ttl)
+        return value
+
+    def invalidate(self, key):
+        self._entries.invalidate(key)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counts, refreshing=len(self._refreshing), size=len(self._entries))
@@ -0,0 +1,137 @@
+import json
+import os
+import select
+import threading
+import logging
+from database import DatabaseHandler
+from metrics import change_notifications
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Constants
+CHANNEL = 'dataset_changed'
+# The listener is started on first use of a subscribed cache; set to 0 to never listen
+CHANGE_FEED_ENABLED = os.environ.get('CHANGE_FEED_ENABLED', '1').lower() in ('1', 'true', 'yes')
+POLL_TIMEOUT = 5          # seconds the listener blocks in select() before checking for shutdown
+MAX_RECONNECT_DELAY = 60  # seconds
+
+_subscribers = {}
+_subscribers_lock = threading.Lock()
+
+def subscribe(dataset, callback):
+    """
+    Call callback(payload) whenever dataset changes, in this or any other instance
+
+    payload is a dict with dataset and last_update (None on resynchronisation,
+    when notifications may have been missed).
+    """
+    with _subscribers_lock:
+        _subscribers.setdefault(dataset, []).append(callback)
+
+def dispatch(payload, origin='remote'):
+    """Run the callbacks subscribed to payload['dataset']"""
+    dataset = payload.get('dataset')
+    with _subscribers_lock:
+        callbacks = list(_subscribers.get(dataset, ()))
+    change_notifications.inc(dataset=dataset or 'unknown', origin=origin)
+    for callback in callbacks:
+        try:
+            callback(payload)
+        except Exception as e:
+            logger.warning(f"Change callback for {dataset} failed: {str(e)}")
+
+def notify_change(db_handler, dataset, last_update):
+    """
+    Announce that dataset was rewritten, once its data is committed
+
+    Sends NOTIFY on CHANNEL through db_handler, committing the current
+    transaction, then runs this process's callbacks directly so the updating
+    instance is consistent even without a listener.
+    """
+    payload = {'dataset': dataset, 'last_update': str(last_update) if last_update is not None else None}
+    db_handler.execute_query("SELECT pg_notify(%s, %s)", (CHANNEL, json.dumps(payload)))
+    dispatch(payload, origin='local')
+
+class ChangeListener:
+    """
+    Background thread that LISTENs on CHANNEL over a dedicated autocommit
+    connection and dispatches each notification to the subscribers
+
+    Reconnects with exponential backoff. After every (re)connect all subscribed
+    datasets are resynchronised, since notifications sent while disconnected are
+    lost. listening is True only while notifications are being received, so
+    caches can fall back to short TTLs otherwise.
+    """
+
+    def __init__(self):
+        self.listening = False
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='change-feed-listener', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        failures = 0
+        while not self._stop.is_set():
+            db_handler = DatabaseHandler()
+            db_handler.connect()
+            try:
+                if db_handler.conn is None:
+                    raise ConnectionError("database unavailable")
+                db_handler.conn.autocommit = True
+                db_handler.cur.execute(f"LISTEN {CHANNEL}")
+                self.listening = True
+                failures = 0
+                logger.info(f"Listening for dataset changes on {CHANNEL}")
+                self._resync()
+                self._listen(db_handler.conn)
+            except Exception as e:
+                failures += 1
+                delay = min(MAX_RECONNECT_DELAY, 2 ** failures)
+                logger.warning(f"Change feed listener disconnected: {str(e)}. Reconnecting in {delay}s")
+                self._stop.wait(delay)
+            finally:
+                self.listening = False
+                db_handler.close()
+
+    def _listen(self, conn):
+        while not self._stop.is_set():
+            if select.select([conn], [], [], POLL_TIMEOUT) == ([], [], []):
+                continue
+            conn.poll()
+            while conn.notifies:
+                notification = conn.notifies.pop(0)
+                try:
+                    payload = json.loads(notification.payload)
+                except ValueError:
+                    logger.warning(f"Ignoring malformed change notification: {notification.payload!r}")
+                    continue
+                dispatch(payload)
+
+    def _resync(self):
+        with _subscribers_lock:
+            datasets = list(_subscribers)
+        for dataset in datasets:
+            dispatch({'dataset': dataset, 'last_update': None}, origin='resync')
+
+listener = ChangeListener()
+
+def ensure_listening():
+    """
+    Start the listener if CHANGE_FEED_ENABLED; returns whether notifications are
+    currently being received
+    """
+    if not CHANGE_FEED_ENABLED:
+        return False
+    listener.start()
+    return listener.listening
@@ -1,4 +1,6 @@
+import sys
 from database import DatabaseHandler
+from valuation_store import migrate_valuation_blobs
 
 
 db_handler = DatabaseHandler()
@@ -148,6 +150,86 @@ CREATE TABLE valuation (
 )
 """
 
+# Content-addressed store for the large valuation documents (stock_info, fetched_inputs, roic_data).
+# Identical payloads are stored once and referenced from valuation by their sha256 hash.
+valuation_blob_sql = """
+CREATE TABLE IF NOT EXISTS valuation_blob (
+    hash CHAR(64) PRIMARY KEY,         -- sha256 of the canonical JSON text
+    payload JSONB NOT NULL,
+    created_at TIMESTAMPTZ DEFAULT now()
+)
+"""
+
+valuation_blob_columns_sql = """
+ALTER TABLE valuation
+    ADD COLUMN IF NOT EXISTS stock_info_hash CHAR(64) REFERENCES valuation_blob (hash),
+    ADD COLUMN IF NOT EXISTS fetched_inputs_hash CHAR(64) REFERENCES valuation_blob (hash),
+    ADD COLUMN IF NOT EXISTS roic_data_hash CHAR(64) REFERENCES valuation_blob (hash)
+"""
+
+# Indexes for listing valuations by user or ticker, newest first (keyset pagination on valued_date, id)
+valuation_email_index_sql = """
+CREATE INDEX IF NOT EXISTS valuation_email_valued_date_idx
+    ON valuation (email, valued_date DESC, id DESC)
+"""
+
+valuation_symbol_index_sql = """
+CREATE INDEX IF NOT EXISTS valuation_symbol_valued_date_idx
+    ON valuation (symbol, valued_date DESC, id DESC)
+"""
+
+# Optional: only needed for JSONB containment queries (@>) on the documents. stock_info,
+# fetched_inputs and roic_data live in valuation_blob, so their index is on the blob payload
+valuation_jsonb_gin_index_sql = """
+CREATE INDEX IF NOT EXISTS valuation_inputs_gin_idx ON valuation USING GIN (inputs jsonb_path_ops);
+CREATE INDEX IF NOT EXISTS valuation_blob_payload_gin_idx ON valuation_blob USING GIN (payload jsonb_path_ops);
+"""
+
+# One row per source per update run: phase timings from the update trace, bytes, rows and outcome
+update_run_sql = """
+CREATE TABLE IF NOT EXISTS update_run (
+    id BIGSERIAL PRIMARY KEY,
+    run_id VARCHAR(64),                -- Shared by every source updated in the same batch
+    source VARCHAR(255) NOT NULL,      -- data_last_update name, e.g. beta_us
+    started_at TIMESTAMPTZ NOT NULL,
+    duration_ms REAL,
+    phases JSONB,                      -- Milliseconds per phase, e.g. {"clean.fetch": 512.9}
+    bytes_downloaded BIGINT,
+    rows_written INTEGER,
+    outcome VARCHAR(32),               -- updated, unchanged or failed
+    status_code INTEGER,
+    error TEXT
+)
+"""
+
+update_run_source_index_sql = """
+CREATE INDEX IF NOT EXISTS update_run_source_started_at_idx
+    ON update_run (source, started_at DESC, id DESC)
+"""
+
+# Queue of background update jobs; workers claim queued rows with FOR UPDATE SKIP LOCKED
+update_job_sql = """
+CREATE TABLE IF NOT EXISTS update_job (
+    id BIGSERIAL PRIMARY KEY,
+    run_id VARCHAR(64),                -- update_run.run_id of the sources this job updates
+    sources TEXT[] NOT NULL,           -- data_last_update names, in update order
+    status VARCHAR(16) NOT NULL DEFAULT 'queued',  -- queued, running, succeeded, partial or failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    current_source VARCHAR(255),
+    results JSONB NOT NULL DEFAULT '{}',           -- Per source: status_code, success, status or error
+    error TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    started_at TIMESTAMPTZ,
+    heartbeat_at TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ
+)
+"""
+
+update_job_queue_index_sql = """
+CREATE INDEX IF NOT EXISTS update_job_queued_idx
+    ON update_job (created_at, id) WHERE status IN ('queued', 'running')
+"""
+
 roic_sql = """CREATE TABLE roic (
     industry varchar(255),
     no_of_firms varchar(255),
@@ -172,4 +254,38 @@ country_risk__premium_sql = """CREATE TABLE country_risk_premium (
 
 
 
-db_handler.execute_query(valuation_sql)
\ No newline at end of file
+db_handler.execute_query(valuation_sql)
+db_handler.execute_query(valuation_email_index_sql)
+db_handler.execute_query(valuation_symbol_index_sql)
+db_handler.execute_query(valuation_blob_sql)
+db_handler.execute_query(valuation_blob_columns_sql)
+db_handler.execute_query(update_run_sql)
+db_handler.execute_query(update_run_source_index_sql)
+db_handler.execute_query(update_job_sql)
+db_handler.execute_query(update_job_queue_index_sql)
+
+# Create every table, e.g. on a fresh local Postgres: python create_table.py --all
+if '--all' in sys.argv:
+    for sql in [
+        data_last_update_sql,
+        effective_tax_rate_sql,
+        sales_to_cap_us_sql,
+        beta_us_sql,
+        pe_ratio_us_sql,
+        rev_growth_rate_sql,
+        ebit_growth_sql,
+        default_spread_large_firm_sql,
+        default_spread_small_firm_sql,
+        input_stats_sql,
+        roic_sql,
+        country_risk__premium_sql
+    ]:
+        db_handler.execute_query(sql)
+
+# JSONB containment indexes on valuation inputs and blob payloads: python create_table.py --gin-indexes
+if '--gin-indexes' in sys.argv:
+    db_handler.execute_query(valuation_jsonb_gin_index_sql)
+
+# Move inline documents of existing valuation rows into valuation_blob: python create_table.py --migrate-blobs
+if '--migrate-blobs' in sys.argv:
+    print(f"Migrated {migrate_valuation_blobs(db_handler)} valuations")
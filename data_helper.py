@@ -5,47 +5,43 @@ from bs4 import BeautifulSoup
 from flask import jsonify
 from datetime import datetime
 import math
-import time
 import logging
-from functools import wraps
+from metrics import instrument_session
+from retry import CircuitOpenError, DeadlineExceeded, bounded_timeout, breaker_for, retry_call
+from tracing import span
+from upstream_replay import install as install_upstream_mode
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
 # Constants
-MAX_RETRIES = 3
-RETRY_DELAY = 2  # seconds
-REQUEST_TIMEOUT = 30  # seconds
+MAX_ATTEMPTS = 3
+REQUEST_TIMEOUT = 30  # seconds, per attempt
 
-def retry_on_failure(max_retries=MAX_RETRIES, delay=RETRY_DELAY):
-    """
-    Decorator to retry functions on failure with exponential backoff
-    """
-    def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            for attempt in range(max_retries):
-                try:
-                    return func(*args, **kwargs)
-                except Exception as e:
-                    if attempt == max_retries - 1:
-                        logger.error(f"Failed after {max_retries} attempts in {func.__name__}: {str(e)}")
-                        raise
-                    wait_time = delay * (2 ** attempt)  # Exponential backoff
-                    logger.warning(f"Attempt {attempt + 1} failed in {func.__name__}: {str(e)}. Retrying in {wait_time}s...")
-                    time.sleep(wait_time)
-            return None
-        return wrapper
-    return decorator
+# Shared session so connections to pages.stern.nyu.edu are reused across tables;
+# UPSTREAM_MODE=record/replay and the upstream metrics hook in here
+http_session = instrument_session(install_upstream_mode(requests.Session()))
 
 def fetch_url_with_retry(url, timeout=REQUEST_TIMEOUT):
     """
-    Fetch URL content with retry logic and timeout
+    Fetch URL content, retrying timeouts, connection errors and 429/5xx responses
+
+    Each attempt's timeout and the backoff between attempts are capped by the
+    current run deadline (see retry.deadline_scope), and a host that keeps failing
+    trips its circuit breaker so later fetches fail fast.
     """
-    try:
-        response = requests.get(url, verify=False, timeout=timeout)
+    def attempt():
+        with span('fetch', url=url) as fetch_span:
+            response = http_session.get(url, verify=False, timeout=bounded_timeout(timeout))
+            fetch_span.set(status=response.status_code, bytes=len(response.content))
         response.raise_for_status()
         return response
+
+    try:
+        return retry_call(attempt, attempts=MAX_ATTEMPTS, breaker=breaker_for(url))
+    except (DeadlineExceeded, CircuitOpenError) as e:
+        logger.error(f"Not fetching {url}: {str(e)}")
+        raise
     except requests.exceptions.Timeout:
         logger.error(f"Timeout while fetching {url}")
         raise Exception(f"Request timeout after {timeout} seconds")
@@ -54,7 +50,6 @@ def fetch_url_with_retry(url, timeout=REQUEST_TIMEOUT):
         raise Exception(f"Failed to fetch URL: {str(e)}")
 
 #returns the data in tuple
-@retry_on_failure()
 def clean_crp_table():
     try:
         # URL of the page
@@ -65,13 +60,16 @@ def clean_crp_table():
         response = fetch_url_with_retry(url)
 
         # Parse the HTML content
-        soup = BeautifulSoup(response.text, 'html.parser')
+        with span('soup'):
+            soup = BeautifulSoup(response.text, 'html.parser')
 
         # Wrap the HTML content in StringIO
         html_content = StringIO(response.text)
 
         # Use pandas to read the HTML content and extract tables
-        tables = pd.read_html(html_content)
+        with span('read_html') as parse_span:
+            tables = pd.read_html(html_content)
+            parse_span.set(tables=len(tables))
   
         
         # Assume the second table is the one we need
@@ -110,7 +108,6 @@ def clean_crp_table():
         return None, str(e)
 
 #returns the data in tuple
-@retry_on_failure()
 def clean_taxRate_table():
     try:
         # URL of the page
@@ -121,13 +118,16 @@ def clean_taxRate_table():
         response = fetch_url_with_retry(url)
 
         # Parse the HTML content
-        soup = BeautifulSoup(response.text, 'html.parser')
+        with span('soup'):
+            soup = BeautifulSoup(response.text, 'html.parser')
 
         # Wrap the HTML content in StringIO
         html_content = StringIO(response.text)
 
         # Use pandas to read the HTML content and extract tables
-        tables = pd.read_html(html_content)
+        with span('read_html') as parse_span:
+            tables = pd.read_html(html_content)
+            parse_span.set(tables=len(tables))
         
         # Assume the first table is the one we need
         df = tables[0]
@@ -159,7 +159,6 @@ def clean_taxRate_table():
         return None, str(e)
     
 #returns the data in tuple
-@retry_on_failure()
 def clean_sales_to_cap_us():
     try:
         # URL of the page
@@ -170,13 +169,16 @@ def clean_sales_to_cap_us():
         response = fetch_url_with_retry(url)
 
         # Parse the HTML content
-        soup = BeautifulSoup(response.text, 'html.parser')
+        with span('soup'):
+            soup = BeautifulSoup(response.text, 'html.parser')
 
         # Wrap the HTML content in StringIO
         html_content = StringIO(response.text)
 
         # Use pandas to read the HTML content and extract tables
-        tables = pd.read_html(html_content)
+        with span('read_html') as parse_span:
+            tables = pd.read_html(html_content)
+            parse_span.set(tables=len(tables))
         
         # Assume the first table is the one we need
         df = tables[0]
@@ -209,7 +211,6 @@ def clean_sales_to_cap_us():
 
 
 #returns the data in tuple
-@retry_on_failure()
 def clean_beta_us():
     try:
         # URL of the page
@@ -220,13 +221,16 @@ def clean_beta_us():
         response = fetch_url_with_retry(url)
 
         # Parse the HTML content
-        soup = BeautifulSoup(response.text, 'html.parser')
+        with span('soup'):
+            soup = BeautifulSoup(response.text, 'html.parser')
 
         # Wrap the HTML content in StringIO
         html_content = StringIO(response.text)
 
         # Use pandas to read the HTML content and extract tables
-        tables = pd.read_html(html_content)
+        with span('read_html') as parse_span:
+            tables = pd.read_html(html_content)
+            parse_span.set(tables=len(tables))
         
         # Assume the first table is the one we need
         df = tables[0]
@@ -257,12 +261,12 @@ def clean_beta_us():
     except Exception as e:
         return None, str(e)
     
-@retry_on_failure()
 def getLastUpdate(url,textToFind):
     logger.info(f"Getting last update from {url}")
     response = fetch_url_with_retry(url)
 
-    soup = BeautifulSoup(response.text, 'html.parser')
+    with span('soup'):
+        soup = BeautifulSoup(response.text, 'html.parser')
 
     # Extract the "Last updated..." text
     last_updated_text = soup.find(text=lambda t: t and textToFind in t)
@@ -277,7 +281,6 @@ def getLastUpdate(url,textToFind):
     return None
 
 #returns the data in tuple
-@retry_on_failure()
 def clean_pe_ratio_us():
     try:
         # URL of the page
@@ -288,13 +291,16 @@ def clean_pe_ratio_us():
         response = fetch_url_with_retry(url)
 
         # Parse the HTML content
-        soup = BeautifulSoup(response.text, 'html.parser')
+        with span('soup'):
+            soup = BeautifulSoup(response.text, 'html.parser')
 
         # Wrap the HTML content in StringIO
         html_content = StringIO(response.text)
 
         # Use pandas to read the HTML content and extract tables
-        tables = pd.read_html(html_content)
+        with span('read_html') as parse_span:
+            tables = pd.read_html(html_content)
+            parse_span.set(tables=len(tables))
         
         # Assume the first table is the one we need
         df = tables[0]
@@ -326,7 +332,6 @@ def clean_pe_ratio_us():
         return None, str(e)
     
 #returns the data in tuple
-@retry_on_failure()
 def clean_rev_growth_rate():
     try:
         # URL of the page
@@ -337,13 +342,16 @@ def clean_rev_growth_rate():
         response = fetch_url_with_retry(url)
 
         # Parse the HTML content
-        soup = BeautifulSoup(response.text, 'html.parser')
+        with span('soup'):
+            soup = BeautifulSoup(response.text, 'html.parser')
 
         # Wrap the HTML content in StringIO
         html_content = StringIO(response.text)
 
         # Use pandas to read the HTML content and extract tables
-        tables = pd.read_html(html_content)
+        with span('read_html') as parse_span:
+            tables = pd.read_html(html_content)
+            parse_span.set(tables=len(tables))
         
         # Assume the first table is the one we need
         df = tables[0]
@@ -375,7 +383,6 @@ def clean_rev_growth_rate():
         return None, str(e)
 
 #returns the data in tuple
-@retry_on_failure()
 def clean_ebit_growth():
     try:
         # URL of the page
@@ -386,13 +393,16 @@ def clean_ebit_growth():
         response = fetch_url_with_retry(url)
 
         # Parse the HTML content
-        soup = BeautifulSoup(response.text, 'html.parser')
+        with span('soup'):
+            soup = BeautifulSoup(response.text, 'html.parser')
 
         # Wrap the HTML content in StringIO
         html_content = StringIO(response.text)
 
         # Use pandas to read the HTML content and extract tables
-        tables = pd.read_html(html_content)
+        with span('read_html') as parse_span:
+            tables = pd.read_html(html_content)
+            parse_span.set(tables=len(tables))
         
         # Assume the first table is the one we need
         df = tables[0]
@@ -424,7 +434,6 @@ def clean_ebit_growth():
         return None, str(e)
 
 #returns the data in tuple
-@retry_on_failure()
 def clean_default_spread():
     try:
         # URL of the page
@@ -435,13 +444,16 @@ def clean_default_spread():
         response = fetch_url_with_retry(url)
 
         # Parse the HTML content
-        soup = BeautifulSoup(response.text, 'html.parser')
+        with span('soup'):
+            soup = BeautifulSoup(response.text, 'html.parser')
 
         # Wrap the HTML content in StringIO
         html_content = StringIO(response.text)
 
         # Use pandas to read the HTML content and extract tables
-        tables = pd.read_html(html_content)
+        with span('read_html') as parse_span:
+            tables = pd.read_html(html_content)
+            parse_span.set(tables=len(tables))
         # Assume the first table is the one we need
         df = tables[0]
 
@@ -483,12 +495,12 @@ def clean_string(s):
     return s
 
 
-@retry_on_failure()
 def getLastUpdate(url,textToFind):
     logger.info(f"Getting last update from {url}")
     response = fetch_url_with_retry(url)
 
-    soup = BeautifulSoup(response.text, 'html.parser')
+    with span('soup'):
+        soup = BeautifulSoup(response.text, 'html.parser')
 
     # Extract the "Last updated..." text
     last_updated_text = soup.find(text=lambda t: t and textToFind in t)
@@ -504,12 +516,12 @@ def getLastUpdate(url,textToFind):
     return None
 
 
-@retry_on_failure()
 def getLastUpdate_crp(url,textToFind):
     logger.info(f"Getting last update from {url}")
     response = fetch_url_with_retry(url)
 
-    soup = BeautifulSoup(response.text, 'html.parser')
+    with span('soup'):
+        soup = BeautifulSoup(response.text, 'html.parser')
 
     # Extract the "Last updated..." text
     last_updated_text = soup.find(text=lambda t: t and textToFind in t)
@@ -524,7 +536,6 @@ def getLastUpdate_crp(url,textToFind):
     return None
 
 
-@retry_on_failure()
 def clean_roic_table():
     try:
         # URL of the page
@@ -535,13 +546,16 @@ def clean_roic_table():
         response = fetch_url_with_retry(url)
 
         # Parse the HTML content
-        soup = BeautifulSoup(response.text, 'html.parser')
+        with span('soup'):
+            soup = BeautifulSoup(response.text, 'html.parser')
 
         # Wrap the HTML content in StringIO
         html_content = StringIO(response.text)
 
         # Use pandas to read the HTML content and extract tables
-        tables = pd.read_html(html_content)
+        with span('read_html') as parse_span:
+            tables = pd.read_html(html_content)
+            parse_span.set(tables=len(tables))
         
         # Assume the first table is the one we need
         df = tables[0]
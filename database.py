@@ -1,17 +1,40 @@
+import os
+from functools import wraps
 import psycopg2
+from psycopg2.extras import execute_values
+from metrics import db_errors, db_query_seconds
+
+def timed(operation):
+    """Record the call's latency, and raised errors, under db_query_duration_seconds{operation}"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                with db_query_seconds.time(operation=operation):
+                    return func(*args, **kwargs)
+            except Exception:
+                db_errors.inc(operation=operation)
+                raise
+        return wrapper
+    return decorator
 
 class DatabaseHandler:
     def __init__(self):
+        # DATABASE_URL or the standard PG* variables point the app at another
+        # database, e.g. a local Postgres for offline replay runs
         self.db_params = {
-            'dbname': 'verceldb',
-            'user': 'default',
-            'password': 'bsCa5Up6lhTG',
-            'host': 'ep-noisy-waterfall-a1jfpfg9.ap-southeast-1.aws.neon.tech',
-            'port': '5432'
+            'dbname': os.environ.get('PGDATABASE', 'verceldb'),
+            'user': os.environ.get('PGUSER', 'default'),
+            'password': os.environ.get('PGPASSWORD', 'bsCa5Up6lhTG'),
+            'host': os.environ.get('PGHOST', 'ep-noisy-waterfall-a1jfpfg9.ap-southeast-1.aws.neon.tech'),
+            'port': os.environ.get('PGPORT', '5432')
         }
+        if os.environ.get('DATABASE_URL'):
+            self.db_params = {'dsn': os.environ['DATABASE_URL']}
         self.conn = None
         self.cur = None
 
+    @timed('connect')
     def connect(self):
         """Establish a connection to the PostgreSQL database."""
         try:
@@ -19,10 +42,12 @@ class DatabaseHandler:
             self.cur = self.conn.cursor()
             print("Database connection established.")
         except Exception as e:
+            db_errors.inc(operation='connect')
             print(f"An error occurred while connecting to the database: {e}")
             self.conn = None
             self.cur = None
 
+    @timed('execute')
     def execute_query(self, query, params=None):
         """Execute a query and commit the transaction."""
         try:
@@ -32,18 +57,22 @@ class DatabaseHandler:
                 self.cur.execute(query)
             self.conn.commit()
         except Exception as e:
+            db_errors.inc(operation='execute')
             print(f"An error occurred: {e}")
             self.conn.rollback()
 
+    @timed('execute_many')
     def execute_query_many(self, query, data):
         """Execute a query with multiple sets of parameters."""
         try:
             self.cur.executemany(query, data)
             self.conn.commit()
         except Exception as e:
+            db_errors.inc(operation='execute_many')
             print(f"An error occurred: {e}")
             self.conn.rollback()
 
+    @timed('fetch')
     def fetch_query(self, query, params=None):
         """Execute a SELECT query and return the results."""
         try:
@@ -53,9 +82,25 @@ class DatabaseHandler:
                 self.cur.execute(query)
             return self.cur.fetchall()
         except Exception as e:
+            db_errors.inc(operation='fetch')
             print(f"An error occurred: {e}")
             return None
 
+    @timed('execute_values')
+    def execute_values(self, query, data, template=None, page_size=100, fetch=False):
+        """
+        Execute a multi-row VALUES query without committing.
+
+        Used for writes that must share one transaction; call commit() afterwards.
+        Errors are raised so the caller can roll back the whole transaction.
+        """
+        return execute_values(self.cur, query, data, template=template, page_size=page_size, fetch=fetch)
+
+    @timed('commit')
+    def commit(self):
+        """Commit the current transaction."""
+        self.conn.commit()
+
     def rollback(self):
         """Rollback the current transaction."""
         try:
@@ -0,0 +1,84 @@
+from flask import request
+from werkzeug.http import remove_entity_headers
+import gzip
+import hashlib
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+# Constants
+MIN_COMPRESS_SIZE = 1024  # bytes, smaller bodies are not worth compressing
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+COMPRESSIBLE_MIMETYPES = ('application/json', 'text/html', 'text/plain', 'text/csv')
+ERROR_CACHE_CONTROL = 'no-store'  # sent instead of the route's policy on 4xx and 5xx responses
+
+def choose_encoding(accept_encodings):
+    """Pick the best supported content coding from the request's Accept-Encoding"""
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    # mtime=0 keeps the output deterministic so equal bodies get equal ETags
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+def init_http_cache(app, policies, min_compress_size=MIN_COMPRESS_SIZE):
+    """
+    Add caching headers, conditional responses and compression to GET responses
+
+    Args:
+        app: Flask app
+        policies: Dict mapping endpoint name to a Cache-Control value, or to a callable
+            taking the view arguments and returning one. The policy only applies to
+            200 and 304 responses; errors get no-store. Endpoints without a policy
+            get compression but no Cache-Control or ETag.
+        min_compress_size: Bodies smaller than this many bytes are sent uncompressed
+    """
+    @app.after_request
+    def apply_http_cache(response):
+        if request.method not in ('GET', 'HEAD') or response.direct_passthrough:
+            return response
+
+        policy = policies.get(request.endpoint)
+        if callable(policy):
+            policy = policy(**(request.view_args or {}))
+        if policy and response.status_code >= 400:
+            # Never let the edge serve a transient upstream failure or bad request for the policy's lifetime
+            response.headers['Cache-Control'] = ERROR_CACHE_CONTROL
+            return response
+        if policy and response.status_code in (200, 304):
+            response.headers['Cache-Control'] = policy
+
+        if response.status_code != 200 or response.headers.get('Content-Encoding'):
+            return response
+
+        body = response.get_data()
+        encoding = None
+        if len(body) >= min_compress_size and response.mimetype in COMPRESSIBLE_MIMETYPES:
+            encoding = choose_encoding(request.accept_encodings)
+            response.vary.add('Accept-Encoding')
+
+        # Strong ETag over the identity body; each content coding is a distinct representation
+        if policy and policy != 'no-store':
+            etag = hashlib.sha256(body).hexdigest()[:32]
+            if encoding:
+                etag = f"{etag}-{encoding}"
+            response.set_etag(etag)
+            if request.if_none_match.contains(etag) or request.if_none_match.star_tag:
+                response.status_code = 304
+                response.set_data(b'')
+                remove_entity_headers(response.headers)
+                del response.headers['Content-Length']
+                return response
+
+        if encoding:
+            response.set_data(compress(body, encoding))
+            response.headers['Content-Encoding'] = encoding
+        return response
@@ -1,65 +1,120 @@
-import csv
+from datetime import date
+from io import StringIO
+import argparse
+import pandas as pd
+from change_feed import notify_change
 from database import DatabaseHandler
 
-# Create an instance of DatabaseHandler
-db_handler = DatabaseHandler()
+# Constants
+INPUT_STATS_FILE = 'input_stats.csv'
+HEADER_ROWS = 2  # group names, then quartile names
 
-try:
-    # Connect to the database
-    db_handler.connect()
-    
-    # Initialize a list to store all data tuples
-    data_list = []
-    
-    # Read CSV file
-    with open('input_stats.csv', 'r') as file:
-        csv_reader = csv.reader(file)
-        
-        # Skip the first two header rows
-        next(csv_reader)
-        next(csv_reader)
+# input_stats columns, in CSV order (percent columns are stored as 7.93 for 7.93%)
+COLUMNS = ['industry', 'count'] + [
+    f"{group}_{statistic}"
+    for group in (
+        'revenue_growth_rate',
+        'pre_tax_operating_margin',
+        'sales_to_invested_capital',
+        'cost_of_capital',
+        'beta',
+        'debt_to_capital_ratio'
+    )
+    for statistic in ('first_quartile', 'median', 'third_quartile')
+]
 
-        # Process each row
-        for row in csv_reader:
-            try:
-                # Extract data
-                industry_group = row[0]
-                count = int(row[1].replace(',', '')) if row[1] else None
-                
-                # Extract other columns, converting to float where possible
-                data = [industry_group, count]
-                for value in row[2:]:
-                    try:
-                        data.append(float(value.strip('%')) if '%' in value else float(value))
-                    except ValueError:
-                        data.append(None)
+def read_input_stats(path=INPUT_STATS_FILE):
+    """
+    Parse input_stats.csv into a frame with one row per industry
 
-                # Convert all elements in the data list to strings
-                data = [str(item) if item is not None else None for item in data]
+    Every cell is read as text in one pass, then all numeric cells are parsed in
+    one vectorized pass: '%', thousands separators and spaces are stripped and
+    anything that is still not a number becomes NULL.
+    """
+    df = pd.read_csv(
+        path,
+        skiprows=HEADER_ROWS,
+        header=None,
+        names=COLUMNS,
+        usecols=range(len(COLUMNS)),
+        dtype=str,
+        encoding='utf-8-sig'
+    )
+    df['industry'] = df['industry'].str.strip()
+    df = df[df['industry'].notna() & (df['industry'] != '')].copy()
 
-                # Convert the list to a tuple and add to the data_list
-                data_list.append(tuple(data))
-            
-            except Exception as e:
-                print(f"An error occurred while processing row: {row}")
-                print(f"Error: {e}")
-    
-    # Insert all data into the database in one shot
-    if data_list:
-        sql_query = '''
-        INSERT INTO input_stats VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s,%s)
-        '''
-        
-        try:
-            db_handler.execute_query_many(sql_query, data_list)
-            print(f"Inserted {len(data_list)} rows successfully.")
-        except Exception as e:
-            print(f"An error occurred while inserting data: {e}")
+    numeric = COLUMNS[1:]
+    cells = pd.Series(df[numeric].to_numpy().ravel())
+    values = pd.to_numeric(cells.str.replace(r'[%,\s]', '', regex=True), errors='coerce')
+    df[numeric] = values.to_numpy().reshape(len(df), len(numeric))
+    df['count'] = df['count'].round().astype('Int64')
+    # The last row wins if an industry is listed twice; ON CONFLICT cannot update a row twice
+    return df.drop_duplicates(subset='industry', keep='last')
 
-except Exception as e:
-    print(f"An error occurred: {e}")
+def upsert_input_stats(db_handler, df):
+    """
+    Load df into input_stats and stamp data_last_update['input_stats'], in one transaction
 
-finally:
-    # Close the connection
-    db_handler.close()
-    print("Database connection closed.")
+    Rows are COPYed into a temporary staging table and merged with ON CONFLICT,
+    so reloading the same file updates rows instead of failing on the primary key.
+    Commits, then notifies subscribers that input_stats changed.
+
+    Returns:
+        Number of rows loaded
+    """
+    buffer = StringIO()
+    df.to_csv(buffer, index=False, header=False, na_rep='')
+    buffer.seek(0)
+
+    updates = ', '.join(f"{column} = EXCLUDED.{column}" for column in COLUMNS[1:])
+    loaded_on = date.today()
+    try:
+        db_handler.cur.execute(
+            "CREATE TEMP TABLE input_stats_staging (LIKE input_stats INCLUDING DEFAULTS) ON COMMIT DROP"
+        )
+        db_handler.cur.copy_expert(
+            f"COPY input_stats_staging ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+        db_handler.cur.execute(
+            f"""
+            INSERT INTO input_stats ({', '.join(COLUMNS)})
+            SELECT {', '.join(COLUMNS)} FROM input_stats_staging
+            ON CONFLICT (industry) DO UPDATE SET {updates}
+            """
+        )
+        db_handler.cur.execute(
+            """
+            INSERT INTO data_last_update (data_name, last_update) VALUES ('input_stats', %s)
+            ON CONFLICT (data_name) DO UPDATE SET last_update = EXCLUDED.last_update
+            """,
+            (loaded_on,)
+        )
+        db_handler.commit()
+    except Exception:
+        db_handler.rollback()
+        raise
+
+    notify_change(db_handler, 'input_stats', loaded_on)
+    return len(df)
+
+def main():
+    parser = argparse.ArgumentParser(description='Load input_stats.csv into the input_stats table')
+    parser.add_argument('path', nargs='?', default=INPUT_STATS_FILE)
+    args = parser.parse_args()
+
+    db_handler = DatabaseHandler()
+    try:
+        db_handler.connect()
+        df = read_input_stats(args.path)
+        rows = upsert_input_stats(db_handler, df)
+        print(f"Loaded {rows} rows into input_stats.")
+    except Exception as e:
+        print(f"An error occurred: {e}")
+    finally:
+        # Close the connection
+        db_handler.close()
+        print("Database connection closed.")
+
+if __name__ == '__main__':
+    main()
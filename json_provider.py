@@ -0,0 +1,79 @@
+from flask.json.provider import DefaultJSONProvider
+from datetime import date, datetime
+from decimal import Decimal
+import json
+import math
+import sys
+
+try:
+    import orjson
+except ImportError:  # fall back to the stdlib encoder
+    orjson = None
+
+def _default(obj):
+    """Serialize types the encoder does not handle natively"""
+    if isinstance(obj, datetime):
+        # pandas Timestamp subclasses datetime; NaT is a datetime-like missing value
+        if obj != obj:
+            return None
+        return obj.isoformat()
+    if isinstance(obj, date):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    # NumPy values can only exist once something else imported numpy
+    np = sys.modules.get('numpy')
+    if np is not None:
+        if isinstance(obj, np.ndarray):
+            return obj.tolist()
+        if isinstance(obj, np.generic):
+            value = obj.item()
+            return None if isinstance(value, float) and math.isnan(value) else value
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    # pandas NA and NaT
+    if type(obj).__name__ in ('NAType', 'NaTType'):
+        return None
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def _replace_nan(obj):
+    """Stdlib fallback only: the json module writes NaN, which is not valid JSON"""
+    if isinstance(obj, float) and math.isnan(obj):
+        return None
+    if isinstance(obj, dict):
+        return {key: _replace_nan(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_replace_nan(value) for value in obj]
+    return obj
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider built on orjson
+
+    NumPy scalars and arrays, pandas Timestamps, dates, Decimals and NaN (as null)
+    are serialized natively, so views can return DataFrame values without
+    converting each cell to a Python float first. Falls back to the stdlib
+    encoder with the same conversions when orjson is not installed.
+    """
+
+    if orjson is not None:
+        options = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, obj, **kwargs):
+        if orjson is not None:
+            return orjson.dumps(obj, default=_default, option=self.options).decode('utf-8')
+        kwargs.setdefault('default', _default)
+        return json.dumps(_replace_nan(obj), **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is not None:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        if orjson is not None:
+            body = orjson.dumps(obj, default=_default, option=self.options)
+        else:
+            body = self.dumps(obj)
+        return self._app.response_class(body, mimetype=self.mimetype)
@@ -0,0 +1,264 @@
+import bisect
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Constants
+# Seconds; covers cache hits (ms) up to slow Stern scrapes and Neon cold starts
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    """
+    Base for labelled metrics
+
+    Each metric has its own lock held only for a dict lookup and a few additions,
+    so recording on hot paths does not serialize unrelated metrics.
+    """
+
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        lines.extend(self._render_samples(items))
+        return lines
+
+    def _render_samples(self, items):
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts (the last slot is +Inf), sum, count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with block, also when it raises"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _render_samples(self, items):
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+class _CallbackMetric:
+    """Metric whose samples are read from existing stats() dicts at scrape time"""
+
+    def __init__(self, name, documentation, type, labelnames, callback):
+        self.name = name
+        self.documentation = documentation
+        self.type = type
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        try:
+            samples = self.callback()
+        except Exception as e:
+            logger.warning(f"Could not collect {self.name}: {str(e)}")
+            return lines
+        for labels, value in samples:
+            values = tuple(labels.get(name, '') for name in self.labelnames)
+            lines.append(f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(value)}")
+        return lines
+
+class Registry:
+    """Holds every metric of the process and renders the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name, documentation, type, labelnames, callback):
+        """
+        Register a metric computed at scrape time
+
+        Args:
+            callback: Returns an iterable of (labels dict, value)
+        """
+        return self._register(_CallbackMetric(name, documentation, type, labelnames, callback))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+# Process-wide registry and the metrics recorded by the shared modules. On Vercel
+# each warm instance keeps its own values, so scrape every instance or aggregate.
+registry = Registry()
+
+http_request_seconds = registry.histogram(
+    'http_request_duration_seconds', 'Flask request latency by endpoint', ('endpoint', 'method', 'status')
+)
+upstream_request_seconds = registry.histogram(
+    'upstream_request_duration_seconds', 'Outbound HTTP request latency by host', ('host',)
+)
+upstream_errors = registry.counter(
+    'upstream_request_errors_total', 'Outbound HTTP requests that failed or returned an error status', ('host', 'kind')
+)
+db_query_seconds = registry.histogram(
+    'db_query_duration_seconds', 'DatabaseHandler call latency by operation', ('operation',)
+)
+db_errors = registry.counter(
+    'db_query_errors_total', 'DatabaseHandler calls that raised', ('operation',)
+)
+update_rows_written = registry.counter(
+    'update_rows_written_total', 'Rows written by update_database_table', ('table',)
+)
+update_last_rows = registry.gauge(
+    'update_last_run_rows', 'Rows written by the latest update_database_table run', ('table',)
+)
+update_runs = registry.counter(
+    'update_runs_total', 'update_database_table runs by outcome', ('table', 'outcome')
+)
+change_notifications = registry.counter(
+    'change_feed_notifications_total', 'Dataset change notifications handled, by dataset and origin', ('dataset', 'origin')
+)
+
+def instrument_session(session):
+    """
+    Record latency and errors per host for every request made through session
+
+    Works for requests and curl_cffi sessions alike, since both route get/post
+    through request().
+    """
+    original_request = session.request
+
+    def request(method, url, *args, **kwargs):
+        host = urlsplit(url).hostname or 'unknown'
+        started = time.perf_counter()
+        try:
+            response = original_request(method, url, *args, **kwargs)
+        except Exception as e:
+            upstream_errors.inc(host=host, kind=type(e).__name__)
+            raise
+        finally:
+            upstream_request_seconds.observe(time.perf_counter() - started, host=host)
+        if response.status_code >= 400:
+            upstream_errors.inc(host=host, kind=f"http_{response.status_code}")
+        return response
+
+    session.request = request
+    return session
+
+def init_metrics(app):
+    """
+    Time every request of a Flask app by endpoint, method and status
+
+    Register before other after_request hooks (such as init_http_cache) so the
+    measured time includes them; Flask runs after_request hooks in reverse order.
+    """
+    from flask import g, request
+
+    @app.before_request
+    def start_timer():
+        g._metrics_started = time.perf_counter()
+
+    @app.after_request
+    def record_latency(response):
+        started = g.pop('_metrics_started', None)
+        if started is not None:
+            http_request_seconds.observe(
+                time.perf_counter() - started,
+                endpoint=request.endpoint or 'unmatched',
+                method=request.method,
+                status=response.status_code
+            )
+        return response
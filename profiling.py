@@ -0,0 +1,162 @@
+import collections
+import hmac
+import io
+import os
+import sys
+import time
+import logging
+from urllib.parse import parse_qsl, urlencode
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Constants
+# Profiling is only wired in when this is set, e.g. ENABLE_PROFILING=1 on a preview deployment
+ENABLE_PROFILING = os.environ.get('ENABLE_PROFILING', '').lower() in ('1', 'true', 'yes')
+# Profiled requests must send it in the X-Profile-Token header; profiling stays off without it
+PROFILING_TOKEN = os.environ.get('PROFILING_TOKEN')
+PROFILE_PARAM = '__profile'
+LIMIT_PARAM = '__profile_limit'
+DEFAULT_STATS_LIMIT = 60
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+class _StackTimer:
+    """
+    Deterministic stack profiler for the current thread via sys.setprofile
+
+    Accumulates wall time per exact call stack, including C functions, so short
+    requests that a sampler would miss still produce a complete flamegraph.
+    """
+
+    def __init__(self):
+        self.stack = []
+        self.times = collections.Counter()
+        self._last = None
+
+    def _profile(self, frame, event, arg):
+        now = time.perf_counter()
+        if self.stack:
+            self.times[tuple(self.stack)] += now - self._last
+        if event == 'call':
+            self.stack.append(_frame_label(frame))
+        elif event == 'c_call':
+            self.stack.append(f"builtin:{getattr(arg, '__qualname__', arg)}")
+        elif self.stack:  # return, c_return, c_exception
+            self.stack.pop()
+        self._last = time.perf_counter()
+
+    def __enter__(self):
+        sys.setprofile(self._profile)
+        return self
+
+    def __exit__(self, *exc_info):
+        sys.setprofile(None)
+
+    def collapsed(self):
+        """Brendan Gregg's collapsed stack format weighted in microseconds, for flamegraph.pl or speedscope"""
+        lines = []
+        for stack, seconds in self.times.most_common():
+            microseconds = int(seconds * 1e6)
+            if microseconds:
+                lines.append(f"{';'.join(stack)} {microseconds}\n")
+        return ''.join(lines)
+
+class ProfilerMiddleware:
+    """
+    WSGI middleware that profiles requests carrying ?__profile=
+
+        ?__profile=1           cProfile, stats sorted by cumulative time (?__profile_limit=N rows)
+        ?__profile=tottime     cProfile, sorted by own time
+        ?__profile=collapsed   time per call stack in collapsed format, for flamegraphs
+
+    The route runs as usual (including after_request hooks), but the response body
+    is replaced with the profile. Profiled requests must carry token in the
+    X-Profile-Token header; without a token every one is refused. Other requests
+    pass straight through.
+    """
+
+    def __init__(self, wsgi_app, token=PROFILING_TOKEN):
+        self.wsgi_app = wsgi_app
+        self.token = token
+
+    def __call__(self, environ, start_response):
+        query = parse_qsl(environ.get('QUERY_STRING', ''), keep_blank_values=True)
+        params = dict(query)
+        mode = params.get(PROFILE_PARAM)
+        if not mode or mode == '0':
+            return self.wsgi_app(environ, start_response)
+        supplied = environ.get('HTTP_X_PROFILE_TOKEN', '')
+        if not self.token or not hmac.compare_digest(supplied.encode('utf-8'), self.token.encode('utf-8')):
+            start_response('403 FORBIDDEN', [('Content-Type', 'text/plain')])
+            return [b"Profiling token required\n"]
+
+        # Hide the profiling parameters from the route
+        environ = dict(environ)
+        environ['QUERY_STRING'] = urlencode([(k, v) for k, v in query if not k.startswith(PROFILE_PARAM)])
+        captured = {}
+
+        def capture_start_response(status, headers, exc_info=None):
+            captured['status'] = status
+            return lambda data: None
+
+        def run():
+            app_iter = self.wsgi_app(environ, capture_start_response)
+            try:
+                return sum(len(chunk) for chunk in app_iter)
+            finally:
+                if hasattr(app_iter, 'close'):
+                    app_iter.close()
+
+        started = time.perf_counter()
+        if mode == 'collapsed':
+            with _StackTimer() as timer:
+                size = run()
+            body = timer.collapsed()
+        else:
+            import cProfile
+            import pstats
+            profiler = cProfile.Profile()
+            size = profiler.runcall(run)
+            out = io.StringIO()
+            try:
+                limit = int(params.get(LIMIT_PARAM, DEFAULT_STATS_LIMIT))
+            except ValueError:
+                limit = DEFAULT_STATS_LIMIT
+            stats = pstats.Stats(profiler, stream=out)
+            stats.sort_stats('tottime' if mode == 'tottime' else 'cumulative').print_stats(limit)
+            stats.print_callers(limit // 3)
+            body = out.getvalue()
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        if mode != 'collapsed':
+            # Collapsed output must stay pure "stack count" lines for flamegraph tools
+            body = f"# {environ.get('REQUEST_METHOD')} {environ.get('PATH_INFO')} -> {captured.get('status')}, {size} bytes, {elapsed_ms:.1f} ms\n" + body
+        logger.info(f"Profiled {environ.get('PATH_INFO')} ({mode}) in {elapsed_ms:.1f} ms")
+        payload = body.encode('utf-8')
+        start_response('200 OK', [
+            ('Content-Type', 'text/plain; charset=utf-8'),
+            ('Content-Length', str(len(payload))),
+            ('Cache-Control', 'no-store'),
+            ('X-Profiled-Status', str(captured.get('status'))),
+            ('X-Profiled-Bytes', str(size)),
+            ('X-Profiled-Time-Ms', f"{elapsed_ms:.1f}")
+        ])
+        return [payload]
+
+def init_profiling(app):
+    """
+    Wrap the Flask app in ProfilerMiddleware when ENABLE_PROFILING is set
+
+    Refuses to, and logs an error, unless PROFILING_TOKEN is set too: profiles expose
+    file paths and internals and let callers force slow runs of any route.
+    """
+    if not ENABLE_PROFILING:
+        return
+    if not PROFILING_TOKEN:
+        logger.error("ENABLE_PROFILING is set but PROFILING_TOKEN is not; request profiling stays disabled")
+        return
+    app.wsgi_app = ProfilerMiddleware(app.wsgi_app)
+    logger.warning("Request profiling is enabled (?__profile=1 with X-Profile-Token)")
@@ -0,0 +1,216 @@
+import contextvars
+import random
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Constants
+DEFAULT_ATTEMPTS = 3
+BASE_DELAY = 0.5   # seconds; backoff before attempt n is uniform in [0, min(MAX_DELAY, BASE_DELAY * 2**n)]
+MAX_DELAY = 8
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+BREAKER_FAILURE_THRESHOLD = 5  # consecutive failures that open a host's circuit
+BREAKER_RESET_TIMEOUT = 60     # seconds an open circuit waits before letting one probe through
+
+class DeadlineExceeded(Exception):
+    """The run's time budget ran out before the operation could (re)start"""
+
+class CircuitOpenError(Exception):
+    """The host's circuit is open after repeated failures; the call was not attempted"""
+
+    def __init__(self, host, retry_after):
+        super().__init__(f"{host} is failing, not retrying for {retry_after:.0f}s")
+        self.host = host
+        self.retry_after = retry_after
+
+class Deadline:
+    """An absolute point in time by which a run must finish"""
+
+    def __init__(self, seconds):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self):
+        return self.remaining() <= 0
+
+_deadline = contextvars.ContextVar('deadline', default=None)
+
+def current_deadline():
+    """The innermost active Deadline, or None when the caller set no budget"""
+    return _deadline.get()
+
+@contextmanager
+def deadline_scope(seconds):
+    """
+    Give the with block a time budget, propagated to every fetch inside it
+
+    Nested scopes can only shorten the budget, never extend the outer one.
+    """
+    outer = _deadline.get()
+    deadline = Deadline(seconds)
+    if outer is not None and outer.expires_at < deadline.expires_at:
+        deadline = outer
+    token = _deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _deadline.reset(token)
+
+def bounded_timeout(timeout):
+    """
+    Per-request timeout capped by the remaining deadline
+
+    Raises:
+        DeadlineExceeded: No budget is left
+    """
+    deadline = _deadline.get()
+    if deadline is None:
+        return timeout
+    remaining = deadline.remaining()
+    if remaining <= 0:
+        raise DeadlineExceeded("Run deadline exceeded")
+    return min(timeout, remaining)
+
+def is_retryable(error):
+    """Timeouts, connection failures and 408/429/5xx responses; parse and client errors are not"""
+    import requests
+    if isinstance(error, (requests.exceptions.Timeout, requests.exceptions.ConnectionError)):
+        return True
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        return error.response.status_code in RETRYABLE_STATUS
+    return False
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker for one upstream host
+
+    After failure_threshold consecutive failures the circuit opens and calls fail
+    immediately. Once reset_timeout has passed a single probe is let through; its
+    success closes the circuit, its failure opens it again.
+    """
+
+    def __init__(self, host, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            return 'half_open' if time.monotonic() - self._opened_at >= self.reset_timeout else 'open'
+
+    def allow(self):
+        """
+        Raises:
+            CircuitOpenError: The circuit is open, or half open with a probe already in flight
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return
+            waited = time.monotonic() - self._opened_at
+            if waited < self.reset_timeout or self._probing:
+                raise CircuitOpenError(self.host, max(1.0, self.reset_timeout - waited))
+            self._probing = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                if self._opened_at is None or self._probing:
+                    logger.warning(f"Opening circuit for {self.host} after {self._failures} consecutive failures")
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+    def release(self):
+        """End a call that says nothing about the host's health, e.g. a 404 or a local deadline, freeing the probe slot"""
+        with self._lock:
+            self._probing = False
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def breaker_for(url_or_host):
+    """The shared CircuitBreaker of a URL's host"""
+    host = urlsplit(url_or_host).hostname if '://' in url_or_host else url_or_host
+    with _breakers_lock:
+        breaker = _breakers.get(host)
+        if breaker is None:
+            breaker = _breakers[host] = CircuitBreaker(host)
+        return breaker
+
+def breaker_states():
+    with _breakers_lock:
+        return {host: breaker.state for host, breaker in _breakers.items()}
+
+def retry_call(func, attempts=DEFAULT_ATTEMPTS, base_delay=BASE_DELAY, max_delay=MAX_DELAY, retryable=is_retryable, breaker=None):
+    """
+    Call func until it succeeds, retrying retryable errors with full-jitter backoff
+
+    Backoff sleeps never outlast the current deadline: when the next sleep would,
+    the last error is raised instead. With a breaker, calls fail fast while the
+    host's circuit is open. Retryable errors count as failures and successes close
+    the circuit; any other outcome only frees a half-open probe slot, so the next
+    call probes again.
+
+    Args:
+        func: Callable taking no arguments
+        attempts: Maximum number of calls
+        retryable: Predicate deciding whether an exception is worth retrying
+        breaker: Optional CircuitBreaker of the upstream host
+
+    Raises:
+        CircuitOpenError: The breaker rejected the call
+        DeadlineExceeded: The deadline expired before the first attempt
+        The last exception from func when it is not retryable or retries are exhausted
+    """
+    for attempt in range(attempts):
+        deadline = _deadline.get()
+        if deadline is not None and deadline.expired:
+            raise DeadlineExceeded("Run deadline exceeded")
+        if breaker is not None:
+            breaker.allow()
+        try:
+            result = func()
+        except Exception as e:
+            should_retry = retryable(e)
+            if breaker is not None:
+                if should_retry:
+                    breaker.record_failure()
+                else:
+                    breaker.release()
+            if not should_retry or attempt == attempts - 1:
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+            if deadline is not None and delay >= deadline.remaining():
+                logger.warning(f"Not retrying {getattr(func, '__name__', 'call')}: deadline too close")
+                raise
+            logger.warning(f"Attempt {attempt + 1} failed: {str(e)}. Retrying in {delay:.2f}s...")
+            time.sleep(delay)
+            continue
+        except BaseException:
+            if breaker is not None:
+                breaker.release()
+            raise
+        if breaker is not None:
+            breaker.record_success()
+        return result
@@ -2,6 +2,9 @@
 """
 Script to run all data scraping and update routes in one command.
 This script sends requests to all update endpoints and reports the results.
+
+    python run_all_scraping_updates.py [base_url]          # over HTTP, one at a time
+    python run_all_scraping_updates.py --direct --workers 4  # in process, no server needed
 """
 
 import requests
@@ -11,6 +14,7 @@ import logging
 from datetime import datetime
 from typing import Dict, List, Tuple
 import time
+import uuid
 
 # Configure logging
 logging.basicConfig(
@@ -25,7 +29,9 @@ logger = logging.getLogger(__name__)
 
 # Configuration
 BASE_URL = "http://localhost:5000"  # Change this to your server URL
-REQUEST_TIMEOUT = 300  # 5 minutes timeout for each request
+REQUEST_TIMEOUT = 60  # seconds per request; updates run as background jobs on the server
+JOB_TIMEOUT = 900  # seconds to wait for a queued update job to finish
+JOB_POLL_INTERVAL = 3  # seconds between job status polls
 
 # List of all update endpoints
 UPDATE_ENDPOINTS = [
@@ -40,7 +46,36 @@ UPDATE_ENDPOINTS = [
     '/update_roic'
 ]
 
-def run_update(endpoint: str, base_url: str = BASE_URL, timeout: int = REQUEST_TIMEOUT) -> Tuple[bool, str, Dict]:
+def report_result(endpoint: str, status_code: int, data: Dict) -> Tuple[bool, str, Dict]:
+    """
+    Log the outcome of one update and summarize it.
+
+    Args:
+        endpoint: The endpoint that was updated (e.g., '/update_beta_us')
+        status_code: HTTP status of the update
+        data: JSON body of the update response
+
+    Returns:
+        Tuple of (success, message, response_data)
+    """
+    if status_code == 200:
+        status = data.get('status', 'Unknown')
+
+        if 'inserted successfully' in status:
+            logger.info(f"✓ {endpoint}: Data updated successfully")
+            return True, status, data
+        elif 'same' in status:
+            logger.info(f"○ {endpoint}: Data is already up to date")
+            return True, status, data
+        else:
+            logger.info(f"✓ {endpoint}: {status}")
+            return True, status, data
+    else:
+        error_msg = data.get('error', 'Unknown error')
+        logger.error(f"✗ {endpoint}: Failed with status {status_code} - {error_msg}")
+        return False, f"HTTP {status_code}: {error_msg}", {}
+
+def run_update(endpoint: str, base_url: str = BASE_URL, timeout: int = REQUEST_TIMEOUT, run_id: str = None) -> Tuple[bool, str, Dict]:
     """
     Run a single update endpoint and return the result.
 
@@ -48,6 +83,7 @@ def run_update(endpoint: str, base_url: str = BASE_URL, timeout: int = REQUEST_T
         endpoint: The endpoint to call (e.g., '/update_country_risk_premium')
         base_url: Base URL of the Flask server
         timeout: Request timeout in seconds
+        run_id: Sent as X-Update-Run-Id so the server's update_run ledger groups this run's sources
 
     Returns:
         Tuple of (success, message, response_data)
@@ -56,25 +92,19 @@ def run_update(endpoint: str, base_url: str = BASE_URL, timeout: int = REQUEST_T
     logger.info(f"Starting update for: {endpoint}")
 
     try:
-        response = requests.get(url, timeout=timeout)
-
-        if response.status_code == 200:
-            data = response.json()
-            status = data.get('status', 'Unknown')
-
-            if 'inserted successfully' in status:
-                logger.info(f"✓ {endpoint}: Data updated successfully")
-                return True, status, data
-            elif 'same' in status:
-                logger.info(f"○ {endpoint}: Data is already up to date")
-                return True, status, data
-            else:
-                logger.info(f"✓ {endpoint}: {status}")
-                return True, status, data
+        headers = {'X-Update-Run-Id': run_id} if run_id else {}
+        response = requests.get(url, timeout=timeout, headers=headers)
+
+        if response.status_code == 202:
+            # The server queued a background job; poll it until it finishes
+            job = response.json()
+            logger.info(f"Queued {endpoint} as job {job['job_id']}")
+            status_code, data = wait_for_job(base_url, job['status_url'], job['sources'][0], timeout)
         else:
-            error_msg = response.json().get('error', 'Unknown error') if response.text else 'Unknown error'
-            logger.error(f"✗ {endpoint}: Failed with status {response.status_code} - {error_msg}")
-            return False, f"HTTP {response.status_code}: {error_msg}", {}
+            status_code = response.status_code
+            data = response.json() if response.text else {}
+
+        return report_result(endpoint, status_code, data)
 
     except requests.exceptions.Timeout:
         error_msg = f"Request timeout after {timeout} seconds"
@@ -89,13 +119,60 @@ def run_update(endpoint: str, base_url: str = BASE_URL, timeout: int = REQUEST_T
         logger.error(f"✗ {endpoint}: {error_msg}")
         return False, error_msg, {}
 
-def run_all_updates(base_url: str = BASE_URL, parallel: bool = False) -> Dict[str, Tuple[bool, str, Dict]]:
+def run_update_direct(endpoint: str, run_id: str = None) -> Tuple[bool, str, Dict]:
+    """
+    Run a single update in this process, without the HTTP hop.
+
+    Args:
+        endpoint: The endpoint whose update to run (e.g., '/update_country_risk_premium')
+        run_id: Recorded in the update_run ledger to group this run's sources
+
+    Returns:
+        Tuple of (success, message, response_data)
+    """
+    from app import run_update_source
+
+    logger.info(f"Starting update for: {endpoint}")
+    try:
+        result = run_update_source(endpoint[len('/update_'):], run_id)
+        return report_result(endpoint, result['status_code'], result)
+    except Exception as e:
+        error_msg = f"Unexpected error: {str(e)}"
+        logger.error(f"✗ {endpoint}: {error_msg}")
+        return False, error_msg, {}
+
+def wait_for_job(base_url: str, status_url: str, source: str, timeout: int = REQUEST_TIMEOUT) -> Tuple[int, Dict]:
+    """
+    Poll a queued update job until it finishes.
+
+    Args:
+        base_url: Base URL of the Flask server
+        status_url: The job's status URL from the 202 response, e.g. /jobs/42
+        source: Source whose result to return
+        timeout: Timeout of each status request in seconds
+
+    Returns:
+        Tuple of (status code of the source's update, its result), like a synchronous call
+    """
+    deadline = time.time() + JOB_TIMEOUT
+    while time.time() < deadline:
+        job = requests.get(f"{base_url}{status_url}", timeout=timeout).json()
+        if job.get('status') in ('succeeded', 'partial', 'failed'):
+            result = job['results'].get(source)
+            if result is None:
+                return 500, {'error': job.get('error') or 'Job finished without a result'}
+            return result['status_code'], result
+        time.sleep(JOB_POLL_INTERVAL)
+    return 504, {'error': f"Job did not finish within {JOB_TIMEOUT} seconds"}
+
+def run_all_updates(base_url: str = BASE_URL, direct: bool = False, workers: int = 1) -> Dict[str, Tuple[bool, str, Dict]]:
     """
     Run all update endpoints.
 
     Args:
         base_url: Base URL of the Flask server
-        parallel: If True, run updates in parallel (not implemented yet, sequential for safety)
+        direct: If True, run the updates in this process instead of over HTTP
+        workers: Number of updates run at the same time
 
     Returns:
         Dictionary mapping endpoint names to their results
@@ -106,13 +183,30 @@ def run_all_updates(base_url: str = BASE_URL, parallel: bool = False) -> Dict[st
 
     start_time = time.time()
     results = {}
+    run_id = uuid.uuid4().hex
+    logger.info(f"Run id: {run_id} (see /update_runs on the server)")
 
-    for endpoint in UPDATE_ENDPOINTS:
-        success, message, data = run_update(endpoint, base_url)
-        results[endpoint] = (success, message, data)
+    if direct:
+        import app  # noqa: F401  Import the update pipeline once, before the workers start
 
-        # Small delay between requests to avoid overwhelming the server
-        time.sleep(1)
+        def run(endpoint):
+            return run_update_direct(endpoint, run_id=run_id)
+    else:
+        def run(endpoint):
+            return run_update(endpoint, base_url, run_id=run_id)
+
+    if workers > 1:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='update') as executor:
+            for endpoint, result in zip(UPDATE_ENDPOINTS, executor.map(run, UPDATE_ENDPOINTS)):
+                results[endpoint] = result
+    else:
+        for endpoint in UPDATE_ENDPOINTS:
+            results[endpoint] = run(endpoint)
+
+            if not direct:
+                # Small delay between requests to avoid overwhelming the server
+                time.sleep(1)
 
     elapsed_time = time.time() - start_time
 
@@ -143,25 +237,33 @@ def main():
     """
     Main entry point for the script.
     """
-    # Allow custom base URL from command line
-    base_url = BASE_URL
-    if len(sys.argv) > 1:
-        base_url = sys.argv[1]
-        logger.info(f"Using custom base URL: {base_url}")
+    import argparse
+    parser = argparse.ArgumentParser(description='Run all data scraping and update routes')
+    parser.add_argument('base_url', nargs='?', default=BASE_URL, help=f"Flask server URL (default {BASE_URL})")
+    parser.add_argument('--direct', action='store_true', help='Run the updates in this process; no server needed')
+    parser.add_argument('--workers', type=int, default=1, help='Number of updates run at the same time')
+    args = parser.parse_args()
 
-    # Check if server is running
-    try:
-        logger.info(f"Checking if server is running at {base_url}...")
-        response = requests.get(base_url, timeout=5)
-        logger.info("✓ Server is running")
-    except requests.exceptions.RequestException as e:
-        logger.error(f"✗ Cannot connect to server at {base_url}")
-        logger.error(f"Error: {str(e)}")
-        logger.error("Please make sure the Flask server is running before executing this script.")
-        sys.exit(1)
+    if args.direct:
+        logger.info(f"Running updates in process with {args.workers} worker(s)")
+    else:
+        base_url = args.base_url
+        if base_url != BASE_URL:
+            logger.info(f"Using custom base URL: {base_url}")
+
+        # Check if server is running
+        try:
+            logger.info(f"Checking if server is running at {base_url}...")
+            requests.get(base_url, timeout=5)
+            logger.info("✓ Server is running")
+        except requests.exceptions.RequestException as e:
+            logger.error(f"✗ Cannot connect to server at {base_url}")
+            logger.error(f"Error: {str(e)}")
+            logger.error("Please make sure the Flask server is running before executing this script.")
+            sys.exit(1)
 
     # Run all updates
-    results = run_all_updates(base_url)
+    results = run_all_updates(args.base_url, direct=args.direct, workers=max(1, args.workers))
 
     # Exit with appropriate code
     failed_count = sum(1 for success, _, _ in results.values() if not success)
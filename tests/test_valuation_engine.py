@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+from insert_input_stats import read_input_stats
+from valuation_engine import POSITIVE_DRIVERS, correlation_matrix, quartiles_from_input_stats, sample_drivers
+
+@pytest.fixture(scope='module')
+def industry_quartiles():
+    """Quartiles of every industry in input_stats.csv"""
+    df = read_input_stats()
+    return {
+        row['industry']: quartiles_from_input_stats(row)
+        for row in df.astype(object).where(df.notna(), None).to_dict('records')
+    }
+
+@pytest.mark.parametrize('distribution', ['triangular', 'split_normal'])
+@pytest.mark.parametrize('correlated', [False, True])
+def test_positive_drivers_are_always_positive(industry_quartiles, distribution, correlated):
+    rng = np.random.default_rng(0)
+    for industry, quartiles in industry_quartiles.items():
+        cholesky = None
+        if correlated and {'sales_to_capital', 'beta'} <= set(quartiles):
+            cholesky = np.linalg.cholesky(correlation_matrix(list(quartiles), {'sales_to_capital:beta': -0.6}))
+        samples = sample_drivers(quartiles, 20000, rng, distribution, cholesky)
+        for driver in POSITIVE_DRIVERS:
+            if driver in samples:
+                assert samples[driver].min() > 0, f"{industry} {driver} drew {samples[driver].min()}"
+
+def test_positive_drivers_keep_their_quartiles():
+    quartiles = {'sales_to_capital': (0.5, 1.2, 3.0), 'beta': (0.6, 0.9, 1.2)}
+    samples = sample_drivers(quartiles, 200000, np.random.default_rng(0))
+    for driver, expected in quartiles.items():
+        assert np.percentile(samples[driver], [25, 50, 75]) == pytest.approx(expected, rel=0.02)
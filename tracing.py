@@ -0,0 +1,222 @@
+import contextvars
+import json
+import os
+import re
+import threading
+import time
+import uuid
+import logging
+from contextlib import contextmanager
+from functools import wraps
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Constants
+# Finished traces are appended to this file as JSON lines (Vercel: only /tmp is writable)
+TRACE_FILE = os.environ.get('TRACE_FILE')
+# Finished traces are POSTed as JSON to this collector URL
+TRACE_COLLECTOR_URL = os.environ.get('TRACE_COLLECTOR_URL')
+COLLECTOR_TIMEOUT = 2  # seconds
+# Spans deeper than this below the root are left out of the Server-Timing header
+SERVER_TIMING_DEPTH = 3
+# Cap on Server-Timing entries; /update_all covers every table
+SERVER_TIMING_MAX_ENTRIES = 64
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+_file_lock = threading.Lock()
+
+class Span:
+    """A timed phase with attributes such as row or byte counts, and its child spans"""
+
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent', 'attributes', 'children', 'start', 'duration', '_started')
+
+    def __init__(self, name, trace_id, parent=None, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent = parent
+        self.attributes = dict(attributes or {})
+        self.children = []
+        self.start = time.time()
+        self.duration = None
+        self._started = time.perf_counter()
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._started
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+        return self
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent.span_id if self.parent else None,
+            'start': self.start,
+            'duration_ms': round(self.duration * 1000, 3) if self.duration is not None else None,
+            'attributes': self.attributes,
+            'children': [child.to_dict() for child in self.children]
+        }
+
+class _NoopSpan:
+    """Returned when no trace is active, so instrumented code never checks"""
+
+    def set(self, **attributes):
+        return self
+
+NOOP_SPAN = _NoopSpan()
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Time the with block as a child of the current span
+
+    Does nothing unless a trace is active (see trace() and init_tracing()), so it
+    is safe to leave in code that also runs outside traced requests.
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield NOOP_SPAN
+        return
+
+    current = Span(name, parent.trace_id, parent, attributes)
+    parent.children.append(current)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.set(error=type(e).__name__)
+        raise
+    finally:
+        current.finish()
+        _current_span.reset(token)
+
+def current_span():
+    """The innermost active span, or None outside a trace"""
+    return _current_span.get()
+
+@contextmanager
+def span_or_trace(name, **attributes):
+    """Like span(), but starts a new trace when none is active so the caller always gets a real Span"""
+    if _current_span.get() is None:
+        with trace(name, **attributes) as root:
+            yield root
+    else:
+        with span(name, **attributes) as current:
+            yield current
+
+def traced(name=None):
+    """Decorator running the function inside span(name or the function name)"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name or func.__name__):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def start_trace(name, **attributes):
+    """
+    Start a trace rooted at a new span
+
+    Returns:
+        (root span, context token) to pass to finish_trace()
+    """
+    root = Span(name, uuid.uuid4().hex, attributes=attributes)
+    return root, _current_span.set(root)
+
+def finish_trace(root, token):
+    """Close the root span, restore the previous context and export the trace"""
+    root.finish()
+    try:
+        _current_span.reset(token)
+    except ValueError:
+        # Token created in another context; nothing to restore there
+        _current_span.set(None)
+    export(root)
+    return root
+
+@contextmanager
+def trace(name, **attributes):
+    """Run the with block as a new trace, e.g. in scripts calling clean_* directly"""
+    root, token = start_trace(name, **attributes)
+    try:
+        yield root
+    finally:
+        finish_trace(root, token)
+
+def export(root):
+    """Write the trace to TRACE_FILE and/or POST it to TRACE_COLLECTOR_URL, if configured"""
+    if not (TRACE_FILE or TRACE_COLLECTOR_URL):
+        return
+    payload = json.dumps(root.to_dict(), default=str)
+    if TRACE_FILE:
+        try:
+            with _file_lock, open(TRACE_FILE, 'a') as f:
+                f.write(payload + '\n')
+        except OSError as e:
+            logger.warning(f"Could not write trace to {TRACE_FILE}: {str(e)}")
+    if TRACE_COLLECTOR_URL:
+        try:
+            import requests
+            requests.post(
+                TRACE_COLLECTOR_URL,
+                data=payload,
+                headers={'Content-Type': 'application/json'},
+                timeout=COLLECTOR_TIMEOUT
+            )
+        except Exception as e:
+            logger.warning(f"Could not export trace to {TRACE_COLLECTOR_URL}: {str(e)}")
+
+def server_timing(root, max_depth=SERVER_TIMING_DEPTH):
+    """
+    Server-Timing header value listing the root and its spans as dotted paths
+
+    e.g. total;dur=812.4, clean;dur=640.2, clean.fetch;dur=512.9;desc="bytes=48211"
+    """
+    entries = [f"total;dur={root.duration * 1000:.1f}"]
+
+    def visit(current, path, depth):
+        for child in current.children:
+            name = re.sub(r'[^A-Za-z0-9_.-]', '_', f"{path}.{child.name}" if path else child.name)
+            entry = f"{name};dur={(child.duration or 0) * 1000:.1f}"
+            counts = [f"{key}={value}" for key, value in child.attributes.items() if isinstance(value, int)]
+            if counts:
+                entry += f';desc="{" ".join(counts)}"'
+            entries.append(entry)
+            if depth < max_depth:
+                visit(child, name, depth + 1)
+
+    visit(root, '', 1)
+    return ', '.join(entries[:SERVER_TIMING_MAX_ENTRIES])
+
+def init_tracing(app, endpoint_prefixes=('update_',)):
+    """
+    Trace every request to endpoints starting with one of endpoint_prefixes and
+    return the phase timings in a Server-Timing header
+    """
+    from flask import g, request
+
+    @app.before_request
+    def begin_trace():
+        if request.endpoint and request.endpoint.startswith(endpoint_prefixes):
+            g._trace = start_trace(request.endpoint, path=request.path)
+
+    @app.after_request
+    def add_server_timing(response):
+        started = g.pop('_trace', None)
+        if started is not None:
+            started[0].set(status=response.status_code)
+            root = finish_trace(*started)
+            response.headers['Server-Timing'] = server_timing(root)
+        return response
+
+    @app.teardown_request
+    def abandon_trace(error):
+        # after_request does not run when a view raises; still restore the context
+        started = g.pop('_trace', None)
+        if started is not None:
+            finish_trace(*started)
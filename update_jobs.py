@@ -0,0 +1,217 @@
+from psycopg2.extras import Json
+from database import DatabaseHandler
+import os
+import threading
+import time
+import logging
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Constants
+# Jobs processed at the same time by one process; each job updates its sources one by one
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '2'))
+JOB_POLL_INTERVAL = 5       # seconds between queue polls of a long-running worker
+STALE_JOB_SECONDS = 600     # a running job without a heartbeat for this long is reclaimed
+MAX_JOB_ATTEMPTS = 3
+
+JOB_COLUMNS = [
+    'id',
+    'run_id',
+    'sources',
+    'status',
+    'attempts',
+    'current_source',
+    'results',
+    'error',
+    'created_at',
+    'started_at',
+    'heartbeat_at',
+    'finished_at'
+]
+
+def enqueue_job(db_handler, sources, run_id):
+    """
+    Queue an update of sources and commit
+
+    Returns:
+        The new job id, or None when the insert failed
+    """
+    rows = db_handler.fetch_query(
+        "INSERT INTO update_job (run_id, sources) VALUES (%s, %s) RETURNING id",
+        (run_id, list(sources))
+    )
+    if not rows:
+        db_handler.rollback()
+        return None
+    db_handler.commit()
+    return rows[0][0]
+
+def claim_job(db_handler):
+    """
+    Mark the oldest queued job running and return it, or None when the queue is empty
+
+    Running jobs whose worker stopped sending heartbeats are reclaimed, or failed
+    once they used up MAX_JOB_ATTEMPTS. SKIP LOCKED lets any number of workers, in
+    any number of processes, claim concurrently without handing out a job twice.
+    """
+    db_handler.execute_query(
+        """
+        UPDATE update_job
+        SET status = 'failed', finished_at = now(), error = 'Worker stopped responding'
+        WHERE status = 'running' AND heartbeat_at < now() - make_interval(secs => %s) AND attempts >= %s
+        """,
+        (STALE_JOB_SECONDS, MAX_JOB_ATTEMPTS)
+    )
+    rows = db_handler.fetch_query(
+        """
+        UPDATE update_job
+        SET status = 'running', attempts = attempts + 1, started_at = now(), heartbeat_at = now()
+        WHERE id = (
+            SELECT id FROM update_job
+            WHERE status = 'queued'
+               OR (status = 'running' AND heartbeat_at < now() - make_interval(secs => %s))
+            ORDER BY created_at, id
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id, run_id, sources, results
+        """,
+        (STALE_JOB_SECONDS,)
+    )
+    if rows is None:
+        db_handler.rollback()
+        return None
+    db_handler.commit()
+    if not rows:
+        return None
+    job_id, run_id, sources, results = rows[0]
+    return {'id': job_id, 'run_id': run_id, 'sources': sources, 'results': results or {}}
+
+def record_progress(db_handler, job_id, current_source, results):
+    """Save the sources finished so far and refresh the job's heartbeat"""
+    db_handler.execute_query(
+        "UPDATE update_job SET current_source = %s, results = %s, heartbeat_at = now() WHERE id = %s",
+        (current_source, Json(results), job_id)
+    )
+
+def finish_job(db_handler, job_id, results, error=None):
+    """Close the job as succeeded, partial or failed from its per-source results"""
+    succeeded = sum(1 for result in results.values() if result.get('success'))
+    if error is None and succeeded == len(results):
+        status = 'succeeded'
+    elif succeeded:
+        status = 'partial'
+    else:
+        status = 'failed'
+    db_handler.execute_query(
+        """
+        UPDATE update_job
+        SET status = %s, current_source = NULL, results = %s, error = %s, finished_at = now(), heartbeat_at = now()
+        WHERE id = %s
+        """,
+        (status, Json(results), error, job_id)
+    )
+    return status
+
+def get_job(db_handler, job_id):
+    """The job as a dict with a progress summary, or None when it does not exist"""
+    rows = db_handler.fetch_query(
+        f"SELECT {', '.join(JOB_COLUMNS)} FROM update_job WHERE id = %s",
+        (job_id,)
+    )
+    if not rows:
+        return None
+    job = dict(zip(JOB_COLUMNS, rows[0]))
+    job['progress'] = {'done': len(job['results'] or {}), 'total': len(job['sources'])}
+    return job
+
+class JobWorker:
+    """
+    Processes queued update jobs with at most max_workers threads
+
+    run_source(source, run_id) updates one source and returns its result dict
+    (status_code, success, status or error, and the run's timings). wake()
+    starts threads up to max_workers; each claims jobs until the queue is empty,
+    then exits, so an idle process holds no threads or connections.
+    run_forever() is the loop of a dedicated worker process.
+    """
+
+    def __init__(self, run_source, max_workers=JOB_WORKERS):
+        self.run_source = run_source
+        self.max_workers = max(1, max_workers)
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def wake(self):
+        """Start worker threads up to max_workers; returns the running threads"""
+        with self._lock:
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            for _ in range(self.max_workers - len(self._threads)):
+                thread = threading.Thread(target=self.drain, name='update-job-worker', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            return list(self._threads)
+
+    def drain(self):
+        """Process jobs until the queue is empty; returns the number processed"""
+        processed = 0
+        while True:
+            db_handler = DatabaseHandler()
+            db_handler.connect()
+            if db_handler.conn is None:
+                return processed
+            try:
+                job = claim_job(db_handler)
+                if job is None:
+                    return processed
+                self.process(db_handler, job)
+                processed += 1
+            except Exception as e:
+                logger.error(f"Update job worker failed: {str(e)}", exc_info=True)
+                return processed
+            finally:
+                db_handler.close()
+
+    def process(self, db_handler, job):
+        """Update the job's sources in order, skipping those finished by an earlier attempt"""
+        logger.info(f"Running update job {job['id']}: {', '.join(job['sources'])}")
+        results = dict(job['results'])
+        error = None
+        try:
+            for source in job['sources']:
+                if source in results:
+                    continue
+                record_progress(db_handler, job['id'], source, results)
+                results[source] = self.run_source(source, job['run_id'])
+        except Exception as e:
+            logger.error(f"Update job {job['id']} failed: {str(e)}", exc_info=True)
+            error = str(e)
+        status = finish_job(db_handler, job['id'], results, error)
+        logger.info(f"Update job {job['id']} {status}")
+        return status
+
+    def run_forever(self, poll_interval=JOB_POLL_INTERVAL):
+        logger.info(f"Update job worker started with {self.max_workers} threads")
+        while True:
+            self.wake()
+            time.sleep(poll_interval)
+
+def main():
+    """Run a dedicated worker process: python update_jobs.py [--workers N]"""
+    import argparse
+    parser = argparse.ArgumentParser(description='Process queued update jobs')
+    parser.add_argument('--workers', type=int, default=JOB_WORKERS, help='Jobs processed at the same time')
+    parser.add_argument('--once', action='store_true', help='Exit once the queue is empty')
+    args = parser.parse_args()
+
+    from app import run_update_source
+    worker = JobWorker(run_update_source, max_workers=args.workers)
+    if args.once:
+        for thread in worker.wake():
+            thread.join()
+    else:
+        worker.run_forever()
+
+if __name__ == '__main__':
+    main()
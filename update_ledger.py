@@ -0,0 +1,166 @@
+from psycopg2.extras import Json
+import logging
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Constants
+DEFAULT_RUN_LIMIT = 50
+MAX_RUN_LIMIT = 500
+DEFAULT_BASELINE_WINDOW = 10   # previous successful runs forming the rolling baseline
+DEFAULT_REGRESSION_RATIO = 1.5 # latest / baseline median above which a phase is flagged
+MIN_BASELINE_RUNS = 3
+MIN_REGRESSION_MS = 50         # ignore slowdowns smaller than this, they are noise
+SUCCESSFUL_OUTCOMES = ('updated', 'unchanged')
+
+RUN_COLUMNS = [
+    'id',
+    'run_id',
+    'source',
+    'started_at',
+    'duration_ms',
+    'phases',
+    'bytes_downloaded',
+    'rows_written',
+    'outcome',
+    'status_code',
+    'error'
+]
+
+def phase_durations(run_span):
+    """
+    Milliseconds per phase of an update run, from its trace span
+
+    Direct children (clean, last_update, db_connect, truncate, insert, ...) are
+    reported by name and their children with dotted names (clean.fetch,
+    clean.read_html, last_update.fetch, ...). Repeated phases are summed.
+    """
+    phases = {}
+
+    def add(name, current):
+        phases[name] = round(phases.get(name, 0.0) + (current.duration or 0.0) * 1000, 3)
+
+    for phase in run_span.children:
+        add(phase.name, phase)
+        for step in phase.children:
+            add(f"{phase.name}.{step.name}", step)
+    return phases
+
+def _walk(current):
+    yield current
+    for child in current.children:
+        yield from _walk(child)
+
+def bytes_downloaded(run_span):
+    """Total response bytes of the fetch spans under run_span"""
+    return sum(
+        current.attributes.get('bytes', 0)
+        for current in _walk(run_span)
+        if current.name == 'fetch'
+    )
+
+def rows_written(run_span):
+    return sum(
+        current.attributes.get('rows', 0)
+        for current in run_span.children
+        if current.name == 'insert'
+    )
+
+def record_update_run(db_handler, run_id, source, run_span, outcome, status_code=None, error=None):
+    """
+    Store one source's update run in update_run and commit
+
+    Args:
+        db_handler: Connected DatabaseHandler
+        run_id: Identifier shared by every source updated in the same batch
+        source: data_last_update name of the source, e.g. 'beta_us'
+        run_span: Finished tracing span of the run, used for phase timings, bytes and rows
+        outcome: 'updated', 'unchanged' or an error outcome
+        status_code: HTTP status returned by the update route
+        error: Error message for failed runs
+    """
+    db_handler.execute_query(
+        """
+        INSERT INTO update_run
+            (run_id, source, started_at, duration_ms, phases, bytes_downloaded, rows_written, outcome, status_code, error)
+        VALUES (%s, %s, to_timestamp(%s), %s, %s, %s, %s, %s, %s, %s)
+        """,
+        (
+            run_id,
+            source,
+            run_span.start,
+            round((run_span.duration or 0.0) * 1000, 3),
+            Json(phase_durations(run_span)),
+            bytes_downloaded(run_span),
+            rows_written(run_span),
+            outcome,
+            status_code,
+            error
+        )
+    )
+
+def list_update_runs(db_handler, source=None, limit=DEFAULT_RUN_LIMIT):
+    """Most recent update runs, optionally for one source"""
+    where = "WHERE source = %s" if source else ""
+    params = (source, limit) if source else (limit,)
+    rows = db_handler.fetch_query(
+        f"SELECT {', '.join(RUN_COLUMNS)} FROM update_run {where} ORDER BY started_at DESC, id DESC LIMIT %s",
+        params
+    )
+    return [dict(zip(RUN_COLUMNS, row)) for row in rows or []]
+
+def find_regressions(
+    db_handler,
+    window=DEFAULT_BASELINE_WINDOW,
+    ratio=DEFAULT_REGRESSION_RATIO,
+    min_runs=MIN_BASELINE_RUNS,
+    min_delta_ms=MIN_REGRESSION_MS
+):
+    """
+    Phases whose duration in a source's latest successful run regressed against
+    the median of its previous window successful runs
+
+    Returns:
+        List of dicts with source, phase, latest_ms, baseline_ms, baseline_runs and ratio,
+        slowest regressions first
+    """
+    rows = db_handler.fetch_query(
+        """
+        WITH ranked AS (
+            SELECT source, phases,
+                   row_number() OVER (PARTITION BY source ORDER BY started_at DESC, id DESC) AS rn
+            FROM update_run
+            WHERE outcome = ANY(%s)
+        ),
+        phase_values AS (
+            SELECT r.source, r.rn, p.key AS phase, p.value::float AS ms
+            FROM ranked r, jsonb_each_text(r.phases) p
+            WHERE r.rn <= %s + 1
+        )
+        SELECT latest.source, latest.phase, latest.ms,
+               percentile_cont(0.5) WITHIN GROUP (ORDER BY baseline.ms),
+               count(baseline.ms)
+        FROM phase_values latest
+        JOIN phase_values baseline
+          ON baseline.source = latest.source AND baseline.phase = latest.phase AND baseline.rn > 1
+        WHERE latest.rn = 1
+        GROUP BY latest.source, latest.phase, latest.ms
+        """,
+        (list(SUCCESSFUL_OUTCOMES), window)
+    )
+
+    regressions = []
+    for source, phase, latest_ms, baseline_ms, baseline_runs in rows or []:
+        if baseline_runs < min_runs or not baseline_ms:
+            continue
+        if latest_ms > baseline_ms * ratio and latest_ms - baseline_ms >= min_delta_ms:
+            regressions.append({
+                'source': source,
+                'phase': phase,
+                'latest_ms': round(latest_ms, 1),
+                'baseline_ms': round(baseline_ms, 1),
+                'baseline_runs': baseline_runs,
+                'ratio': round(latest_ms / baseline_ms, 2)
+            })
+    regressions.sort(key=lambda item: item['latest_ms'] - item['baseline_ms'], reverse=True)
+    return regressions
@@ -0,0 +1,226 @@
+import atexit
+import os
+import random
+import statistics
+import uuid
+import logging
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from database import DatabaseHandler
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Constants
+# The in-process scheduler only runs when this is set; serverless deployments use the /update_due cron instead
+SCHEDULER_ENABLED = os.environ.get('SCHEDULER_ENABLED', '').lower() in ('1', 'true', 'yes')
+SCHEDULER_TICK = 900           # seconds between checks for due sources
+LOCK_NAMESPACE = 7201          # first key of every pg advisory lock taken here
+
+MIN_POLL_INTERVAL = timedelta(hours=12)
+MAX_POLL_INTERVAL = timedelta(days=30)
+# Until a source has changed twice in the ledger; country risk premiums change most often
+DEFAULT_POLL_INTERVAL = timedelta(days=7)
+DEFAULT_POLL_INTERVALS = {'country_risk_premium': timedelta(days=2)}
+CHANGE_FRACTION = 0.02         # poll this fraction of the median time between observed changes
+DUE_FRACTION = 0.8             # no backoff once this much of the median change gap has passed
+BACKOFF_FACTOR = 2             # per consecutive unchanged run
+FAILURE_RETRY_DELAY = timedelta(hours=1)  # doubled per consecutive failure, up to the poll interval
+JITTER = 0.1                   # +/- fraction of the interval, so instances and sources spread out
+CHANGE_HISTORY = 10            # 'updated' runs per source used for the cadence
+RECENT_RUNS = 20               # latest runs per source used for backoff
+
+@contextmanager
+def advisory_lock(name):
+    """
+    Try to take the Postgres session advisory lock for name, without waiting
+
+    Yields True when this process holds the lock for the with block. Holds a
+    dedicated autocommit connection, so the lock is released if the process dies.
+    Yields True without locking when the database is unreachable; the guarded work
+    then fails on its own connection.
+    """
+    db_handler = DatabaseHandler()
+    db_handler.connect()
+    if db_handler.conn is None:
+        logger.warning(f"Could not lock {name}: database unavailable")
+        yield True
+        return
+    db_handler.conn.autocommit = True
+    acquired = False
+    try:
+        rows = db_handler.fetch_query("SELECT pg_try_advisory_lock(%s, hashtext(%s))", (LOCK_NAMESPACE, name))
+        acquired = bool(rows and rows[0][0])
+        yield acquired
+    finally:
+        if acquired:
+            db_handler.fetch_query("SELECT pg_advisory_unlock(%s, hashtext(%s))", (LOCK_NAMESPACE, name))
+        db_handler.close()
+
+def load_history(db_handler, sources):
+    """
+    Update history of each source from the update_run ledger
+
+    Returns:
+        {source: {'changes': started_at of its latest 'updated' runs, 'recent': (started_at, outcome)
+        of its latest runs}}, newest first
+    """
+    history = {source: {'changes': [], 'recent': []} for source in sources}
+    changes = db_handler.fetch_query(
+        """
+        SELECT source, started_at FROM (
+            SELECT source, started_at,
+                   row_number() OVER (PARTITION BY source ORDER BY started_at DESC, id DESC) AS rn
+            FROM update_run
+            WHERE source = ANY(%s) AND outcome = 'updated'
+        ) r
+        WHERE rn <= %s
+        ORDER BY source, started_at DESC
+        """,
+        (list(sources), CHANGE_HISTORY)
+    )
+    recent = db_handler.fetch_query(
+        """
+        SELECT source, started_at, outcome FROM (
+            SELECT source, started_at, outcome,
+                   row_number() OVER (PARTITION BY source ORDER BY started_at DESC, id DESC) AS rn
+            FROM update_run
+            WHERE source = ANY(%s)
+        ) r
+        WHERE rn <= %s
+        ORDER BY source, started_at DESC
+        """,
+        (list(sources), RECENT_RUNS)
+    )
+    for source, started_at in changes or []:
+        history[source]['changes'].append(started_at)
+    for source, started_at, outcome in recent or []:
+        history[source]['recent'].append((started_at, outcome))
+    return history
+
+def _streak(recent, outcomes):
+    count = 0
+    for _, outcome in recent:
+        if outcome not in outcomes:
+            break
+        count += 1
+    return count
+
+def plan_source(source, changes, recent, now):
+    """
+    Next poll of one source from its change history
+
+    The base interval is CHANGE_FRACTION of the median gap between observed changes
+    (DEFAULT_POLL_INTERVALS until there are two). Consecutive unchanged runs back
+    off exponentially, except once a change is due by that cadence; consecutive
+    failures retry after FAILURE_RETRY_DELAY, doubling. Jitter is derived from the
+    source and its last run, so every instance computes the same time.
+
+    Returns:
+        Dict with source, reason, interval_hours, last_run, next_run and due
+    """
+    interval = DEFAULT_POLL_INTERVALS.get(source, DEFAULT_POLL_INTERVAL)
+    reason = 'default'
+    median_gap = None
+    if len(changes) >= 2:
+        median_gap = statistics.median(newer - older for newer, older in zip(changes, changes[1:]))
+        interval = median_gap * CHANGE_FRACTION
+        reason = 'cadence'
+    interval = min(max(interval, MIN_POLL_INTERVAL), MAX_POLL_INTERVAL)
+
+    failures = _streak(recent, ('failed',))
+    unchanged = _streak(recent, ('unchanged',))
+    if failures:
+        interval = min(interval, FAILURE_RETRY_DELAY * 2 ** (failures - 1))
+        reason = 'retry'
+    elif unchanged:
+        change_due = median_gap is not None and changes and now - changes[0] >= median_gap * DUE_FRACTION
+        if change_due:
+            reason = 'change_due'
+        else:
+            interval = min(interval * BACKOFF_FACTOR ** min(unchanged, 16), MAX_POLL_INTERVAL)
+            reason = 'backoff'
+
+    last_run = recent[0][0] if recent else None
+    if last_run is None:
+        next_run = now
+    else:
+        jitter = random.Random(f"{source}:{last_run.isoformat()}").uniform(-JITTER, JITTER)
+        next_run = last_run + interval * (1 + jitter)
+    return {
+        'source': source,
+        'reason': reason,
+        'interval_hours': round(interval.total_seconds() / 3600, 1),
+        'last_run': last_run,
+        'next_run': next_run,
+        'due': next_run <= now
+    }
+
+def plan_updates(db_handler, sources, now=None):
+    """Poll plan of every source, soonest first"""
+    now = now or datetime.now(timezone.utc)
+    history = load_history(db_handler, sources)
+    plan = [plan_source(source, history[source]['changes'], history[source]['recent'], now) for source in sources]
+    return sorted(plan, key=lambda item: item['next_run'])
+
+def run_due_updates(sources, run_source, run_id=None):
+    """
+    Update the sources whose poll time has come, one after another
+
+    Only one instance at a time plans and runs; the others return skipped.
+
+    Args:
+        sources: data_last_update names to consider
+        run_source: Callable(source, run_id) updating one source and returning its result dict
+        run_id: update_run run id shared by this batch, generated when None
+    """
+    with advisory_lock('update_scheduler') as acquired:
+        if not acquired:
+            logger.info("Skipping scheduled updates: another instance is running them")
+            return {'skipped': True, 'results': {}}
+
+        db_handler = DatabaseHandler()
+        db_handler.connect()
+        try:
+            plan = plan_updates(db_handler, sources)
+        finally:
+            db_handler.close()
+
+        run_id = run_id or uuid.uuid4().hex
+        due = [item['source'] for item in plan if item['due']]
+        logger.info(f"Scheduled updates due: {', '.join(due) or 'none'}")
+        results = {}
+        for source in due:
+            try:
+                results[source] = run_source(source, run_id)
+            except Exception as e:
+                logger.error(f"Scheduled update of {source} failed: {str(e)}", exc_info=True)
+                results[source] = {'success': False, 'error': str(e)}
+        return {'skipped': False, 'run_id': run_id, 'results': results, 'plan': plan}
+
+def init_scheduler(app, sources, run_source, tick=SCHEDULER_TICK):
+    """
+    Check for due sources every tick seconds in a background thread, when
+    SCHEDULER_ENABLED is set. Safe to enable on several instances: the advisory
+    locks let one of them run each source at a time.
+    """
+    if not SCHEDULER_ENABLED:
+        return None
+    from apscheduler.schedulers.background import BackgroundScheduler
+    from apscheduler.triggers.interval import IntervalTrigger
+
+    scheduler = BackgroundScheduler(daemon=True)
+    scheduler.add_job(
+        func=run_due_updates,
+        args=(list(sources), run_source),
+        trigger=IntervalTrigger(seconds=tick, jitter=tick * JITTER),
+        id='update_due',
+        name='Update the sources that are due',
+        max_instances=1,
+        coalesce=True,
+        replace_existing=True
+    )
+    scheduler.start()
+    atexit.register(lambda: scheduler.shutdown(wait=False))
+    logger.info(f"Update scheduler started, checking every {tick}s")
+    return scheduler
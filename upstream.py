@@ -0,0 +1,318 @@
+import heapq
+import re
+import itertools
+import threading
+import time
+import logging
+from cache import StaleWhileRevalidateCache
+from yahoo_session import get_session, save_state
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+class _Call:
+    """An in-flight upstream call that other callers can wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls with the same key into one execution
+
+    The first caller for a key runs the function; callers arriving while it is
+    in flight wait and receive the same result (or exception). Once the call
+    completes the key is released, so later callers trigger a fresh call.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._executed = 0
+        self._coalesced = 0
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self._executed += 1
+            else:
+                self._coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        """Counts of executed and coalesced calls and calls currently in flight"""
+        with self._lock:
+            return {
+                'executed': self._executed,
+                'coalesced': self._coalesced,
+                'in_flight': len(self._calls)
+            }
+
+# Priorities for the Yahoo rate limiter, lower is served first
+PRIORITY_INTERACTIVE = 0  # a user waiting on a single-ticker request
+PRIORITY_BATCH = 10       # background refreshes, prefetch and batch jobs
+
+# Yahoo rate limiter settings, in requests per second
+YAHOO_INITIAL_RATE = 2.0
+YAHOO_MIN_RATE = 0.2
+YAHOO_MAX_RATE = 8.0
+YAHOO_BURST = 5
+INTERACTIVE_WAIT_TIMEOUT = 10  # seconds an interactive request may queue before giving up
+BATCH_WAIT_TIMEOUT = 120
+
+class UpstreamThrottledError(Exception):
+    """Raised when Yahoo throttles us or a request waited too long for a rate limit token"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket shared by all callers, with a priority queue and AIMD rate control
+
+    Waiting callers are served strictly by (priority, arrival order), so interactive
+    requests overtake queued batch work. The refill rate grows additively after each
+    successful call and is halved whenever the upstream throttles us or returns
+    empty responses for several tickers (see record_empty).
+    """
+
+    def __init__(
+        self,
+        rate=YAHOO_INITIAL_RATE,
+        burst=YAHOO_BURST,
+        min_rate=YAHOO_MIN_RATE,
+        max_rate=YAHOO_MAX_RATE,
+        increase=0.05,
+        decrease=0.5
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._queue = []
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        self._granted = 0
+        self._timeouts = 0
+        self._throttled = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, priority=PRIORITY_INTERACTIVE, timeout=None):
+        """
+        Wait for a token
+
+        Args:
+            priority: PRIORITY_INTERACTIVE or PRIORITY_BATCH (lower is served first)
+            timeout: Maximum seconds to wait, None to wait indefinitely
+
+        Returns:
+            Seconds spent waiting
+        """
+        started = time.monotonic()
+        with self._cond:
+            ticket = (priority, next(self._sequence))
+            heapq.heappush(self._queue, ticket)
+            try:
+                while True:
+                    self._refill()
+                    if self._queue[0] == ticket and self._tokens >= 1:
+                        heapq.heappop(self._queue)
+                        self._tokens -= 1
+                        waited = time.monotonic() - started
+                        self._granted += 1
+                        self._total_wait += waited
+                        self._max_wait = max(self._max_wait, waited)
+                        return waited
+
+                    wait = (1 - self._tokens) / self.rate if self._queue[0] == ticket else None
+                    if timeout is not None:
+                        remaining = timeout - (time.monotonic() - started)
+                        if remaining <= 0:
+                            self._queue.remove(ticket)
+                            heapq.heapify(self._queue)
+                            self._timeouts += 1
+                            raise UpstreamThrottledError(
+                                "Timed out waiting for the Yahoo rate limiter",
+                                retry_after=max(1, int(len(self._queue) / self.rate))
+                            )
+                        wait = remaining if wait is None else min(wait, remaining)
+                    self._cond.wait(wait)
+            finally:
+                # Let the next caller in line check whether it can go
+                self._cond.notify_all()
+
+    def record_success(self):
+        with self._cond:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def record_throttled(self):
+        with self._cond:
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self._tokens = min(self._tokens, 0.0)
+            self._throttled += 1
+
+    def stats(self):
+        """Current rate, queue depth and wait times"""
+        with self._cond:
+            self._refill()
+            return {
+                'rate_per_second': round(self.rate, 3),
+                'tokens': round(self._tokens, 3),
+                'queue_depth': len(self._queue),
+                'queued_interactive': sum(1 for priority, _ in self._queue if priority <= PRIORITY_INTERACTIVE),
+                'granted': self._granted,
+                'timeouts': self._timeouts,
+                'throttled': self._throttled,
+                'avg_wait_seconds': round(self._total_wait / self._granted, 4) if self._granted else 0.0,
+                'max_wait_seconds': round(self._max_wait, 4)
+            }
+
+def is_throttle_error(error):
+    """yfinance raises YFRateLimitError on HTTP 429; older versions only carry the message"""
+    message = str(error)
+    return type(error).__name__ == 'YFRateLimitError' or 'Too Many Requests' in message or re.search(r'\b429\b', message) is not None
+
+# (soft TTL, hard TTL) in seconds per yfinance dataset. Past the soft TTL the cached
+# value is served while a background refresh runs; past the hard TTL callers block.
+DEFAULT_DATASET_TTL = (300, 3600)
+DATASET_TTLS = {
+    'info': (60, 3600),
+    'income_stmt': (6 * 3600, 7 * 86400),
+    'balance_sheet': (6 * 3600, 7 * 86400),
+    'cash_flow': (6 * 3600, 7 * 86400),
+    'quarterly_income_stmt': (3600, 3 * 86400),
+    'quarterly_balance_sheet': (3600, 3 * 86400),
+    'quarterly_cash_flow': (3600, 3 * 86400),
+    'ttm_income_stmt': (3600, 3 * 86400),
+    'ttm_cashflow': (3600, 3 * 86400),
+    'history': (300, 86400)
+}
+EMPTY_RESULT_TTL = 60      # seconds an empty response is cached, so repeats do not go back to Yahoo
+EMPTY_CLUSTER_WINDOW = 60  # seconds; empty responses for this many different tickers
+EMPTY_CLUSTER_TICKERS = 3  # within the window are treated as throttling
+
+# Shared by every yfinance call in the process
+ticker_flight = SingleFlight()
+ticker_cache = StaleWhileRevalidateCache(maxsize=1024)
+yahoo_limiter = AdaptiveRateLimiter()
+
+def is_cacheable(value):
+    """Empty responses are usually throttling or a bad symbol; only keep them for EMPTY_RESULT_TTL"""
+    empty = getattr(value, 'empty', None)
+    if empty is not None:
+        return not empty
+    return bool(value)
+
+_recent_empties = {}
+_recent_empties_lock = threading.Lock()
+
+def record_empty(ticker_symbol):
+    """
+    Note an empty response for ticker_symbol
+
+    One ticker coming back empty is usually a bad or delisted symbol. Only when
+    EMPTY_CLUSTER_TICKERS different tickers come back empty within
+    EMPTY_CLUSTER_WINDOW is it treated as Yahoo throttling and the rate halved.
+    """
+    now = time.monotonic()
+    with _recent_empties_lock:
+        _recent_empties[ticker_symbol] = now
+        for symbol, seen_at in list(_recent_empties.items()):
+            if now - seen_at > EMPTY_CLUSTER_WINDOW:
+                del _recent_empties[symbol]
+        clustered = len(_recent_empties) >= EMPTY_CLUSTER_TICKERS
+        if clustered:
+            _recent_empties.clear()
+    if clustered:
+        logger.warning(f"Empty Yahoo responses for {EMPTY_CLUSTER_TICKERS} tickers in {EMPTY_CLUSTER_WINDOW}s, backing off")
+        yahoo_limiter.record_throttled()
+
+def get_ticker(ticker_symbol):
+    """Create a yfinance Ticker on the shared session, importing yfinance on first use"""
+    import yfinance as yf
+    return yf.Ticker(ticker_symbol, session=get_session())
+
+def fetch_ticker_data(ticker_symbol, dataset, priority=PRIORITY_INTERACTIVE, **kwargs):
+    """
+    Fetch one yfinance dataset for a ticker through the stale-while-revalidate
+    cache, sharing concurrent identical fetches and pacing calls through the
+    Yahoo rate limiter
+
+    Args:
+        ticker_symbol: Ticker symbol, e.g. 'AAPL'
+        dataset: Ticker attribute such as 'info' or 'quarterly_income_stmt', or a
+            method such as 'history' which is called with kwargs
+        priority: Rate limiter priority for a blocking fetch; background refreshes use PRIORITY_BATCH
+        kwargs: Arguments for method datasets; they are part of the coalescing key
+
+    Returns:
+        The dataset. Cached and coalesced callers share the same object, so it must not be mutated.
+
+    Raises:
+        UpstreamThrottledError: Yahoo throttled the call or the rate limiter queue timed out
+    """
+    key = (ticker_symbol, dataset, tuple(sorted(kwargs.items())))
+
+    def fetch(fetch_priority):
+        timeout = INTERACTIVE_WAIT_TIMEOUT if fetch_priority <= PRIORITY_INTERACTIVE else BATCH_WAIT_TIMEOUT
+        yahoo_limiter.acquire(fetch_priority, timeout=timeout)
+        logger.debug(f"Fetching {dataset} for {ticker_symbol} from Yahoo")
+        try:
+            value = getattr(get_ticker(ticker_symbol), dataset)
+            value = value(**kwargs) if callable(value) else value
+        except Exception as e:
+            if is_throttle_error(e):
+                yahoo_limiter.record_throttled()
+                raise UpstreamThrottledError(f"Yahoo is rate limiting requests: {str(e)}", retry_after=30) from e
+            raise
+        if is_cacheable(value):
+            yahoo_limiter.record_success()
+            save_state()
+        else:
+            # Yahoo answers throttled requests with empty payloads as often as with 429s
+            record_empty(ticker_symbol)
+        return value
+
+    soft_ttl, hard_ttl = DATASET_TTLS.get(dataset, DEFAULT_DATASET_TTL)
+    return ticker_cache.get_or_fetch(
+        key,
+        lambda: ticker_flight.do(key, lambda: fetch(priority)),
+        soft_ttl,
+        hard_ttl,
+        cache_if=is_cacheable,
+        refresh=lambda: ticker_flight.do(key, lambda: fetch(PRIORITY_BATCH)),
+        negative_ttl=EMPTY_RESULT_TTL
+    )
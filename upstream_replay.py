@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Record and replay upstream HTTP responses (pages.stern.nyu.edu and Yahoo).
+
+Modes are selected with the UPSTREAM_MODE environment variable:
+
+    record  Requests go to the real hosts and each response is saved as a fixture
+            under UPSTREAM_FIXTURE_DIR (default fixtures/upstream).
+    replay  Requests are rewritten to the local stand-in server at
+            UPSTREAM_REPLAY_URL (default http://127.0.0.1:8765), which serves
+            the fixtures with configurable latency.
+
+Typical workflow:
+
+    # 1. Record once against the real upstreams
+    UPSTREAM_MODE=record python app.py                  # then hit the routes
+    UPSTREAM_MODE=record python run_all_scraping_updates.py
+
+    # 2. Replay offline against a local Postgres
+    python upstream_replay.py --port 8765 --latency-ms 150 --jitter-ms 50
+    export DATABASE_URL=postgresql://postgres@localhost/stockinsight
+    python create_table.py --all
+    UPSTREAM_MODE=replay python app.py
+    python run_all_scraping_updates.py
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlsplit
+import logging
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Constants
+DEFAULT_FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'upstream')
+DEFAULT_REPLAY_URL = 'http://127.0.0.1:8765'
+# Query parameters that change between sessions and must not be part of the fixture key
+VOLATILE_PARAMS = {'crumb', '_', 'corsDomain'}
+# Response headers worth keeping in a fixture
+KEPT_HEADERS = ('content-type',)
+
+_write_lock = threading.Lock()
+
+def upstream_mode():
+    """'record', 'replay' or None"""
+    mode = os.environ.get('UPSTREAM_MODE', '').lower()
+    return mode if mode in ('record', 'replay') else None
+
+def fixture_dir():
+    return os.environ.get('UPSTREAM_FIXTURE_DIR', DEFAULT_FIXTURE_DIR)
+
+def replay_url():
+    return os.environ.get('UPSTREAM_REPLAY_URL', DEFAULT_REPLAY_URL).rstrip('/')
+
+def fixture_key(method, url, params=None):
+    """
+    Stable identifier of a request: host, path and sorted non-volatile query parameters
+
+    Returns:
+        Tuple of (host, key) where key names the fixture file
+    """
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    if params:
+        query.extend(params.items() if isinstance(params, dict) else params)
+    query = sorted((str(k), str(v)) for k, v in query if k not in VOLATILE_PARAMS)
+    identity = f"{method.upper()} {parts.netloc}{parts.path}?{urlencode(query)}"
+    return parts.netloc, hashlib.sha1(identity.encode('utf-8')).hexdigest()[:20]
+
+def fixture_path(host, key, base_dir=None):
+    return os.path.join(base_dir or fixture_dir(), host, f"{key}.json")
+
+def save_fixture(method, url, params, response, base_dir=None):
+    """Write a response to its fixture file"""
+    host, key = fixture_key(method, url, params)
+    path = fixture_path(host, key, base_dir)
+    fixture = {
+        'method': method.upper(),
+        'url': url,
+        'params': dict(params) if params else None,
+        'status': response.status_code,
+        'headers': {name: response.headers[name] for name in KEPT_HEADERS if name in response.headers},
+        'body': base64.b64encode(response.content).decode('ascii')
+    }
+    with _write_lock:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(fixture, f, indent=1)
+    logger.info(f"Recorded {method.upper()} {url} -> {path}")
+
+def install(session):
+    """
+    Wrap session.request for the active UPSTREAM_MODE; a no-op when the mode is unset
+
+    Works for both requests and curl_cffi sessions, since their get/post helpers
+    all go through request().
+    """
+    mode = upstream_mode()
+    if mode is None:
+        return session
+    original_request = session.request
+
+    def recording_request(method, url, *args, **kwargs):
+        response = original_request(method, url, *args, **kwargs)
+        save_fixture(method, url, kwargs.get('params'), response)
+        return response
+
+    def replaying_request(method, url, *args, **kwargs):
+        parts = urlsplit(url)
+        local_url = f"{replay_url()}/{parts.netloc}{parts.path}"
+        if parts.query:
+            local_url += f"?{parts.query}"
+        return original_request(method, local_url, *args, **kwargs)
+
+    session.request = recording_request if mode == 'record' else replaying_request
+    logger.info(f"Upstream {mode} mode enabled for {type(session).__name__}")
+    return session
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    """Serves /<host>/<path>?<query> from the fixture recorded for https://<host>/<path>?<query>"""
+
+    fixture_dir = DEFAULT_FIXTURE_DIR
+    latency = 0.0
+    jitter = 0.0
+
+    def _serve(self):
+        host, _, rest = self.path.lstrip('/').partition('/')
+        url = f"https://{host}/{rest}"
+        _, key = fixture_key(self.command, url)
+        path = fixture_path(host, key, self.fixture_dir)
+
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+        try:
+            with open(path) as f:
+                fixture = json.load(f)
+        except OSError:
+            body = json.dumps({'error': f"No fixture for {self.command} {url}", 'fixture': path}).encode('utf-8')
+            self.send_response(404)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        body = base64.b64decode(fixture['body'])
+        self.send_response(fixture['status'])
+        for name, value in fixture.get('headers', {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    do_GET = _serve
+    do_POST = _serve
+    do_HEAD = _serve
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+def serve(port=8765, latency_ms=0, jitter_ms=0, fixtures=None):
+    """Run the replay server until interrupted"""
+    handler = type('ConfiguredReplayHandler', (ReplayHandler,), {
+        'fixture_dir': fixtures or fixture_dir(),
+        'latency': latency_ms / 1000,
+        'jitter': jitter_ms / 1000
+    })
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    logger.info(f"Replaying fixtures from {handler.fixture_dir} on http://127.0.0.1:{port} "
+                f"with {latency_ms} ms latency (+{jitter_ms} ms jitter)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8765, help='Port to listen on')
+    parser.add_argument('--latency-ms', type=float, default=0, help='Fixed delay added to every response')
+    parser.add_argument('--jitter-ms', type=float, default=0, help='Random extra delay, uniform in [0, jitter]')
+    parser.add_argument('--fixtures', default=None, help='Fixture directory (default UPSTREAM_FIXTURE_DIR or fixtures/upstream)')
+    args = parser.parse_args()
+    serve(args.port, args.latency_ms, args.jitter_ms, args.fixtures)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,397 @@
+import numpy as np
+
+# Constants
+DEFAULT_YEARS = 10
+DEFAULT_HIGH_GROWTH_YEARS = 5
+DEFAULT_TAX_RATE = 0.25
+DEFAULT_TERMINAL_GROWTH = 0.03
+MIN_TERMINAL_SPREAD = 0.005  # cost of capital is kept at least this far above terminal growth
+MIN_SALES_TO_CAPITAL = 0.05
+DEFAULT_CHUNK_SIZE = 25000  # paths per chunk, bounds memory to a few MB
+DEFAULT_PERCENTILES = (5, 10, 25, 50, 75, 90, 95)
+QUARTILE_Z = 0.6744897501960817  # z-score of the third quartile of a standard normal
+MIN_POSITIVE_QUARTILE = 0.01  # floor for the quartiles of POSITIVE_DRIVERS before taking logs
+
+# Drivers sampled from input_stats, in the order used for correlation matrices
+SIMULATED_DRIVERS = (
+    'revenue_growth',
+    'operating_margin',
+    'sales_to_capital',
+    'cost_of_capital',
+    'beta'
+)
+
+# Drivers that are strictly positive; they are fitted and sampled in log space, so the
+# quartiles still match exactly but the lower tail can never reach zero
+POSITIVE_DRIVERS = ('sales_to_capital', 'beta')
+
+# input_stats column prefix and scale for each driver (percent columns are stored as 7.93 for 7.93%)
+INPUT_STATS_COLUMNS = {
+    'revenue_growth': ('revenue_growth_rate', 0.01),
+    'operating_margin': ('pre_tax_operating_margin', 0.01),
+    'sales_to_capital': ('sales_to_invested_capital', 1.0),
+    'cost_of_capital': ('cost_of_capital', 0.01),
+    'beta': ('beta', 1.0)
+}
+
+def _as_driver(value):
+    """Convert a scalar or array driver to float and append the year axis"""
+    return np.asarray(value, dtype=float)[..., None]
+
+def dcf_share_price(
+    revenue,
+    revenue_growth,
+    operating_margin,
+    sales_to_capital,
+    cost_of_capital,
+    shares_outstanding,
+    tax_rate=DEFAULT_TAX_RATE,
+    terminal_growth=DEFAULT_TERMINAL_GROWTH,
+    debt=0.0,
+    cash=0.0,
+    current_margin=None,
+    years=DEFAULT_YEARS,
+    high_growth_years=DEFAULT_HIGH_GROWTH_YEARS
+):
+    """
+    Vectorized FCFF discounted cash flow returning the implied share price
+
+    Every driver may be a scalar or an array; arrays are broadcast against each
+    other, so a (n,) array of sampled drivers yields n prices and a (n, 1) and a
+    (1, m) array yield an (n, m) grid. Rates are decimals (0.08 for 8%).
+
+    Revenue grows at revenue_growth for high_growth_years and then fades linearly
+    to terminal_growth by the final year. The operating margin converges linearly
+    from current_margin (if given) to operating_margin. Reinvestment is the change
+    in revenue divided by sales_to_capital, and the terminal value assumes the
+    return on capital in stable growth equals the cost of capital.
+
+    Args:
+        revenue: Base year revenue
+        revenue_growth: Revenue growth rate during the high growth period
+        operating_margin: Target pre-tax operating margin
+        sales_to_capital: Sales to invested capital ratio used for reinvestment
+        cost_of_capital: Discount rate
+        shares_outstanding: Number of shares used to get the per-share value
+        tax_rate: Tax rate applied to operating income
+        terminal_growth: Stable growth rate after the forecast period
+        debt: Debt subtracted from firm value
+        cash: Cash added to firm value
+        current_margin: Base year operating margin, None to use the target margin throughout
+        years: Length of the forecast period
+        high_growth_years: Years before growth starts fading to terminal growth
+
+    Returns:
+        numpy array of implied share prices with the broadcast shape of the drivers
+    """
+    if years < 1:
+        raise ValueError("years must be at least 1")
+    high_growth_years = min(max(int(high_growth_years), 0), years)
+
+    growth = _as_driver(revenue_growth)
+    margin = _as_driver(operating_margin)
+    sales_to_cap = np.maximum(_as_driver(sales_to_capital), MIN_SALES_TO_CAPITAL)
+    stable_growth = _as_driver(terminal_growth)
+    wacc = np.maximum(_as_driver(cost_of_capital), stable_growth + MIN_TERMINAL_SPREAD)
+    tax = _as_driver(tax_rate)
+    base_revenue = _as_driver(revenue)
+
+    t = np.arange(1, years + 1, dtype=float)
+
+    # Growth is flat for the high growth years, then fades linearly to terminal growth
+    fade_years = years - high_growth_years
+    if fade_years > 0:
+        fade = np.clip((t - high_growth_years) / fade_years, 0.0, 1.0)
+    else:
+        fade = np.zeros_like(t)
+    growth_path = growth + (stable_growth - growth) * fade
+
+    revenues = base_revenue * np.cumprod(1.0 + growth_path, axis=-1)
+    previous_revenues = np.concatenate(
+        [np.broadcast_to(base_revenue, revenues.shape[:-1] + (1,)), revenues[..., :-1]],
+        axis=-1
+    )
+
+    # Margin converges linearly from the current margin to the target margin
+    if current_margin is None:
+        margin_path = margin
+    else:
+        start_margin = _as_driver(current_margin)
+        margin_path = start_margin + (margin - start_margin) * (t / years)
+
+    after_tax_operating_income = revenues * margin_path * (1.0 - tax)
+    reinvestment = (revenues - previous_revenues) / sales_to_cap
+    fcff = after_tax_operating_income - reinvestment
+
+    discount_factors = (1.0 + wacc) ** -t
+    pv_fcff = np.sum(fcff * discount_factors, axis=-1)
+
+    # Terminal value with reinvestment rate = g / ROC and ROC = cost of capital
+    terminal_income = revenues[..., -1] * (1.0 + stable_growth[..., 0]) * margin[..., 0] * (1.0 - tax[..., 0])
+    terminal_fcff = terminal_income * (1.0 - stable_growth[..., 0] / wacc[..., 0])
+    terminal_value = terminal_fcff / (wacc[..., 0] - stable_growth[..., 0])
+    pv_terminal = terminal_value * discount_factors[..., -1]
+
+    equity_value = pv_fcff + pv_terminal + np.asarray(cash, dtype=float) - np.asarray(debt, dtype=float)
+    return equity_value / np.asarray(shares_outstanding, dtype=float)
+
+def quartiles_from_input_stats(stats):
+    """
+    Build (first quartile, median, third quartile) triples per driver from an input_stats row
+
+    Args:
+        stats: Dict of input_stats column name to value
+
+    Returns:
+        Dict mapping driver name to a (q1, median, q3) tuple of decimals
+    """
+    quartiles = {}
+    for driver, (prefix, scale) in INPUT_STATS_COLUMNS.items():
+        values = [
+            stats.get(f"{prefix}_first_quartile"),
+            stats.get(f"{prefix}_median"),
+            stats.get(f"{prefix}_third_quartile")
+        ]
+        if any(value is None for value in values):
+            continue
+        q1, median, q3 = sorted(float(value) * scale for value in values)
+        quartiles[driver] = (q1, median, q3)
+    return quartiles
+
+def _normal_cdf(z):
+    """Standard normal CDF using the Abramowitz-Stegun erf approximation (error < 1.5e-7)"""
+    x = np.abs(z) / np.sqrt(2.0)
+    k = 1.0 / (1.0 + 0.3275911 * x)
+    poly = k * (0.254829592 + k * (-0.284496736 + k * (1.421413741 + k * (-1.453152027 + k * 1.061405429))))
+    erf = 1.0 - poly * np.exp(-x * x)
+    return 0.5 * (1.0 + np.sign(z) * erf)
+
+def _triangular_from_uniform(u, q1, median, q3):
+    """
+    Inverse CDF of a two-piece triangular distribution fitted to quartiles
+
+    Each side of the median carries half of the probability mass with a density that
+    falls linearly to zero, stretched so that the side's quartile lands exactly on q1 or q3.
+    """
+    side = 1.0 - np.sqrt(0.5)
+    low = median - (median - q1) / side
+    high = median + (q3 - median) / side
+    return np.where(
+        u < 0.5,
+        low + (median - low) * np.sqrt(2.0 * u),
+        high - (high - median) * np.sqrt(2.0 * (1.0 - u))
+    )
+
+def _split_normal_from_z(z, q1, median, q3):
+    """Split normal fitted exactly to the quartiles, evaluated at standard normal draws"""
+    sigma_low = (median - q1) / QUARTILE_Z
+    sigma_high = (q3 - median) / QUARTILE_Z
+    return median + np.where(z < 0, z * sigma_low, z * sigma_high)
+
+def correlation_matrix(drivers, correlation):
+    """
+    Build a correlation matrix for the sampled drivers
+
+    Args:
+        drivers: Ordered driver names
+        correlation: Dict mapping "driver_a:driver_b" to a correlation coefficient
+
+    Returns:
+        numpy array of shape (len(drivers), len(drivers))
+    """
+    matrix = np.eye(len(drivers))
+    index = {driver: i for i, driver in enumerate(drivers)}
+    for pair, rho in (correlation or {}).items():
+        names = pair.split(':')
+        if len(names) != 2 or names[0] not in index or names[1] not in index:
+            raise ValueError(f"Invalid correlation pair: {pair}. Expected 'driver_a:driver_b' with drivers from {list(drivers)}")
+        rho = float(rho)
+        if not -1.0 < rho < 1.0:
+            raise ValueError(f"Correlation for {pair} must be between -1 and 1")
+        i, j = index[names[0]], index[names[1]]
+        matrix[i, j] = matrix[j, i] = rho
+    return matrix
+
+def sample_drivers(quartiles, size, rng, distribution='triangular', cholesky=None):
+    """
+    Sample drivers from their quartiles
+
+    POSITIVE_DRIVERS are fitted to the logs of their quartiles and exponentiated,
+    so every draw is positive; the others are fitted to the quartiles directly.
+
+    Args:
+        quartiles: Ordered dict of driver name to (q1, median, q3)
+        size: Number of samples
+        rng: numpy Generator
+        distribution: 'triangular' or 'split_normal'
+        cholesky: Lower Cholesky factor of the driver correlation matrix, None for independent draws
+
+    Returns:
+        Dict mapping driver name to an array of samples
+    """
+    drivers = list(quartiles)
+    if cholesky is not None or distribution == 'split_normal':
+        # Correlated draws go through a Gaussian copula
+        z = rng.standard_normal((size, len(drivers)))
+        if cholesky is not None:
+            z = z @ cholesky.T
+        u = _normal_cdf(z) if distribution == 'triangular' else None
+    else:
+        z = None
+        u = rng.random((size, len(drivers)))
+
+    samples = {}
+    for i, driver in enumerate(drivers):
+        q1, median, q3 = quartiles[driver]
+        positive = driver in POSITIVE_DRIVERS
+        if positive:
+            q1, median, q3 = np.log(np.maximum((q1, median, q3), MIN_POSITIVE_QUARTILE))
+        if distribution == 'triangular':
+            values = _triangular_from_uniform(u[:, i], q1, median, q3)
+        else:
+            values = _split_normal_from_z(z[:, i], q1, median, q3)
+        samples[driver] = np.exp(values) if positive else values
+    return samples
+
+def simulate_share_prices(
+    quartiles,
+    company,
+    paths=100000,
+    distribution='triangular',
+    correlation=None,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    percentiles=DEFAULT_PERCENTILES,
+    seed=None
+):
+    """
+    Monte Carlo DCF over drivers sampled from industry quartiles
+
+    Paths are evaluated in chunks of chunk_size so peak memory stays bounded
+    regardless of the number of paths; only the final prices are kept.
+
+    Args:
+        quartiles: Dict of driver name to (q1, median, q3), see quartiles_from_input_stats
+        company: Dict of company inputs passed to dcf_share_price (revenue, shares_outstanding,
+            tax_rate, terminal_growth, debt, cash, current_margin, years, high_growth_years).
+            If it contains risk_free_rate and equity_risk_premium, the discount rate is
+            risk_free_rate + beta * equity_risk_premium using the sampled beta.
+        paths: Number of simulated paths
+        distribution: 'triangular' or 'split_normal'
+        correlation: Dict mapping "driver_a:driver_b" to a correlation coefficient
+        chunk_size: Paths evaluated per chunk
+        percentiles: Percentiles of the implied share price to report
+        seed: Optional seed for reproducible runs
+
+    Returns:
+        Dict with percentile bands, mean and standard deviation of the implied share price
+    """
+    if distribution not in ('triangular', 'split_normal'):
+        raise ValueError(f"Invalid distribution: {distribution}. Expected 'triangular' or 'split_normal'")
+    if paths < 1:
+        raise ValueError("paths must be at least 1")
+    chunk_size = max(1, int(chunk_size))
+
+    use_beta = company.get('risk_free_rate') is not None and company.get('equity_risk_premium') is not None
+    required = ['revenue_growth', 'operating_margin', 'sales_to_capital', 'beta' if use_beta else 'cost_of_capital']
+    missing = [driver for driver in required if driver not in quartiles]
+    if missing:
+        raise ValueError(f"Missing quartiles for drivers: {missing}")
+
+    drivers = [driver for driver in SIMULATED_DRIVERS if driver in quartiles]
+    ordered_quartiles = {driver: quartiles[driver] for driver in drivers}
+    cholesky = None
+    if correlation:
+        try:
+            cholesky = np.linalg.cholesky(correlation_matrix(drivers, correlation))
+        except np.linalg.LinAlgError:
+            raise ValueError("Correlation matrix is not positive definite")
+
+    dcf_kwargs = {
+        key: company[key]
+        for key in ('tax_rate', 'terminal_growth', 'debt', 'cash', 'current_margin', 'years', 'high_growth_years')
+        if company.get(key) is not None
+    }
+
+    rng = np.random.default_rng(seed)
+    prices = np.empty(paths, dtype=float)
+    for start in range(0, paths, chunk_size):
+        size = min(chunk_size, paths - start)
+        samples = sample_drivers(ordered_quartiles, size, rng, distribution, cholesky)
+        if use_beta:
+            discount_rate = company['risk_free_rate'] + samples['beta'] * company['equity_risk_premium']
+        else:
+            discount_rate = samples['cost_of_capital']
+        prices[start:start + size] = dcf_share_price(
+            revenue=company['revenue'],
+            revenue_growth=samples['revenue_growth'],
+            operating_margin=samples['operating_margin'],
+            sales_to_capital=samples['sales_to_capital'],
+            cost_of_capital=discount_rate,
+            shares_outstanding=company['shares_outstanding'],
+            **dcf_kwargs
+        )
+
+    bands = np.percentile(prices, percentiles)
+    return {
+        'paths': paths,
+        'distribution': distribution,
+        'percentiles': {f"p{p:g}": float(value) for p, value in zip(percentiles, bands)},
+        'mean': float(prices.mean()),
+        'std': float(prices.std()),
+        'drivers': {
+            driver: {'first_quartile': q1, 'median': median, 'third_quartile': q3}
+            for driver, (q1, median, q3) in ordered_quartiles.items()
+        }
+    }
+
+# Drivers that can be used as sensitivity grid axes
+GRID_DRIVERS = ('revenue_growth', 'operating_margin', 'sales_to_capital', 'cost_of_capital')
+
+# Keys read from a saved valuation's inputs document
+REQUIRED_VALUATION_INPUTS = GRID_DRIVERS + ('revenue', 'shares_outstanding')
+OPTIONAL_VALUATION_INPUTS = ('tax_rate', 'terminal_growth', 'debt', 'cash', 'current_margin', 'years', 'high_growth_years')
+
+def base_inputs_from_valuation(inputs):
+    """
+    Extract DCF inputs from a saved valuation's inputs document
+
+    Args:
+        inputs: Dict stored in valuation.inputs, rates as decimals
+
+    Returns:
+        Dict of keyword arguments for dcf_share_price
+    """
+    inputs = inputs or {}
+    missing = [key for key in REQUIRED_VALUATION_INPUTS if inputs.get(key) is None]
+    if missing:
+        raise ValueError(f"Valuation inputs are missing: {missing}")
+    base = {key: float(inputs[key]) for key in REQUIRED_VALUATION_INPUTS}
+    for key in OPTIONAL_VALUATION_INPUTS:
+        if inputs.get(key) is not None:
+            base[key] = int(inputs[key]) if key in ('years', 'high_growth_years') else float(inputs[key])
+    return base
+
+def sensitivity_grid(base, x_driver, x_values, y_driver, y_values):
+    """
+    Implied share price over a two-driver grid in a single broadcast DCF
+
+    Args:
+        base: Dict of dcf_share_price keyword arguments, see base_inputs_from_valuation
+        x_driver: Driver varied along the rows
+        x_values: Values of x_driver
+        y_driver: Driver varied along the columns
+        y_values: Values of y_driver
+
+    Returns:
+        numpy array of shape (len(x_values), len(y_values))
+    """
+    for driver in (x_driver, y_driver):
+        if driver not in GRID_DRIVERS:
+            raise ValueError(f"Invalid grid driver: {driver}. Expected one of {list(GRID_DRIVERS)}")
+    if x_driver == y_driver:
+        raise ValueError("Grid axes must use two different drivers")
+
+    kwargs = dict(base)
+    kwargs[x_driver] = np.asarray(x_values, dtype=float)[:, None]
+    kwargs[y_driver] = np.asarray(y_values, dtype=float)[None, :]
+    return dcf_share_price(**kwargs)
@@ -0,0 +1,302 @@
+from decimal import Decimal
+from psycopg2.extras import Json
+import hashlib
+import json
+
+# Constants
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+MIGRATION_BATCH_SIZE = 500
+INSERT_PAGE_SIZE = 100  # rows per multi-row INSERT statement
+MAX_VALUED_DATE = 2 ** 31 - 1  # valued_date is an INTEGER column of epoch seconds
+MAX_SHARE_PRICE = 10 ** 8      # implied_share_price is DECIMAL(10, 2)
+
+# Large JSONB documents stored once in valuation_blob and referenced by hash from valuation
+BLOB_COLUMNS = ('stock_info', 'fetched_inputs', 'roic_data')
+
+# JSONB documents stored inline on the valuation row
+INLINE_JSON_COLUMNS = ('inputs', 'valuation_model', 'valuation_output')
+
+# Columns returned when listing valuations without the full document
+SUMMARY_COLUMNS = ['id', 'symbol', 'implied_share_price', 'valued_date']
+FULL_COLUMNS = [
+    'id',
+    'symbol',
+    'email',
+    'inputs',
+    'fetched_inputs',
+    'stock_info',
+    'valuation_model',
+    'valuation_output',
+    'implied_share_price',
+    'roic_data',
+    'description',
+    'valued_date'
+]
+HASH_COLUMNS = [f"{column}_hash" for column in BLOB_COLUMNS]
+
+# Columns that can be used to filter valuation listings, each backed by a (column, valued_date) index
+LIST_FILTERS = ('email', 'symbol')
+
+def encode_cursor(row):
+    """Build the keyset cursor for the page after row"""
+    return f"{row['valued_date']}:{row['id']}"
+
+def decode_cursor(cursor):
+    """Parse a valued_date:id cursor into a tuple of ints"""
+    try:
+        valued_date, valuation_id = cursor.split(':')
+        return int(valued_date), int(valuation_id)
+    except (AttributeError, ValueError):
+        raise ValueError(f"Invalid cursor: {cursor}. Expected valued_date:id")
+
+def blob_hash(payload):
+    """
+    Content address of a JSON document
+
+    Returns:
+        Tuple of (sha256 hex digest, canonical JSON text) where the canonical form
+        sorts keys and drops whitespace so equal documents always hash the same
+    """
+    canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest(), canonical
+
+def store_blobs(db_handler, blobs):
+    """
+    Insert the blobs that are not stored yet, without committing
+
+    Existing hashes are looked up first so payloads already in valuation_blob are
+    never sent to the database again; ON CONFLICT covers concurrent writers.
+
+    Args:
+        db_handler: Connected DatabaseHandler
+        blobs: Dict mapping hash to canonical JSON text
+
+    Returns:
+        Number of new blobs written
+    """
+    if not blobs:
+        return 0
+    db_handler.cur.execute("SELECT hash FROM valuation_blob WHERE hash = ANY(%s)", (list(blobs),))
+    existing = {row[0] for row in db_handler.cur.fetchall()}
+    missing = [(blob_id, blobs[blob_id]) for blob_id in blobs if blob_id not in existing]
+    if missing:
+        db_handler.execute_values(
+            "INSERT INTO valuation_blob (hash, payload) VALUES %s ON CONFLICT (hash) DO NOTHING",
+            missing,
+            template="(%s, %s::jsonb)"
+        )
+    return len(missing)
+
+def _row_to_dict(columns, row):
+    record = dict(zip(columns, row))
+    if isinstance(record.get('implied_share_price'), Decimal):
+        record['implied_share_price'] = float(record['implied_share_price'])
+    return record
+
+def rehydrate(db_handler, records):
+    """
+    Replace blob hashes on valuation records with their payloads, in place
+
+    Rows written before deduplication keep their inline documents and have no hashes.
+    All blobs for the records are fetched in a single query.
+    """
+    hashes = {record[f"{column}_hash"] for record in records for column in BLOB_COLUMNS} - {None}
+    payloads = {}
+    if hashes:
+        rows = db_handler.fetch_query("SELECT hash, payload FROM valuation_blob WHERE hash = ANY(%s)", (list(hashes),))
+        if rows is None:
+            raise Exception("Error fetching valuation blobs")
+        payloads = dict(rows)
+    for record in records:
+        for column in BLOB_COLUMNS:
+            blob_id = record.pop(f"{column}_hash")
+            if blob_id is not None:
+                record[column] = payloads.get(blob_id)
+    return records
+
+def list_valuations(db_handler, filter_column, value, limit=DEFAULT_PAGE_SIZE, cursor=None, full=False):
+    """
+    List valuations for an email or symbol, newest valued_date first, using keyset pagination
+
+    The WHERE and ORDER BY match the (column, valued_date DESC, id DESC) indexes, so each
+    page is an index range scan regardless of how deep the client has paged. Only the
+    summary columns are read unless full is True, which keeps the JSONB documents off
+    the wire. Rows without a valued_date are not listed.
+
+    Args:
+        db_handler: Connected DatabaseHandler
+        filter_column: 'email' or 'symbol'
+        value: Value to filter on
+        limit: Page size
+        cursor: Cursor returned as next_cursor by the previous page
+        full: If True, return every column instead of the summary columns
+
+    Returns:
+        Dict with the page of valuations and the next_cursor (None on the last page)
+    """
+    if filter_column not in LIST_FILTERS:
+        raise ValueError(f"Invalid filter column: {filter_column}")
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    columns = FULL_COLUMNS + HASH_COLUMNS if full else SUMMARY_COLUMNS
+
+    query = f"SELECT {', '.join(columns)} FROM valuation WHERE {filter_column} = %s AND valued_date IS NOT NULL"
+    params = [value]
+    if cursor:
+        query += " AND (valued_date, id) < (%s, %s)"
+        params.extend(decode_cursor(cursor))
+    # Fetch one extra row to know whether there is a next page
+    query += " ORDER BY valued_date DESC, id DESC LIMIT %s"
+    params.append(limit + 1)
+
+    rows = db_handler.fetch_query(query, tuple(params))
+    if rows is None:
+        raise Exception("Error querying valuations")
+
+    valuations = [_row_to_dict(columns, row) for row in rows[:limit]]
+    if full:
+        rehydrate(db_handler, valuations)
+    next_cursor = encode_cursor(valuations[-1]) if len(rows) > limit else None
+    return {'valuations': valuations, 'next_cursor': next_cursor}
+
+def get_valuation(db_handler, valuation_id):
+    """Fetch a full valuation document by id, None if it does not exist"""
+    columns = FULL_COLUMNS + HASH_COLUMNS
+    rows = db_handler.fetch_query(f"SELECT {', '.join(columns)} FROM valuation WHERE id = %s", (valuation_id,))
+    if rows is None:
+        raise Exception("Error querying valuation")
+    if not rows:
+        return None
+    return rehydrate(db_handler, [_row_to_dict(columns, rows[0])])[0]
+
+def validate_valuation(document):
+    """
+    Validate a valuation document before it is written
+
+    Values are checked against the column types, so a document that passes cannot
+    fail the INSERT and roll back the other documents of a bulk request.
+
+    Returns:
+        Normalized dict with every FULL_COLUMNS key except id
+    """
+    if not isinstance(document, dict):
+        raise ValueError("Valuation must be a JSON object")
+    symbol = document.get('symbol')
+    if not isinstance(symbol, str) or not 0 < len(symbol) <= 50:
+        raise ValueError("symbol is required and must be at most 50 characters")
+    email = document.get('email')
+    if email is not None and (not isinstance(email, str) or len(email) > 50):
+        raise ValueError("email must be a string of at most 50 characters")
+    for column in BLOB_COLUMNS + INLINE_JSON_COLUMNS:
+        if document.get(column) is not None and not isinstance(document[column], (dict, list)):
+            raise ValueError(f"{column} must be a JSON object or array")
+    price = document.get('implied_share_price')
+    if price is not None and (isinstance(price, bool) or not isinstance(price, (int, float))):
+        raise ValueError("implied_share_price must be a number")
+    # NaN fails the comparison too; 99999999.995 would round up out of DECIMAL(10, 2)
+    if price is not None and not abs(round(price, 2)) < MAX_SHARE_PRICE:
+        raise ValueError(f"implied_share_price must be a finite number below {MAX_SHARE_PRICE}")
+    valued_date = document.get('valued_date')
+    if valued_date is not None and (isinstance(valued_date, bool) or not isinstance(valued_date, int)):
+        raise ValueError("valued_date must be an epoch time integer")
+    if valued_date is not None and not 0 <= valued_date <= MAX_VALUED_DATE:
+        raise ValueError("valued_date must be an epoch time in seconds, not milliseconds")
+    description = document.get('description')
+    if description is not None and not isinstance(description, str):
+        raise ValueError("description must be a string")
+    return {column: document.get(column) for column in FULL_COLUMNS if column != 'id'}
+
+def insert_valuations(db_handler, documents, page_size=INSERT_PAGE_SIZE):
+    """
+    Insert validated valuation documents, without committing
+
+    Blob columns are written to valuation_blob once per distinct payload and the
+    valuation rows reference them by hash, all through multi-row inserts.
+
+    Args:
+        db_handler: Connected DatabaseHandler
+        documents: List of dicts returned by validate_valuation
+        page_size: Rows per INSERT statement
+
+    Returns:
+        List of new valuation ids in the order of documents
+    """
+    if not documents:
+        return []
+    blobs = {}
+    rows = []
+    for document in documents:
+        hashes = []
+        for column in BLOB_COLUMNS:
+            if document[column] is None:
+                hashes.append(None)
+                continue
+            blob_id, canonical = blob_hash(document[column])
+            blobs[blob_id] = canonical
+            hashes.append(blob_id)
+        rows.append((
+            document['symbol'],
+            document['email'],
+            *[Json(document[column]) if document[column] is not None else None for column in INLINE_JSON_COLUMNS],
+            document['implied_share_price'],
+            document['description'],
+            document['valued_date'],
+            *hashes
+        ))
+    store_blobs(db_handler, blobs)
+
+    columns = ['symbol', 'email', *INLINE_JSON_COLUMNS, 'implied_share_price', 'description', 'valued_date', *HASH_COLUMNS]
+    inserted = db_handler.execute_values(
+        f"INSERT INTO valuation ({', '.join(columns)}) VALUES %s RETURNING id",
+        rows,
+        page_size=page_size,
+        fetch=True
+    )
+    return [row[0] for row in inserted]
+
+def migrate_valuation_blobs(db_handler, batch_size=MIGRATION_BATCH_SIZE):
+    """
+    Move inline blob columns of existing valuation rows into valuation_blob
+
+    Processes rows in id order, committing after each batch so the migration can be
+    interrupted and resumed.
+
+    Returns:
+        Number of valuation rows migrated
+    """
+    migrated = 0
+    last_id = 0
+    conditions = ' OR '.join(f"({column} IS NOT NULL AND {column}_hash IS NULL)" for column in BLOB_COLUMNS)
+    while True:
+        rows = db_handler.fetch_query(
+            f"SELECT id, {', '.join(BLOB_COLUMNS)} FROM valuation WHERE id > %s AND ({conditions}) ORDER BY id LIMIT %s",
+            (last_id, batch_size)
+        )
+        if not rows:
+            return migrated
+        blobs = {}
+        updates = []
+        for row in rows:
+            hashes = []
+            for payload in row[1:]:
+                if payload is None:
+                    hashes.append(None)
+                    continue
+                blob_id, canonical = blob_hash(payload)
+                blobs[blob_id] = canonical
+                hashes.append(blob_id)
+            updates.append((row[0], *hashes))
+        store_blobs(db_handler, blobs)
+        assignments = ', '.join(
+            f"{column}_hash = COALESCE(data.{column}_hash, valuation.{column}_hash), {column} = NULL"
+            for column in BLOB_COLUMNS
+        )
+        db_handler.execute_values(
+            f"UPDATE valuation SET {assignments} FROM (VALUES %s) AS data (id, {', '.join(HASH_COLUMNS)}) "
+            f"WHERE valuation.id = data.id",
+            updates,
+            template="(%s, %s::char(64), %s::char(64), %s::char(64))"
+        )
+        db_handler.commit()
+        migrated += len(rows)
+        last_id = rows[-1][0]
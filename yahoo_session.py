@@ -0,0 +1,162 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import logging
+import upstream_replay
+from metrics import instrument_session
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Constants
+# Vercel only allows writes under /tmp, which survives for the life of a warm instance
+YF_CACHE_DIR = os.environ.get('YF_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'stockinsight_yfinance'))
+SESSION_FILE = 'session.json'
+CRUMB_MAX_AGE = 24 * 3600  # seconds a persisted crumb is trusted before renegotiating
+POOL_MAXSIZE = 32
+
+_session = None
+_saved_crumb = None
+_lock = threading.Lock()
+
+def _session_path():
+    return os.path.join(YF_CACHE_DIR, SESSION_FILE)
+
+def _new_session():
+    """
+    Create the pooled HTTP session used for every Yahoo call
+
+    yfinance expects a curl_cffi session impersonating a browser; a plain requests
+    session with a larger connection pool is used when curl_cffi is unavailable.
+    """
+    try:
+        from curl_cffi import requests as curl_requests
+        return curl_requests.Session(impersonate="chrome")
+    except ImportError:
+        import requests
+        from requests.adapters import HTTPAdapter
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_MAXSIZE)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers['User-Agent'] = (
+            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+            '(KHTML, like Gecko) Chrome/124.0 Safari/537.36'
+        )
+        return session
+
+def _yf_data():
+    """yfinance's process-wide data singleton, which holds the cookie and crumb"""
+    from yfinance.data import YfData
+    return YfData(session=_session)
+
+def _load_state(session):
+    """Restore cookies and crumb persisted by a previous worker, skipping the handshake"""
+    global _saved_crumb
+    try:
+        with open(_session_path()) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return False
+
+    if time.time() - state.get('saved_at', 0) > CRUMB_MAX_AGE or not state.get('crumb'):
+        logger.info("Persisted Yahoo session is too old, renegotiating")
+        return False
+
+    now = time.time()
+    for cookie in state.get('cookies', []):
+        if cookie.get('expires') and cookie['expires'] < now:
+            continue
+        session.cookies.set(cookie['name'], cookie['value'], domain=cookie['domain'], path=cookie['path'])
+
+    try:
+        data = _yf_data()
+        data._cookie = True
+        data._crumb = state['crumb']
+    except Exception as e:
+        # Private yfinance attributes; if they move, fall back to the normal handshake
+        logger.debug(f"Could not restore Yahoo crumb: {str(e)}")
+        return False
+    _saved_crumb = state['crumb']
+    logger.info("Restored persisted Yahoo cookie and crumb")
+    return True
+
+def _pin_replay_crumb():
+    """Fixtures are keyed without the crumb, so replay skips the cookie/crumb handshake"""
+    data = _yf_data()
+    data._cookie = True
+    data._crumb = 'replay'
+
+def save_state():
+    """
+    Persist the current cookies and crumb if the crumb changed since the last save
+
+    Called after successful Yahoo fetches; the write is atomic so concurrent
+    workers never read a partial file.
+    """
+    global _saved_crumb
+    if _session is None or upstream_replay.upstream_mode() == 'replay':
+        return
+    try:
+        crumb = _yf_data()._crumb
+    except Exception:
+        return
+    if not crumb or crumb == _saved_crumb:
+        return
+
+    with _lock:
+        if crumb == _saved_crumb:
+            return
+        jar = getattr(_session.cookies, 'jar', _session.cookies)
+        state = {
+            'saved_at': time.time(),
+            'crumb': crumb,
+            'cookies': [
+                {
+                    'name': cookie.name,
+                    'value': cookie.value,
+                    'domain': cookie.domain,
+                    'path': cookie.path,
+                    'expires': cookie.expires
+                }
+                for cookie in jar
+                if 'yahoo' in (cookie.domain or '')
+            ]
+        }
+        try:
+            os.makedirs(YF_CACHE_DIR, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=YF_CACHE_DIR)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, _session_path())
+            _saved_crumb = crumb
+            logger.info("Persisted Yahoo cookie and crumb")
+        except OSError as e:
+            logger.warning(f"Could not persist Yahoo session: {str(e)}")
+
+def get_session():
+    """
+    The shared Yahoo session, created on first use
+
+    Also points yfinance's own timezone and cookie caches at YF_CACHE_DIR, since
+    its default location is not writable on Vercel.
+    """
+    global _session
+    if _session is not None:
+        return _session
+    with _lock:
+        if _session is None:
+            import yfinance as yf
+            try:
+                os.makedirs(YF_CACHE_DIR, exist_ok=True)
+                yf.set_tz_cache_location(YF_CACHE_DIR)
+            except OSError as e:
+                logger.warning(f"Could not use {YF_CACHE_DIR} for yfinance caches: {str(e)}")
+            _session = instrument_session(upstream_replay.install(_new_session()))
+            if upstream_replay.upstream_mode() == 'replay':
+                _pin_replay_crumb()
+            else:
+                _load_state(_session)
+    return _session